@@ -1,3 +1,28 @@
 from django.contrib import admin
+from .models import DiagnosisJob, ModelVersion
 
-# Register your models here.
+
+@admin.register(DiagnosisJob)
+class DiagnosisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'diagnosis_id', 'state', 'attempts', 'worker', 'created_at', 'finished_at']
+    list_filter = ['state']
+    search_fields = ['diagnosis__id']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(ModelVersion)
+class ModelVersionAdmin(admin.ModelAdmin):
+    list_display = ['version', 'is_active', 'path', 'input_shape', 'created_at', 'activated_at']
+    list_filter = ['is_active']
+    search_fields = ['version', 'path']
+    readonly_fields = ['is_active', 'created_at', 'activated_at']
+    actions = ['activate_version']
+
+    @admin.action(description='Activate selected version (workers swap on next poll)')
+    def activate_version(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one version to activate.', level='error')
+            return
+        version = queryset.get()
+        version.activate()
+        self.message_user(request, f'{version.version} is now the active model version.')
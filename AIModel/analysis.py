@@ -0,0 +1,140 @@
+"""
+AIModel/analysis.py
+Single-pass analysis of a segmentation mask.
+
+classify_severity, the XAI views and XAIVisualizer all need the same
+adaptive threshold, probability statistics, affected area, binary mask and
+lesion boxes for a prediction. MaskAnalysis computes each of them at most
+once and is shared by everything that handles that prediction.
+"""
+
+from functools import cached_property
+
+import numpy as np
+
+from .lesions import extract_lesions, label_components
+
+
+def adaptive_threshold(max_prob):
+    """
+    Scale threshold to the model's actual output range.
+
+    Fixed threshold of 0.5 causes ~66.67% affected area when the model
+    outputs values in a narrow band (e.g. 0.4–0.8).  Using 50% of the
+    peak value anchors the threshold to the model's real distribution and
+    produces accurate affected-area readings.
+    """
+    return max(0.5 * float(max_prob), 0.05)
+
+
+class MaskAnalysis:
+    """
+    Immutable statistics for one 2-D probability mask.
+
+    Scalar statistics are computed on construction; the binary mask,
+    connected-component labeling and boxes are computed on first access
+    and then reused.
+    """
+
+    def __init__(self, mask, _stats=None):
+        mask = np.asarray(mask, dtype=np.float32).view()
+        mask.flags.writeable = False
+        self._mask = mask
+        if _stats is None:
+            self._max = float(mask.max())
+            self._mean = float(mask.mean())
+        else:
+            self._max, self._mean, self.__dict__['affected_pixels'] = _stats
+        self._threshold = adaptive_threshold(self._max)
+        self._boxes = {}
+
+    @classmethod
+    def from_predictions(cls, predictions):
+        """Analysis of the first mask in a (N, H, W, 1) tensor, or None for classifier output."""
+        predictions = np.asarray(predictions)
+        if predictions.ndim != 4:
+            return None
+        return cls(predictions[0, :, :, 0])
+
+    @classmethod
+    def from_batch(cls, predictions):
+        """
+        Analyses for every mask in a (N, H, W, 1) or (N, H, W) tensor.
+
+        Max, mean, adaptive threshold and affected pixels for all N come from
+        reductions along the batch axis; each analysis starts with them
+        filled in and matches ``MaskAnalysis(mask)`` exactly.
+        """
+        masks = np.asarray(predictions, dtype=np.float32)
+        if masks.ndim == 4:
+            masks = masks[..., 0]
+        flat = masks.reshape(len(masks), -1)
+        if flat.shape[1] == 0:
+            return [cls(mask) for mask in masks]
+
+        maxes = flat.max(axis=1)
+        means = flat.mean(axis=1)
+        # Same float32 comparison as ``mask > threshold`` on a single mask.
+        thresholds = np.maximum(0.5 * maxes.astype(np.float64), 0.05).astype(np.float32)
+        affected = np.count_nonzero(flat > thresholds[:, None], axis=1)
+
+        return [
+            cls(mask, _stats=(float(mx), float(mean), int(pixels)))
+            for mask, mx, mean, pixels in zip(masks, maxes, means, affected)
+        ]
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @property
+    def shape(self):
+        return self._mask.shape
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def max_probability(self):
+        return self._max
+
+    @property
+    def mean_probability(self):
+        return self._mean
+
+    @cached_property
+    def binary_mask(self):
+        binary = self._mask > self._threshold
+        binary.flags.writeable = False
+        return binary
+
+    @cached_property
+    def affected_pixels(self):
+        return int(np.count_nonzero(self.binary_mask))
+
+    @property
+    def affected_percentage(self):
+        return (self.affected_pixels / self._mask.size) * 100
+
+    @property
+    def has_caries(self):
+        return self.affected_percentage > 1.0
+
+    @cached_property
+    def components(self):
+        """``(count, labels, stats, centroids)`` from 8-connected labeling of the binary mask."""
+        return label_components(self._mask, self._threshold)
+
+    def boxes(self, threshold=None, min_area=100, polygons=False):
+        """Lesion boxes at ``threshold`` (adaptive when None); cached per argument set."""
+        if threshold is None:
+            threshold = self._threshold
+        key = (float(threshold), min_area, polygons)
+        if key not in self._boxes:
+            components = self.components if float(threshold) == self._threshold else None
+            self._boxes[key] = extract_lesions(
+                self._mask, threshold=threshold, min_area=min_area,
+                polygons=polygons, components=components,
+            )
+        return self._boxes[key]
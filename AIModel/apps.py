@@ -1,4 +1,5 @@
 import os
+import sys
 from django.apps import AppConfig
 
 
@@ -7,6 +8,8 @@ class AimodelConfig(AppConfig):
     name = 'AIModel'
 
     def ready(self):
+        self._start_job_workers()
+        self._start_registry_watcher()
 
         preload_env = os.getenv('PRELOAD_AI_MODEL', 'false').lower()
         ci_env = os.getenv('CI', '').lower()
@@ -18,7 +21,39 @@ class AimodelConfig(AppConfig):
 
         try:
             from .model_loader import model_loader
-            model_loader.load_model()
-            print('AIModel: pretrained model loaded on startup')
+            model_loader.warm_up()
+            print('AIModel: pretrained model loaded and warmed up on startup')
         except Exception as e:
-            print('AIModel: error preloading model:', e)
\ No newline at end of file
+            print('AIModel: error preloading model:', e)
+
+    def _start_job_workers(self):
+        from django.conf import settings
+
+        workers = getattr(settings, 'AI_JOB_WORKERS', 0)
+        if not getattr(settings, 'AI_ASYNC_PIPELINE', False) or workers <= 0:
+            return
+
+        if not self._is_server():
+            return
+
+        from .jobs import JobWorkerPool
+        JobWorkerPool(workers=workers).start()
+        print(f'AIModel: started {workers} diagnosis job workers')
+
+    def _start_registry_watcher(self):
+        from django.conf import settings
+
+        if not getattr(settings, 'AI_MODEL_REGISTRY_ENABLED', False) or not self._is_server():
+            return
+
+        from .model_loader import model_loader
+        model_loader.start_registry_watcher()
+        print('AIModel: watching the model registry for new active versions')
+
+    @staticmethod
+    def _is_server():
+        cmd_args = sys.argv
+        return (
+            os.environ.get('RUN_MAIN') == 'true'
+            or any(c in arg for arg in cmd_args for c in ('gunicorn', 'uwsgi'))
+        )
@@ -0,0 +1,117 @@
+"""
+AIModel/artifacts.py
+Per-diagnosis store for intermediate pipeline artifacts.
+
+The staged endpoints (preprocess/ -> detect/ -> classify/) persist the
+preprocessed tensor and the raw prediction mask here so each later stage
+loads them instead of re-reading the X-ray and re-running the model.
+Arrays are saved as compressed ``.npz`` files under
+``MEDIA_ROOT/artifacts/<diagnosis_id>/`` together with the model version
+that produced them; artifacts from another model version are ignored.
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+PREPROCESSED = 'preprocessed'
+PREDICTIONS = 'predictions'
+GRADCAM = 'gradcam'
+UNCERTAINTY = 'uncertainty'
+
+
+class ArtifactStore:
+    @property
+    def root(self):
+        root = getattr(settings, 'AI_ARTIFACTS_DIR', None) or (
+            Path(settings.MEDIA_ROOT) / 'artifacts'
+        )
+        return Path(root)
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'AI_ARTIFACTS_ENABLED', True)
+
+    def _path(self, diagnosis_id, name):
+        return self.root / str(diagnosis_id) / f"{name}.npz"
+
+    def save(self, diagnosis_id, name, array, model_version, dtype=None):
+        if not self.enabled:
+            return
+        array = np.asarray(array)
+        if dtype is not None:
+            array = array.astype(dtype)
+
+        path = self._path(diagnosis_id, name)
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(tmp_path, data=array, model_version=np.array(model_version))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Artifact store: could not write {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    def load(self, diagnosis_id, name, model_version):
+        if not self.enabled:
+            return None
+        path = self._path(diagnosis_id, name)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['model_version']) != model_version:
+                    return None
+                return data['data'].astype(np.float32)
+        except Exception as e:
+            print(f"Artifact store: discarding unreadable artifact {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def save_preprocessed(self, diagnosis_id, preprocessed, model_version):
+        # Resized uint8 pixels are integers <= 255, so float16 is lossless here.
+        self.save(diagnosis_id, PREPROCESSED, preprocessed, model_version, dtype=np.float16)
+
+    def load_preprocessed(self, diagnosis_id, model_version):
+        return self.load(diagnosis_id, PREPROCESSED, model_version)
+
+    def save_predictions(self, diagnosis_id, predictions, model_version):
+        self.save(diagnosis_id, PREDICTIONS, predictions, model_version, dtype=np.float32)
+
+    def load_predictions(self, diagnosis_id, model_version):
+        return self.load(diagnosis_id, PREDICTIONS, model_version)
+
+    def save_gradcam(self, diagnosis_id, heatmap, model_version):
+        # Heatmaps are normalized to [0, 1]; float16 is plenty for an overlay.
+        self.save(diagnosis_id, GRADCAM, heatmap, model_version, dtype=np.float16)
+
+    def load_gradcam(self, diagnosis_id, model_version):
+        return self.load(diagnosis_id, GRADCAM, model_version)
+
+    def save_uncertainty(self, diagnosis_id, variance, model_version):
+        self.save(diagnosis_id, UNCERTAINTY, variance, model_version, dtype=np.float32)
+
+    def load_uncertainty(self, diagnosis_id, model_version):
+        return self.load(diagnosis_id, UNCERTAINTY, model_version)
+
+    def copy(self, source_id, target_id):
+        """Give ``target_id`` the artifacts of ``source_id`` (e.g. a re-uploaded duplicate scan)."""
+        if not self.enabled:
+            return
+        source = self.root / str(source_id)
+        if not source.is_dir():
+            return
+        try:
+            shutil.copytree(source, self.root / str(target_id), dirs_exist_ok=True)
+        except OSError as e:
+            print(f"Artifact store: could not copy artifacts of {source_id}: {e}")
+
+    def delete(self, diagnosis_id):
+        shutil.rmtree(self.root / str(diagnosis_id), ignore_errors=True)
+
+
+artifact_store = ArtifactStore()
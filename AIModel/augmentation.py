@@ -0,0 +1,108 @@
+"""
+AIModel/augmentation.py
+Test-time augmentation for segmentation models.
+
+``predict_tta`` builds K flipped and shifted variants of a preprocessed
+(1, H, W, C) input, runs them through the model as one (K, H, W, C)
+batch, maps every variant's mask back onto the original pixel grid and
+returns the per-pixel mean and variance across variants. The mean is a
+steadier prediction; the variance is an uncertainty map. Both the variant
+construction and the realignment are single fancy-index gathers, and one
+batched forward pass costs far less than K separate ones.
+"""
+
+import numpy as np
+
+# (horizontal flip, shift down, shift right) as fractions of the shift size.
+VARIANTS = (
+    (False, 0, 0),
+    (True, 0, 0),
+    (False, 1, 0),
+    (False, -1, 0),
+    (False, 0, 1),
+    (False, 0, -1),
+)
+
+
+def _source_indices(height, width, variants, shift):
+    """
+    ``(rows, cols)`` such that ``variant_k[y, x] = original[rows[k, y], cols[k, x]]``.
+
+    Indices outside the image are clipped, i.e. shifts pad with edge pixels.
+    """
+    flips = np.array([v[0] for v in variants])
+    dy = np.array([v[1] for v in variants]) * shift
+    dx = np.array([v[2] for v in variants]) * shift
+
+    ys = np.arange(height)[None, :] - dy[:, None]
+    xs = np.arange(width)[None, :]
+    xs = np.where(flips[:, None], width - 1 - xs, xs) - dx[:, None]
+    return np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)
+
+
+def _aligned_indices(height, width, variants, shift):
+    """
+    ``(rows, cols, valid)`` such that ``aligned_k[y, x] = mask_k[rows[k, y], cols[k, x]]``:
+    the inverse of ``_source_indices``. ``valid`` marks the pixels whose
+    variant value came from inside the image rather than edge padding.
+    """
+    flips = np.array([v[0] for v in variants])
+    dy = np.array([v[1] for v in variants]) * shift
+    dx = np.array([v[2] for v in variants]) * shift
+
+    ys = np.arange(height)[None, :] + dy[:, None]
+    shifted_xs = np.arange(width)[None, :] + dx[:, None]
+    xs = np.where(flips[:, None], width - 1 - shifted_xs, shifted_xs)
+
+    valid = ((ys >= 0) & (ys < height))[:, :, None] & ((shifted_xs >= 0) & (shifted_xs < width))[:, None, :]
+    return np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1), valid
+
+
+def build_variants(image, shift, variants=VARIANTS):
+    """(K, H, W, C) variants of a (1, H, W, C) or (H, W, C) image."""
+    image = np.asarray(image)
+    if image.ndim == 4:
+        image = image[0]
+    rows, cols = _source_indices(image.shape[0], image.shape[1], variants, shift)
+    return image[rows[:, :, None], cols[:, None, :]]
+
+
+def realign(masks, shift, variants=VARIANTS):
+    """
+    Per-pixel ``(mean, variance)`` of (K, h, w[, 1]) variant masks on the original grid.
+
+    ``shift`` is in mask pixels. Pixels a variant shifted in from outside
+    the image are left out of that pixel's statistics.
+    """
+    masks = np.asarray(masks, dtype=np.float32)
+    if masks.ndim == 4:
+        masks = masks[..., 0]
+    count, height, width = masks.shape
+    rows, cols, valid = _aligned_indices(height, width, variants, shift)
+
+    aligned = masks[np.arange(count)[:, None, None], rows[:, :, None], cols[:, None, :]]
+    weights = valid.astype(np.float32)
+    # The identity variant covers every pixel, so n >= 1 everywhere.
+    n = weights.sum(axis=0)
+    mean = (aligned * weights).sum(axis=0) / n
+    variance = (((aligned - mean) ** 2) * weights).sum(axis=0) / n
+    return mean, variance
+
+
+def predict_tta(preprocessed, predict, shift, variants=VARIANTS):
+    """
+    ``(mean, variance)`` for a (1, H, W, C) input, or ``(None, None)`` when
+    the model output is not a spatial mask.
+
+    ``predict`` maps a (K, H, W, C) batch to model output; ``shift`` is in
+    input pixels. Returns a (1, h, w, 1) mean mask and an (h, w) variance map.
+    """
+    batch = build_variants(preprocessed, shift, variants).astype(np.float32)
+    output = np.asarray(predict(batch))
+    if output.ndim != 4:
+        return None, None
+
+    # Shifts scale with the output resolution when the model downsamples.
+    mask_shift = int(round(shift * output.shape[1] / batch.shape[1]))
+    mean, variance = realign(output, mask_shift, variants)
+    return mean[None, :, :, None], variance
@@ -0,0 +1,316 @@
+"""
+AIModel/backends.py
+Pluggable inference backends used by ModelLoader.
+
+Every backend exposes ``load()``, ``input_shape`` and ``predict(batch)``
+so the rest of the pipeline (preprocessing, classify_severity, box
+extraction) does not care which runtime produced the mask. The backend is
+picked with ``settings.AI_INFERENCE_BACKEND``.
+
+TensorFlow is imported lazily: a worker serving through ONNX Runtime never
+pays for the TF import. onnxruntime and tflite-runtime are optional; see
+requirements-inference.txt.
+"""
+
+import importlib
+import importlib.util
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_tensorflow = None
+
+
+def import_tensorflow():
+    """Import TensorFlow on first use; returns None when it is not installed."""
+    global _tensorflow
+    if _tensorflow is None:
+        try:
+            _tensorflow = importlib.import_module('tensorflow')
+        except ImportError:
+            return None
+    return _tensorflow
+
+
+def build_serving_fn(model):
+    """
+    Trace ``model(x, training=False)`` once for the model's input shape.
+
+    Calling the returned concrete function skips the data adapter and
+    execution loop that ``Model.predict`` builds on every call. Batch
+    size stays dynamic so the micro-batcher can reuse the same graph.
+    """
+    input_shape = model.input_shape
+    if isinstance(input_shape, list) or any(d is None for d in input_shape[1:]):
+        print("Serving function skipped: model needs a single fixed-size input")
+        return None
+
+    tf = import_tensorflow()
+    spec = tf.TensorSpec(shape=(None, *input_shape[1:]), dtype=tf.float32)
+
+    @tf.function(input_signature=[spec])
+    def serve(x):
+        return model(x, training=False)
+
+    return serve.get_concrete_function()
+
+
+class InferenceBackend:
+    name = None
+
+    def load(self):
+        raise NotImplementedError
+
+    @property
+    def input_shape(self):
+        raise NotImplementedError
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """Float32 keras model, served through a traced tf.function when possible."""
+
+    name = 'keras'
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._serving_fn = None
+        self._traced = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        model = self.loader.load_model()
+        if not self._traced:
+            with self._lock:
+                if not self._traced:
+                    if getattr(settings, 'AI_SERVING_MODE', 'function') == 'function':
+                        self._serving_fn = build_serving_fn(model)
+                    self._traced = True
+        return model
+
+    @property
+    def serving_fn(self):
+        self.load()
+        return self._serving_fn
+
+    @property
+    def input_shape(self):
+        return self.load().input_shape
+
+    def predict(self, batch):
+        model = self.load()
+        if self._serving_fn is not None:
+            tf = import_tensorflow()
+            outputs = self._serving_fn(tf.convert_to_tensor(batch, dtype=tf.float32))
+            return tf.nest.map_structure(lambda t: t.numpy(), outputs)
+        return model.predict(batch, verbose=0)
+
+
+def _tflite_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    tf = import_tensorflow()
+    if tf is None:
+        raise ImportError(
+            "Neither tflite-runtime nor tensorflow is installed. Install one to use the TFLite backend "
+            "(see requirements-inference.txt)."
+        )
+    return tf.lite.Interpreter
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    TFLite copy of the model (dynamic-range, float16 or INT8), produced by
+    the ``convert_tflite`` management command.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = Path(model_path)
+        self.num_threads = num_threads
+        self._interpreter = None
+        self._input = None
+        self._output = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._interpreter is None:
+            with self._lock:
+                if self._interpreter is None:
+                    if not self.model_path.exists():
+                        raise FileNotFoundError(
+                            f"TFLite model not found at {self.model_path}. "
+                            "Run `python manage.py convert_tflite` first."
+                        )
+                    Interpreter = _tflite_interpreter_class()
+                    print(f"Loading TFLite model from {self.model_path}")
+                    interpreter = Interpreter(
+                        model_path=str(self.model_path), num_threads=self.num_threads
+                    )
+                    interpreter.allocate_tensors()
+                    self._input = interpreter.get_input_details()[0]
+                    self._output = interpreter.get_output_details()[0]
+                    self._interpreter = interpreter
+        return self._interpreter
+
+    @property
+    def input_shape(self):
+        self.load()
+        return (None, *[int(d) for d in self._input['shape'][1:]])
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            interpreter = self.load()
+            if int(self._input['shape'][0]) != len(batch):
+                interpreter.resize_tensor_input(self._input['index'], list(batch.shape))
+                interpreter.allocate_tensors()
+                self._input = interpreter.get_input_details()[0]
+                self._output = interpreter.get_output_details()[0]
+
+            interpreter.set_tensor(self._input['index'], self._quantize(batch, self._input))
+            interpreter.invoke()
+            output = interpreter.get_tensor(self._output['index'])
+            return self._dequantize(output, self._output)
+
+    @staticmethod
+    def _quantize(batch, details):
+        dtype = details['dtype']
+        if not np.issubdtype(dtype, np.integer):
+            return batch.astype(dtype)
+        scale, zero_point = details['quantization']
+        info = np.iinfo(dtype)
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    @staticmethod
+    def _dequantize(output, details):
+        if not np.issubdtype(output.dtype, np.integer):
+            return output.astype(np.float32)
+        scale, zero_point = details['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX export of the model (see ``export_onnx``) under ONNX Runtime on CPU.
+
+    Intra-/inter-op thread counts apply per process, so with several
+    gunicorn workers they should add up to roughly the host's core count.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        self.model_path = Path(model_path)
+        self.intra_op_threads = intra_op_threads or 0
+        self.inter_op_threads = inter_op_threads or 0
+        self._session = None
+        self._input_name = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    try:
+                        import onnxruntime as ort
+                    except ImportError:
+                        raise ImportError(
+                            "onnxruntime is not installed. Install it from requirements-inference.txt "
+                            "to use the ONNX backend."
+                        )
+                    if not self.model_path.exists():
+                        raise FileNotFoundError(
+                            f"ONNX model not found at {self.model_path}. "
+                            "Run `python manage.py export_onnx` first."
+                        )
+
+                    options = ort.SessionOptions()
+                    options.intra_op_num_threads = self.intra_op_threads
+                    options.inter_op_num_threads = self.inter_op_threads
+                    options.execution_mode = (
+                        ort.ExecutionMode.ORT_PARALLEL if self.inter_op_threads > 1
+                        else ort.ExecutionMode.ORT_SEQUENTIAL
+                    )
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+                    print(f"Loading ONNX model from {self.model_path} "
+                          f"(intra_op={self.intra_op_threads}, inter_op={self.inter_op_threads})")
+                    session = ort.InferenceSession(
+                        str(self.model_path),
+                        sess_options=options,
+                        providers=['CPUExecutionProvider'],
+                    )
+                    self._input_name = session.get_inputs()[0].name
+                    self._session = session
+        return self._session
+
+    @property
+    def input_shape(self):
+        dims = self.load().get_inputs()[0].shape[1:]
+        return (None, *[d if isinstance(d, int) else None for d in dims])
+
+    def predict(self, batch):
+        session = self.load()
+        batch = np.asarray(batch, dtype=np.float32)
+        return session.run(None, {self._input_name: batch})[0]
+
+
+def default_tflite_path(loader):
+    path = getattr(settings, 'AI_TFLITE_MODEL_PATH', '')
+    return Path(path) if path else loader.model_path.with_suffix('.tflite')
+
+
+def default_onnx_path(loader):
+    path = getattr(settings, 'AI_ONNX_MODEL_PATH', '')
+    return Path(path) if path else loader.model_path.with_suffix('.onnx')
+
+
+# Backend name -> (modules that provide its runtime, any one is enough; package to install; file pinning it).
+BACKEND_REQUIREMENTS = {
+    'keras': (('tensorflow',), 'tensorflow-cpu', 'requirements.txt'),
+    'tflite': (('tflite_runtime', 'tensorflow'), 'tflite-runtime (or tensorflow-cpu)', 'requirements-inference.txt'),
+    'onnx': (('onnxruntime',), 'onnxruntime', 'requirements-inference.txt'),
+}
+
+
+def check_backend_requirements(name):
+    """Raise ImproperlyConfigured naming the package to install when ``name``'s runtime is missing."""
+    if name not in BACKEND_REQUIREMENTS:
+        return
+    modules, package, requirements = BACKEND_REQUIREMENTS[name]
+    if not any(importlib.util.find_spec(m) is not None for m in modules):
+        raise ImproperlyConfigured(
+            f"AI_INFERENCE_BACKEND={name!r} needs the {package} package, which is not installed "
+            f"(it is pinned in {requirements})."
+        )
+
+
+def create_backend(name, loader):
+    check_backend_requirements(name)
+    if name == KerasBackend.name:
+        return KerasBackend(loader)
+    if name == TFLiteBackend.name:
+        return TFLiteBackend(
+            default_tflite_path(loader),
+            num_threads=getattr(settings, 'AI_TFLITE_NUM_THREADS', None),
+        )
+    if name == OnnxBackend.name:
+        return OnnxBackend(
+            default_onnx_path(loader),
+            intra_op_threads=getattr(settings, 'AI_ONNX_INTRA_OP_THREADS', 0),
+            inter_op_threads=getattr(settings, 'AI_ONNX_INTER_OP_THREADS', 0),
+        )
+    raise ImproperlyConfigured(
+        f"Unknown AI_INFERENCE_BACKEND {name!r}; expected 'keras', 'tflite' or 'onnx'."
+    )
@@ -0,0 +1,106 @@
+"""
+AIModel/batching.py
+Dynamic micro-batching for model forward passes.
+
+Request threads submit their (1, H, W, C) inputs; a single scheduler thread
+gathers whatever arrives within ``max_wait_ms`` (or until ``max_batch_size``
+images are queued), runs one batched forward pass and hands every caller
+back its own slice of the output. Inputs submitted with different keys
+(e.g. model versions during a hot swap) are never batched together.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised when the scheduler queue stays full for longer than the submit timeout."""
+
+
+class MicroBatcher:
+    def __init__(self, forward, max_batch_size=8, max_wait_ms=5,
+                 max_queue_size=64, submit_timeout=30.0):
+        self.forward = forward
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self.submit_timeout = submit_timeout
+        self.pid = os.getpid()
+
+        self._queue = queue.Queue(maxsize=max(int(max_queue_size), 1))
+        self._carry = None
+        self._thread = threading.Thread(
+            target=self._run, name='ai-micro-batcher', daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, batch, key=None):
+        """
+        Queue ``batch`` for the next forward pass and block until its output is ready.
+
+        ``key`` is passed through to ``forward(combined, key)``.
+        """
+        batch = np.asarray(batch)
+        future = Future()
+        try:
+            self._queue.put((batch, future, key), timeout=self.submit_timeout)
+        except queue.Full:
+            raise InferenceQueueFull(
+                f"Inference queue is full ({self._queue.maxsize} pending requests)"
+            )
+        return future.result()
+
+    def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_item()
+        items = [first]
+        size = len(first[0])
+        sample_shape = first[0].shape[1:]
+        key = first[2]
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._next_item(timeout=remaining)
+            except queue.Empty:
+                break
+            if (item[0].shape[1:] != sample_shape or item[2] is not key
+                    or size + len(item[0]) > self.max_batch_size):
+                self._carry = item
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            items = [item for item in items if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+
+            try:
+                inputs = [batch for batch, _, _ in items]
+                combined = inputs[0] if len(inputs) == 1 else np.concatenate(inputs, axis=0)
+                outputs = np.asarray(self.forward(combined, items[0][2]))
+            except BaseException as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for batch, future, _ in items:
+                future.set_result(outputs[offset:offset + len(batch)])
+                offset += len(batch)
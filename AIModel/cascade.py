@@ -0,0 +1,134 @@
+"""
+AIModel/cascade.py
+Two-stage inference: a cheap model screens out confidently healthy scans.
+
+With AI_CASCADE_ENABLED, ModelLoader.infer first runs the auxiliary model
+at AI_CASCADE_MODEL_PATH (typically a small network with a reduced input
+size). When its result is Healthy with at least
+AI_CASCADE_HEALTHY_CONFIDENCE percent confidence, and for masks a peak
+probability below AI_CASCADE_MAX_PROBABILITY, inference stops there;
+otherwise the full model runs as usual.
+
+A sampled AI_CASCADE_SHADOW_RATE of early exits also runs the full model
+in the background and records whether it disagreed, so the thresholds can
+be tuned against the real false-negative rate. ``cascade_metrics`` holds
+this process's counters; the metrics/ endpoint reports them.
+"""
+
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_SHADOWS = 4
+
+
+def is_confidently_healthy(severity_result, min_confidence, max_probability):
+    """True when a stage-one result is Healthy with enough margin to skip the full model."""
+    if severity_result.get('severity') != 'Healthy':
+        return False
+    if float(severity_result.get('confidence', 0)) < min_confidence:
+        return False
+    # Segmentation output: also require that no pixel comes close to a lesion.
+    if severity_result.get('analysis') is not None:
+        return float(severity_result.get('max_probability', 1)) < max_probability
+    return True
+
+
+class CascadeMetrics:
+    """Thread-safe per-process counters for the cascade."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.scans = 0
+            self.early_exits = 0
+            self.full_runs = 0
+            self.stage1_seconds = 0.0
+            self.full_seconds = 0.0
+            self.shadow_runs = 0
+            self.shadow_disagreements = 0
+            self.shadow_skipped = 0
+
+    def record_stage1(self, seconds, early_exit):
+        with self._lock:
+            self.scans += 1
+            self.stage1_seconds += seconds
+            if early_exit:
+                self.early_exits += 1
+
+    def record_full(self, seconds):
+        with self._lock:
+            self.full_runs += 1
+            self.full_seconds += seconds
+
+    def record_shadow(self, disagreed):
+        with self._lock:
+            self.shadow_runs += 1
+            if disagreed:
+                self.shadow_disagreements += 1
+
+    def record_shadow_skipped(self):
+        with self._lock:
+            self.shadow_skipped += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'scans': self.scans,
+                'early_exits': self.early_exits,
+                'early_exit_rate': self.early_exits / self.scans if self.scans else None,
+                'full_runs': self.full_runs,
+                'avg_stage1_ms': self.stage1_seconds / self.scans * 1000 if self.scans else None,
+                'avg_full_ms': self.full_seconds / self.full_runs * 1000 if self.full_runs else None,
+                'shadow_runs': self.shadow_runs,
+                'shadow_disagreements': self.shadow_disagreements,
+                'shadow_disagreement_rate': (
+                    self.shadow_disagreements / self.shadow_runs if self.shadow_runs else None
+                ),
+                'shadow_skipped': self.shadow_skipped,
+            }
+
+
+cascade_metrics = CascadeMetrics()
+
+_shadow_executor = None
+_shadow_pid = None
+_shadow_slots = threading.BoundedSemaphore(MAX_PENDING_SHADOWS)
+_shadow_lock = threading.Lock()
+
+
+def should_shadow(rate):
+    return rate > 0 and random.random() < rate
+
+
+def run_shadow(check):
+    """
+    Run ``check()`` (returns True when the full model disagreed) on a
+    background thread and record the outcome. Dropped, and counted as
+    skipped, while MAX_PENDING_SHADOWS checks are already pending.
+    """
+    global _shadow_executor, _shadow_pid
+    if not _shadow_slots.acquire(blocking=False):
+        cascade_metrics.record_shadow_skipped()
+        return
+    with _shadow_lock:
+        if _shadow_executor is None or _shadow_pid != os.getpid():
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascade-shadow')
+            _shadow_pid = os.getpid()
+
+    def job():
+        try:
+            cascade_metrics.record_shadow(bool(check()))
+        except Exception as e:
+            logger.warning("Cascade shadow check failed: %s", e)
+        finally:
+            _shadow_slots.release()
+
+    _shadow_executor.submit(job)
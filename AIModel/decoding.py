@@ -0,0 +1,117 @@
+"""
+AIModel/decoding.py
+Image decoding sized to what the caller needs.
+
+Inference only ever sees the image at the model's input size, so
+``decode_for_inference`` asks libjpeg for a 1/2, 1/4 or 1/8 scale decode
+(``cv2.IMREAD_REDUCED_*``) whenever the reduced image is still at least as
+large as the model input, and can decode X-rays as a single grayscale
+channel. ``decode_full`` keeps the full-resolution RGB decode for the
+overlays that are drawn on the original image.
+"""
+
+import io
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def _require_cv2():
+    if cv2 is None:
+        raise ImportError("OpenCV (cv2) is required to decode images.")
+
+
+def _reduced_flags():
+    if cv2 is None:
+        return {}
+    return {
+        (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+        (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+        (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+        (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }
+
+
+REDUCED_FLAGS = _reduced_flags()
+
+
+def image_header(content):
+    """``(width, height, format)`` from the image header, or None if PIL cannot tell."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            return img.width, img.height, img.format
+    except Exception:
+        return None
+
+
+def reduction_factor(width, height, target_size):
+    """Largest of 8, 4, 2 that keeps both sides at or above the model input size (else 1)."""
+    target = max(target_size)
+    for factor in (8, 4, 2):
+        if min(width, height) // factor >= target:
+            return factor
+    return 1
+
+
+def decode_flag(content, target_size=None, grayscale=False, fast=None):
+    """
+    The ``cv2.imdecode`` flag to use for ``content`` at ``target_size``.
+
+    ``fast`` enables reduced-scale decoding and defaults to AI_FAST_DECODE.
+    """
+    if fast is None:
+        fast = getattr(settings, 'AI_FAST_DECODE', True)
+    base = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    if target_size is None or not fast:
+        return base
+
+    header = image_header(content)
+    # Only JPEG has DCT-domain downscaling; other formats would be decoded
+    # in full and then resized by OpenCV, which saves nothing.
+    if header is None or header[2] != 'JPEG':
+        return base
+    factor = reduction_factor(header[0], header[1], target_size)
+    return REDUCED_FLAGS.get((factor, grayscale), base)
+
+
+def _decode(content, flag):
+    img = cv2.imdecode(np.frombuffer(content, np.uint8), flag)
+    if img is None:
+        return None
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return img
+
+
+def decode_for_inference(content, target_size=None, grayscale=None, fast=None):
+    """
+    Decode ``content`` for the model: RGB, or 2-D grayscale when ``grayscale``.
+
+    ``target_size`` is the model's input ``(height, width)``; without it the
+    image is decoded at full resolution. ``grayscale`` defaults to
+    AI_DECODE_GRAYSCALE. Returns None when the bytes cannot be decoded.
+    """
+    _require_cv2()
+    if grayscale is None:
+        grayscale = getattr(settings, 'AI_DECODE_GRAYSCALE', False)
+    return _decode(content, decode_flag(content, target_size, grayscale, fast))
+
+
+def decode_full(content):
+    """Full-resolution RGB decode, for overlays drawn on the original image."""
+    _require_cv2()
+    return _decode(content, cv2.IMREAD_COLOR)
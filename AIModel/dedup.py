@@ -0,0 +1,109 @@
+"""
+AIModel/dedup.py
+Detection of X-rays re-uploaded for the same patient.
+
+upload_image stores two hashes on every DiagnosisResult: the SHA-256 of
+the uploaded bytes and a 64-bit DCT perceptual hash of the decoded image.
+An upload whose bytes match an earlier scan of the same patient reuses
+that scan's stored object and, when it was completed by the current
+model, its prediction, without running inference again. An upload within
+AI_DEDUP_MAX_DISTANCE bits of an earlier scan's perceptual hash (the same
+radiograph re-exported, re-compressed or resized) is linked to it through
+``duplicate_of`` so the client can offer the earlier result.
+"""
+
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from .artifacts import artifact_store
+from .decoding import decode_for_inference
+from .models import DiagnosisResult
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Fields copied from an exact duplicate's completed diagnosis.
+REUSED_FIELDS = (
+    'has_caries', 'severity', 'confidence_score', 'lesion_boxes', 'teeth_position',
+    'teeth_position_confidence', 'model_version', 'quality_metrics',
+)
+
+
+def content_sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def perceptual_hash(content):
+    """
+    16-hex-digit DCT hash of the image, or '' when it cannot be decoded.
+
+    The low-frequency 8x8 block of the 32x32 grayscale DCT is thresholded
+    at its median, so the hash survives re-encoding, rescaling and small
+    brightness changes.
+    """
+    if cv2 is None:
+        return ''
+    # A 1/8-scale JPEG decode is plenty for a 32x32 thumbnail.
+    image = decode_for_inference(content, target_size=(32, 32), grayscale=True, fast=True)
+    if image is None:
+        return ''
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    block = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only encodes mean brightness.
+    bits = block > np.median(block[1:])
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def hamming_distances(phash, candidates):
+    """Bit distances between ``phash`` and each hex hash in ``candidates``."""
+    values = np.array([int(h, 16) for h in candidates], dtype=np.uint64)
+    diff = np.bitwise_xor(values, np.uint64(int(phash, 16)))
+    return np.unpackbits(diff.view(np.uint8)).reshape(len(values), 64).sum(axis=1)
+
+
+def find_exact_duplicate(patient, sha256, model_version):
+    """
+    The patient's earlier scan with the same bytes, preferring one that
+    ``model_version`` completed (its prediction can be reused as is).
+    """
+    matches = DiagnosisResult.objects.filter(patient=patient, content_sha256=sha256)
+    return (
+        matches.filter(status='completed', model_version=model_version).first()
+        or matches.first()
+    )
+
+
+def find_near_duplicate(patient, phash):
+    """``(diagnosis, distance)`` of the patient's closest earlier scan within AI_DEDUP_MAX_DISTANCE, else ``(None, None)``."""
+    if not phash:
+        return None, None
+    limit = getattr(settings, 'AI_DEDUP_CANDIDATES', 500)
+    candidates = list(
+        DiagnosisResult.objects
+        .filter(patient=patient)
+        .exclude(phash='')
+        .values_list('id', 'phash')[:limit]
+    )
+    if not candidates:
+        return None, None
+
+    distances = hamming_distances(phash, [h for _, h in candidates])
+    best = int(np.argmin(distances))
+    if distances[best] > getattr(settings, 'AI_DEDUP_MAX_DISTANCE', 8):
+        return None, None
+    return DiagnosisResult.objects.get(id=candidates[best][0]), int(distances[best])
+
+
+def reuse_result(diagnosis, original):
+    """Copy ``original``'s completed prediction onto ``diagnosis`` and mark it completed."""
+    for field in REUSED_FIELDS:
+        setattr(diagnosis, field, getattr(original, field))
+    diagnosis.error_message = None
+    diagnosis.status = 'completed'
+    diagnosis.save()
+    artifact_store.copy(original.id, diagnosis.id)
+    return diagnosis
@@ -0,0 +1,172 @@
+"""
+AIModel/downloader.py
+Crash-safe model download.
+
+The file is streamed in chunks to ``<name>.part`` (resuming with a Range
+request when a previous attempt was interrupted), verified against the
+expected SHA-256 and renamed into place atomically, so a half-written file
+can never pass for the model. An inter-process lock on ``<name>.lock``
+makes exactly one gunicorn worker download while the others wait and then
+reuse its result.
+"""
+
+import hashlib
+import os
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ModelDownloadError(Exception):
+    pass
+
+
+@contextmanager
+def _file_lock(lock_path):
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl is None:
+            print(f"fcntl unavailable; downloading {lock_path} without an inter-process lock")
+            yield
+            return
+        start = time.monotonic()
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        waited = time.monotonic() - start
+        if waited > 1:
+            print(f"Waited {waited:.1f}s for download lock {lock_path}")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def sha256_of(path):
+    """Hex SHA-256 of the file at ``path``, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _marker_path(dest):
+    return dest.with_name(f"{dest.name}.sha256")
+
+
+def _marker_value(dest, sha256):
+    stat = dest.stat()
+    return f"{sha256} {stat.st_size} {stat.st_mtime_ns}"
+
+
+def is_installed(dest, sha256=None):
+    """
+    True when ``dest`` exists and, if ``sha256`` is given, matches it.
+
+    A verified file gets a ``.sha256`` marker holding its size and mtime so
+    later boots skip re-hashing it.
+    """
+    dest = Path(dest)
+    if not dest.exists():
+        return False
+    if not sha256:
+        return True
+
+    sha256 = sha256.lower()
+    marker = _marker_path(dest)
+    if marker.exists() and marker.read_text().strip() == _marker_value(dest, sha256):
+        return True
+
+    if sha256_of(dest) != sha256:
+        print(f"Checksum mismatch for {dest}; it will be downloaded again")
+        return False
+    marker.write_text(_marker_value(dest, sha256))
+    return True
+
+
+def _stream_to_part(url, part_path, timeout):
+    """Append the rest of ``url`` to ``part_path``; returns the number of bytes fetched."""
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header('Range', f'bytes={offset}-')
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # Range not satisfiable: the part file already holds the whole object.
+            return 0
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            print(f"Server ignored Range request; restarting download of {url}")
+            offset = 0
+        mode = 'ab' if offset else 'wb'
+        fetched = 0
+        with open(part_path, mode) as out:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+                fetched += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    return fetched
+
+
+def download_model(url, dest, sha256=None, retries=3, timeout=60):
+    """Download ``url`` to ``dest`` unless another process already installed it."""
+    dest = Path(dest)
+    part_path = dest.with_name(f"{dest.name}.part")
+    lock_path = dest.with_name(f"{dest.name}.lock")
+
+    with _file_lock(lock_path):
+        if is_installed(dest, sha256):
+            print(f"Model already installed at {dest}")
+            return dest
+
+        start = time.monotonic()
+        fetched = 0
+        last_error = None
+        for attempt in range(1, retries + 1):
+            try:
+                fetched += _stream_to_part(url, part_path, timeout)
+                last_error = None
+                break
+            except (urllib.error.URLError, OSError) as e:
+                last_error = e
+                print(f"Model download attempt {attempt}/{retries} failed: {e}")
+                if attempt < retries:
+                    time.sleep(min(2 ** attempt, 30))
+        if last_error is not None:
+            raise ModelDownloadError(f"Could not download model from {url}: {last_error}")
+
+        if sha256:
+            actual = sha256_of(part_path)
+            if actual != sha256.lower():
+                part_path.unlink(missing_ok=True)
+                raise ModelDownloadError(
+                    f"Checksum mismatch for downloaded model: expected {sha256}, got {actual}"
+                )
+
+        os.replace(part_path, dest)
+        if sha256:
+            _marker_path(dest).write_text(_marker_value(dest, sha256.lower()))
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        print(
+            f"Downloaded model to {dest}: {fetched / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({fetched / 1e6 / elapsed:.1f} MB/s)"
+        )
+        return dest
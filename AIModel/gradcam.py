@@ -0,0 +1,116 @@
+"""
+AIModel/gradcam.py
+Compiled, cached Grad-CAM.
+
+``GradCamEngine`` builds the (conv layer, output) sub-model once and traces
+the forward pass, gradient and heatmap reduction as one ``tf.function``
+with a dynamic batch dimension. ``get_gradcam_engine`` keeps engines per
+(model version, layer), so an explain request only pays for the compiled
+pass and ``precompute_gradcam`` can run a backlog through it in batches.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .backends import import_tensorflow
+
+MAX_ENGINES = 4
+
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def find_last_conv_layer(model):
+    for layer in reversed(model.layers):
+        if 'conv' in layer.name.lower():
+            return layer.name
+    return model.layers[-2].name
+
+
+def _as_2d(heatmap):
+    """Give scalar and 1-D heatmaps (non-spatial layers) a square shape for overlays."""
+    if heatmap.ndim == 0:
+        return np.ones((8, 8), dtype=np.float32) * float(heatmap)
+    if heatmap.ndim == 1:
+        size = max(int(np.sqrt(len(heatmap))), 1)
+        return heatmap[:size * size].reshape(size, size)
+    return heatmap
+
+
+class GradCamEngine:
+    """
+    Grad-CAM heatmaps for a batch of preprocessed images.
+
+    Each image's target is its own mean mask probability (segmentation) or
+    top class score (classification), so a batch gives the same heatmaps as
+    running the images one at a time.
+    """
+
+    def __init__(self, model, layer_name=None):
+        tf = import_tensorflow()
+        if tf is None:
+            raise ImportError('TensorFlow is required for Grad-CAM')
+
+        self.layer_name = layer_name or find_last_conv_layer(model)
+        grad_model = tf.keras.models.Model(
+            inputs=[model.inputs],
+            outputs=[model.get_layer(self.layer_name).output, model.output]
+        )
+
+        input_shape = model.input_shape
+        spec = tf.TensorSpec(shape=(None, *input_shape[1:]), dtype=tf.float32)
+
+        @tf.function(input_signature=[spec])
+        def heatmaps(images):
+            with tf.GradientTape() as tape:
+                conv_outputs, predictions = grad_model(images, training=False)
+                if predictions.shape.rank == 2:
+                    per_image = tf.reduce_max(predictions, axis=1)
+                else:
+                    per_image = tf.reduce_mean(predictions, axis=list(range(1, predictions.shape.rank)))
+                loss = tf.reduce_sum(per_image)
+
+            grads = tape.gradient(loss, conv_outputs)
+            spatial_axes = list(range(1, conv_outputs.shape.rank - 1))
+            pooled = tf.reduce_mean(grads, axis=spatial_axes) if spatial_axes else grads
+
+            for _ in spatial_axes:
+                pooled = tf.expand_dims(pooled, axis=1)
+            cams = tf.maximum(tf.reduce_sum(conv_outputs * pooled, axis=-1), 0)
+
+            cam_axes = list(range(1, cams.shape.rank))
+            if cam_axes:
+                peaks = tf.reduce_max(cams, axis=cam_axes, keepdims=True)
+            else:
+                peaks = cams
+            return tf.math.divide_no_nan(cams, peaks)
+
+        self._heatmaps = heatmaps
+
+    def compute(self, images):
+        """Heatmaps for an (N, H, W, C) batch, one 2-D array per image in [0, 1]."""
+        images = np.asarray(images, dtype=np.float32)
+        heatmaps = self._heatmaps(images).numpy()
+        return [_as_2d(h) for h in heatmaps]
+
+
+def get_gradcam_engine(model, model_version, layer_name=None):
+    """
+    The engine for ``model`` at ``layer_name`` (last conv layer when None).
+
+    Engines are kept for the MAX_ENGINES most recently used
+    (model version, layer) pairs, so a hot-swapped model's engine is
+    released once it falls out of use.
+    """
+    key = (model_version, layer_name)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = GradCamEngine(model, layer_name)
+            _engines[key] = engine
+            while len(_engines) > MAX_ENGINES:
+                _engines.popitem(last=False)
+        _engines.move_to_end(key)
+    return engine
@@ -0,0 +1,154 @@
+"""
+AIModel/image_cache.py
+Size-bounded disk cache for remote scan images.
+
+Uploads usually only set ``DiagnosisResult.image_url``, so every XAI call
+used to download the X-ray again. ``remote_image_cache.fetch(url)`` keeps
+the bytes under ``MEDIA_ROOT/image_cache/`` with the response's ETag and
+Last-Modified, serves them without a request while they are fresh,
+revalidates with a conditional GET afterwards, and evicts the least
+recently used files once the cache grows past AI_IMAGE_CACHE_MAX_MB. A
+per-URL file lock makes concurrent fetches of the same URL (threads or
+gunicorn workers) wait for a single download.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .downloader import _file_lock
+from .storage import StorageError, get_storage
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteImageCache:
+    @property
+    def root(self):
+        root = getattr(settings, 'AI_IMAGE_CACHE_DIR', None) or (
+            Path(settings.MEDIA_ROOT) / 'image_cache'
+        )
+        return Path(root)
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'AI_IMAGE_CACHE_ENABLED', True)
+
+    @property
+    def max_bytes(self):
+        return int(getattr(settings, 'AI_IMAGE_CACHE_MAX_MB', 500) * 1024 * 1024)
+
+    @property
+    def revalidate_after(self):
+        return getattr(settings, 'AI_IMAGE_CACHE_REVALIDATE_SECONDS', 3600)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        directory = self.root / key[:2]
+        # Locks are striped by key prefix so lock files never need cleaning up.
+        lock_path = self.root / 'locks' / f"{key[:2]}.lock"
+        return directory / f"{key}.bin", directory / f"{key}.json", lock_path
+
+    def fetch(self, url, timeout=30):
+        """The bytes at ``url``, from the cache when possible."""
+        if not self.enabled:
+            return get_storage().fetch(url, timeout=timeout)[1]
+
+        data_path, meta_path, lock_path = self._paths(url)
+        with _file_lock(lock_path):
+            meta, content = self._read(data_path, meta_path)
+            if content is not None and time.time() - meta['validated_at'] < self.revalidate_after:
+                os.utime(data_path)
+                return content
+
+            headers = {}
+            if content is not None:
+                if meta.get('etag'):
+                    headers['If-None-Match'] = meta['etag']
+                if meta.get('last_modified'):
+                    headers['If-Modified-Since'] = meta['last_modified']
+
+            try:
+                status, body, response_headers = get_storage().fetch(url, headers, timeout)
+            except StorageError as e:
+                if content is None:
+                    raise
+                logger.warning("Could not revalidate %s (%s); serving the cached copy", url, e)
+                return content
+
+            if status == 304 and content is not None:
+                meta['validated_at'] = time.time()
+                self._write_meta(meta_path, meta)
+                os.utime(data_path)
+                return content
+
+            self._store(data_path, meta_path, url, body, response_headers)
+
+        self._evict()
+        return body
+
+    @staticmethod
+    def _read(data_path, meta_path):
+        try:
+            meta = json.loads(meta_path.read_text())
+            return meta, data_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp_path = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, meta_path)
+
+    def _store(self, data_path, meta_path, url, body, response_headers):
+        tmp_path = data_path.with_name(f"{data_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(body)
+            os.replace(tmp_path, data_path)
+            self._write_meta(meta_path, {
+                'url': url,
+                'etag': response_headers.get('ETag'),
+                'last_modified': response_headers.get('Last-Modified'),
+                'size': len(body),
+                'validated_at': time.time(),
+            })
+        except OSError as e:
+            logger.warning("Image cache: could not write %s: %s", data_path, e)
+            tmp_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for path in self.root.glob('*/*.bin'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            path.with_suffix('.json').unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        for path in self.root.glob('*/*.bin'):
+            path.unlink(missing_ok=True)
+            path.with_suffix('.json').unlink(missing_ok=True)
+
+
+remote_image_cache = RemoteImageCache()
@@ -0,0 +1,182 @@
+"""
+AIModel/image_writer.py
+Encode-once writer for the images the XAI views publish.
+
+Each overlay, Grad-CAM and explanation report is encoded exactly once, in
+the configured format (PNG, WebP or JPEG) and compression level, and the
+same bytes are then handed to every sink: the local media directory,
+object storage, and optionally the HTTP response body. Before this the
+views encoded each image separately for disk and for storage (and the
+explanation report rendered its matplotlib figure twice).
+"""
+
+import io
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+from .storage import StorageError, get_storage
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, content type, default level)
+FORMATS = {
+    'png': ('.png', 'image/png', 3),
+    'webp': ('.webp', 'image/webp', 90),
+    'jpeg': ('.jpg', 'image/jpeg', 90),
+}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+SINKS = ('local', 'storage')
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    format: str
+
+    @property
+    def extension(self):
+        return FORMATS[self.format][0]
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format][1]
+
+
+def resolve_format(name=None):
+    """Canonical format for ``name`` (AI_XAI_IMAGE_FORMAT when empty); ValueError if unknown."""
+    name = (name or getattr(settings, 'AI_XAI_IMAGE_FORMAT', 'png')).lower()
+    name = FORMAT_ALIASES.get(name, name)
+    if name not in FORMATS:
+        raise ValueError(f"Unsupported image format {name!r}; use one of {', '.join(FORMATS)}")
+    return name
+
+
+def resolve_level(fmt, level=None):
+    """
+    Compression setting for ``fmt``: PNG compression 0-9, or WebP/JPEG
+    quality 1-100. Defaults to AI_XAI_IMAGE_LEVEL, then the format default.
+    """
+    if level is None:
+        level = getattr(settings, 'AI_XAI_IMAGE_LEVEL', None)
+    if level is None or level == '':
+        return FORMATS[fmt][2]
+    level = int(level)
+    low, high = (0, 9) if fmt == 'png' else (1, 100)
+    if not low <= level <= high:
+        raise ValueError(f"{fmt} level must be between {low} and {high}")
+    return level
+
+
+def encode_image(image, fmt=None, level=None):
+    """Encode an RGB (or 2-D grayscale) uint8 array."""
+    if cv2 is None:
+        raise ImportError('OpenCV (cv2) is required to encode images')
+    fmt = resolve_format(fmt)
+    level = resolve_level(fmt, level)
+    params = {
+        'png': [cv2.IMWRITE_PNG_COMPRESSION, level],
+        'webp': [cv2.IMWRITE_WEBP_QUALITY, level],
+        'jpeg': [cv2.IMWRITE_JPEG_QUALITY, level],
+    }[fmt]
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode(FORMATS[fmt][0], image, params)
+    if not ok:
+        raise RuntimeError(f'Failed to encode image as {fmt}')
+    return EncodedImage(buf.tobytes(), fmt)
+
+
+def encode_figure(fig, fmt=None, level=None, dpi=150):
+    """Encode a matplotlib figure with a single ``savefig``."""
+    fmt = resolve_format(fmt)
+    level = resolve_level(fmt, level)
+    pil_kwargs = {'compress_level': level} if fmt == 'png' else {'quality': level}
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight',
+                facecolor=fig.get_facecolor(), pil_kwargs=pil_kwargs)
+    return EncodedImage(buf.getvalue(), fmt)
+
+
+class LocalSink:
+    """Writes into ``directory``; URLs are served from ``MEDIA_URL/dental_images/``."""
+
+    name = 'local'
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def write(self, key, filename, encoded):
+        path = self.directory / filename
+        tmp_path = path.with_name(f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(encoded.data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write %s: %s", path, e)
+            tmp_path.unlink(missing_ok=True)
+            return None
+        return f"{settings.MEDIA_URL}dental_images/{filename}"
+
+
+class StorageSink:
+    """Uploads to the configured object storage under ``xai/<key>/``."""
+
+    name = 'storage'
+
+    def write(self, key, filename, encoded):
+        storage = get_storage()
+        storage_path = f"xai/{key}/{filename}"
+        try:
+            storage.put(storage_path, encoded.data, content_type=encoded.content_type, upsert=True)
+        except StorageError as e:
+            logger.warning("XAI storage upload error (%s): %s", storage_path, e)
+            return None
+        return storage.get_public_url(storage_path)
+
+
+def configured_sinks(output_dir, names=None):
+    """Sinks named in ``names`` (default AI_XAI_IMAGE_SINKS) in publishing order."""
+    if names is None:
+        names = getattr(settings, 'AI_XAI_IMAGE_SINKS', 'local,storage')
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(',') if n.strip()]
+    sinks = []
+    for name in names:
+        if name == 'local':
+            sinks.append(LocalSink(output_dir))
+        elif name == 'storage':
+            sinks.append(StorageSink())
+        else:
+            raise ValueError(f"Unknown XAI image sink {name!r}; use any of {', '.join(SINKS)}")
+    return sinks
+
+
+class ImageArtifactWriter:
+    """Publishes one encoded image to a list of sinks."""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def publish(self, key, basename, encoded):
+        """
+        Hand ``encoded`` to every sink as ``<basename><extension>``.
+
+        Returns ``(url, urls)``: the storage URL, or the local one when the
+        upload failed or storage is not a sink, and the per-sink URLs (None
+        for sinks that failed).
+        """
+        filename = f"{basename}{encoded.extension}"
+        urls = {sink.name: sink.write(key, filename, encoded) for sink in self.sinks}
+        return urls.get('storage') or urls.get('local'), urls
@@ -0,0 +1,170 @@
+"""
+AIModel/jobs.py
+Database-backed job queue for asynchronous diagnosis processing.
+
+upload_image stores the uploaded bytes in a local spool directory and
+inserts a DiagnosisJob row; a pool of worker threads (started by the app
+config, or by ``manage.py run_diagnosis_workers``) claims queued rows with
+SELECT ... FOR UPDATE SKIP LOCKED and runs the pipeline. No broker or
+external service is involved.
+"""
+
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .image_cache import remote_image_cache
+from .models import DiagnosisJob
+from .pipeline import PipelineError, mark_failed, process_diagnosis
+
+logger = logging.getLogger(__name__)
+
+_wake_event = threading.Event()
+
+
+def _spool_dir():
+    spool_dir = getattr(settings, 'AI_JOB_SPOOL_DIR', None) or (
+        Path(settings.MEDIA_ROOT) / 'diagnosis_jobs'
+    )
+    spool_dir = Path(spool_dir)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    return spool_dir
+
+
+def enqueue_diagnosis(diagnosis, content, file_ext='bin'):
+    """Spool ``content`` to disk and queue ``diagnosis`` for background processing."""
+    file_ext = ''.join(c for c in file_ext if c.isalnum()) or 'bin'
+    payload_path = _spool_dir() / f"{diagnosis.id}.{file_ext}"
+    tmp_path = payload_path.with_name(f"{payload_path.name}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, payload_path)
+
+    diagnosis.status = 'pending'
+    diagnosis.save(update_fields=['status'])
+    job = DiagnosisJob.objects.create(diagnosis=diagnosis, payload_path=str(payload_path))
+    _wake_event.set()
+    return job
+
+
+def claim_next_job(worker_name):
+    with transaction.atomic():
+        job = (
+            DiagnosisJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(state='queued')
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = 'running'
+        job.worker = worker_name
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['state', 'worker', 'attempts', 'started_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """Give jobs whose worker died mid-run another attempt, or fail them."""
+    timeout = getattr(settings, 'AI_JOB_TIMEOUT_SECONDS', 600)
+    max_attempts = getattr(settings, 'AI_JOB_MAX_ATTEMPTS', 3)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+
+    stale = DiagnosisJob.objects.filter(state='running', started_at__lt=cutoff)
+    for job in stale.select_related('diagnosis'):
+        if job.attempts < max_attempts:
+            job.state = 'queued'
+            job.save(update_fields=['state'])
+        else:
+            _finish(job, 'failed', f'Gave up after {job.attempts} attempts')
+            mark_failed(job.diagnosis, 'Processing timed out')
+
+
+def _read_payload(job):
+    payload_path = Path(job.payload_path) if job.payload_path else None
+    if payload_path and payload_path.exists():
+        return payload_path.read_bytes()
+    if job.diagnosis.image_url:
+        try:
+            return remote_image_cache.fetch(job.diagnosis.image_url)
+        except Exception as e:
+            raise PipelineError(f"Error fetching image from URL: {e}")
+    raise PipelineError('Uploaded image is no longer available')
+
+
+def _finish(job, state, error=''):
+    job.state = state
+    job.last_error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['state', 'last_error', 'finished_at'])
+    if job.payload_path:
+        Path(job.payload_path).unlink(missing_ok=True)
+
+
+def run_job(job):
+    diagnosis = job.diagnosis
+    try:
+        process_diagnosis(diagnosis, _read_payload(job))
+    except PipelineError as e:
+        mark_failed(diagnosis, str(e))
+        _finish(job, 'failed', str(e))
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        logger.error("Diagnosis job %s failed: %s\n%s", job.id, e, error_trace)
+        # The diagnosis error is shown by show_results; the traceback stays on the job.
+        mark_failed(diagnosis, str(e))
+        _finish(job, 'failed', error_trace)
+    else:
+        _finish(job, 'done')
+
+
+class JobWorkerPool:
+    def __init__(self, workers=2, poll_interval=2.0):
+        self.workers = max(int(workers), 1)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            name = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            thread = threading.Thread(
+                target=self._loop, args=(name,), name=f'diagnosis-worker-{i}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %s diagnosis job workers", self.workers)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        _wake_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self, name):
+        polls = 0
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                if polls % 30 == 0:
+                    requeue_stale_jobs()
+                polls += 1
+
+                job = claim_next_job(name)
+                if job is None:
+                    _wake_event.wait(self.poll_interval)
+                    _wake_event.clear()
+                    continue
+                run_job(job)
+            except Exception as e:
+                logger.exception("Diagnosis worker %s error: %s", name, e)
+                self._stop.wait(self.poll_interval)
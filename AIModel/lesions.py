@@ -0,0 +1,130 @@
+"""
+AIModel/lesions.py
+Lesion extraction from probability masks.
+
+Lesions are the 8-connected components of the thresholded mask. Area,
+bounding box, mean and max probability for every component come from
+``cv2.connectedComponentsWithStats`` plus one ``np.bincount`` /
+``np.maximum.at`` pass over the labels, so the per-lesion statistics only
+cover the lesion's own pixels, not the background inside its box.
+Output matches the ``lesion_boxes`` JSON stored on DiagnosisResult.
+"""
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def _require_cv2():
+    if cv2 is None:
+        raise ImportError("OpenCV (cv2) is required for lesion extraction. Install opencv-python.")
+
+
+def label_components(mask, threshold):
+    """``(count, labels, stats, centroids)`` of ``mask > threshold``."""
+    _require_cv2()
+    binary = (np.asarray(mask) > threshold).astype(np.uint8)
+    return cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+
+def _component_probabilities(flat_labels, flat_mask, count, areas):
+    sums = np.bincount(flat_labels, weights=flat_mask, minlength=count)
+    means = sums / np.maximum(areas, 1)
+
+    maxes = np.zeros(count, dtype=np.float64)
+    foreground = flat_labels > 0
+    np.maximum.at(maxes, flat_labels[foreground], flat_mask[foreground])
+    return means, maxes
+
+
+def _polygon(labels, label, x, y, w, h):
+    component = (labels[y:y+h, x:x+w] == label).astype(np.uint8)
+    contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return []
+    outline = max(contours, key=len).reshape(-1, 2) + (x, y)
+    return outline.astype(int).tolist()
+
+
+def _lesion_dicts(labels, stats, means, maxes, keep, polygons):
+    lesions = []
+    for lesion_id, label in enumerate(keep, start=1):
+        x, y, w, h, area = (int(v) for v in stats[label, :5])
+        lesion = {
+            'id': lesion_id,
+            'x': x,
+            'y': y,
+            'width': w,
+            'height': h,
+            'confidence': round(float(means[label]) * 100, 2),
+            'max_confidence': round(float(maxes[label]) * 100, 2),
+            'area': area,
+        }
+        if polygons:
+            lesion['polygon'] = _polygon(labels, label, x, y, w, h)
+        lesions.append(lesion)
+    return lesions
+
+
+def extract_lesions(mask, threshold=0.5, min_area=100, polygons=False, components=None):
+    """
+    Lesion boxes for one 2-D mask.
+
+    ``components`` may carry a labeling already computed at ``threshold``
+    (see MaskAnalysis.components) to skip relabeling.
+    """
+    mask = np.asarray(mask, dtype=np.float32)
+    if components is None:
+        components = label_components(mask, threshold)
+    count, labels, stats, _ = components
+    if count <= 1:
+        return []
+
+    areas = stats[:, cv2.CC_STAT_AREA]
+    means, maxes = _component_probabilities(labels.ravel(), mask.ravel(), count, areas)
+    keep = np.flatnonzero(areas[1:] > min_area) + 1
+    return _lesion_dicts(labels, stats, means, maxes, keep, polygons)
+
+
+def extract_lesions_batch(masks, threshold=0.5, min_area=100, polygons=False):
+    """
+    Lesion boxes for a batch of masks shaped (N, H, W) or (N, H, W, 1).
+
+    Each mask is labeled on its own, then the labels are offset into one
+    shared id space so per-lesion statistics for the whole batch come from
+    a single bincount. ``threshold`` may be a scalar or one value per mask.
+    """
+    _require_cv2()
+    masks = np.asarray(masks, dtype=np.float32)
+    if masks.ndim == 4:
+        masks = masks[..., 0]
+    if len(masks) == 0:
+        return []
+    thresholds = np.broadcast_to(np.asarray(threshold, dtype=np.float32), (len(masks),))
+
+    labelings = [label_components(m, t) for m, t in zip(masks, thresholds)]
+    counts = np.array([c[0] for c in labelings])
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    raw_labels = np.stack([c[1] for c in labelings])
+    # Background stays 0 so it never counts as a lesion; components get batch-wide ids.
+    all_labels = np.where(raw_labels > 0, raw_labels + offsets[:, None, None], 0)
+    all_areas = np.concatenate([c[2][:, cv2.CC_STAT_AREA] for c in labelings])
+    total = int(counts.sum())
+    means, maxes = _component_probabilities(all_labels.ravel(), masks.ravel(), total, all_areas)
+
+    results = []
+    for (count, labels, stats, _), offset in zip(labelings, offsets):
+        if count <= 1:
+            results.append([])
+            continue
+        areas = stats[:, cv2.CC_STAT_AREA]
+        keep = np.flatnonzero(areas[1:] > min_area) + 1
+        results.append(_lesion_dicts(
+            labels, stats, means[offset:offset + count], maxes[offset:offset + count],
+            keep, polygons,
+        ))
+    return results
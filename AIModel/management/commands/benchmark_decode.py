@@ -0,0 +1,87 @@
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.decoding import decode_for_inference
+from AIModel.management.commands.check_backend_parity import IMAGE_SUFFIXES
+from AIModel.model_loader import model_loader
+
+
+MODES = [
+    ('full decode', {'fast': False, 'grayscale': False}),
+    ('reduced', {'fast': True, 'grayscale': False}),
+    ('reduced grayscale', {'fast': True, 'grayscale': True}),
+]
+
+
+def _decode_and_preprocess(content, target_size, options):
+    image = decode_for_inference(content, target_size, **options)
+    if image is None:
+        return None
+    return model_loader.preprocess_image(image, target_size=target_size)
+
+
+class Command(BaseCommand):
+    help = "Compare decode + preprocess time and peak memory of full and reduced-resolution decoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', help='Directory of sample X-rays')
+        parser.add_argument('--target-size', type=int, default=None,
+                            help="Model input side; defaults to the loaded model's input shape")
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        target = options['target_size']
+        if target is None:
+            try:
+                target = int(model_loader.input_shape[1])
+            except Exception as e:
+                raise CommandError(f"Pass --target-size (could not read the model input shape: {e})")
+        target_size = (target, target)
+
+        paths = sorted(
+            p for p in Path(options['images']).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES
+        )[:options['limit']]
+        contents = [p.read_bytes() for p in paths]
+        if not contents:
+            raise CommandError(f"No images in {options['images']}")
+
+        self.stdout.write(
+            f"{len(contents)} images, target {target_size}, {options['runs']} runs per image"
+        )
+        results = {}
+        for name, mode in MODES:
+            timings = []
+            peaks = []
+            for content in contents:
+                tracemalloc.start()
+                if _decode_and_preprocess(content, target_size, mode) is None:
+                    tracemalloc.stop()
+                    continue
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+                for _ in range(options['runs']):
+                    start = time.perf_counter()
+                    _decode_and_preprocess(content, target_size, mode)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+            if not timings:
+                raise CommandError("None of the images could be decoded")
+            timings = np.array(timings)
+            results[name] = (np.percentile(timings, 50), max(peaks))
+            self.stdout.write(
+                f"  {name:<18} p50 {np.percentile(timings, 50):8.2f} ms   "
+                f"p95 {np.percentile(timings, 95):8.2f} ms   peak {max(peaks) / 1e6:8.1f} MB"
+            )
+
+        full_ms, full_peak = results['full decode']
+        fast_ms, fast_peak = results['reduced']
+        self.stdout.write(self.style.SUCCESS(
+            f"Reduced decode: p50 {full_ms:.2f} ms -> {fast_ms:.2f} ms "
+            f"({full_ms / max(fast_ms, 1e-9):.1f}x), peak {full_peak / 1e6:.1f} MB -> {fast_peak / 1e6:.1f} MB"
+        ))
@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from AIModel.backends import build_serving_fn
+from AIModel.model_loader import model_loader
+
+
+def _time_calls(fn, batch, runs, warmup):
+    for _ in range(warmup):
+        fn(batch)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare keras Model.predict latency with the traced serving function"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=1)
+
+    def handle(self, *args, **options):
+        model = model_loader.load_model()
+        serving_fn = build_serving_fn(model)
+        if serving_fn is None:
+            self.stderr.write("Model does not support the traced serving function")
+            return
+
+        import tensorflow as tf
+
+        shape = (options['batch_size'], *model.input_shape[1:])
+        batch = np.random.rand(*shape).astype(np.float32)
+
+        candidates = [
+            ('Model.predict', lambda x: model.predict(x, verbose=0)),
+            ('serving function', lambda x: serving_fn(tf.convert_to_tensor(x)).numpy()),
+        ]
+
+        self.stdout.write(f"Input {shape}, {options['runs']} runs after {options['warmup']} warm-up calls")
+        results = {}
+        for name, fn in candidates:
+            timings = _time_calls(fn, batch, options['runs'], options['warmup'])
+            results[name] = timings
+            self.stdout.write(
+                f"  {name:<17} p50 {np.percentile(timings, 50):8.2f} ms   "
+                f"p95 {np.percentile(timings, 95):8.2f} ms   mean {timings.mean():8.2f} ms"
+            )
+
+        before = np.percentile(results['Model.predict'], 50)
+        after = np.percentile(results['serving function'], 50)
+        self.stdout.write(self.style.SUCCESS(
+            f"p50 latency {before:.2f} ms -> {after:.2f} ms ({before / max(after, 1e-9):.1f}x)"
+        ))
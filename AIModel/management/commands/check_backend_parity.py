@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.backends import create_backend
+from AIModel.model_loader import model_loader
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'}
+
+
+def iter_sample_images(directory, limit=None):
+    """Yield ``(path, rgb_image)`` for every readable image in ``directory``."""
+    if cv2 is None:
+        raise CommandError("OpenCV (cv2) is required to read sample images.")
+    paths = sorted(
+        p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES
+    )
+    if limit:
+        paths = paths[:limit]
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        yield path, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _mask_iou(reference, candidate):
+    ref_mask = reference['segmentation_mask']
+    cand_mask = candidate['segmentation_mask']
+    threshold = max(0.5 * float(ref_mask.max()), 0.05)
+    ref_bin = ref_mask > threshold
+    cand_bin = cand_mask > threshold
+    union = np.logical_or(ref_bin, cand_bin).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(ref_bin, cand_bin).sum() / union)
+
+
+class Command(BaseCommand):
+    help = "Compare masks and classify_severity output of an inference backend against the float keras model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', help='Directory of sample X-rays')
+        parser.add_argument('--backend', default='tflite')
+        parser.add_argument('--reference', default='keras')
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--min-agreement', type=float, default=None,
+                            help='Fail if severity agreement (%%) is below this value')
+
+    def handle(self, *args, **options):
+        reference = create_backend(options['reference'], model_loader)
+        candidate = create_backend(options['backend'], model_loader)
+
+        ref_shape = tuple(reference.input_shape[1:])
+        if tuple(candidate.input_shape[1:]) != ref_shape:
+            raise CommandError(
+                f"Input shapes differ: {ref_shape} vs {tuple(candidate.input_shape[1:])}"
+            )
+
+        rows = []
+        for path, image in iter_sample_images(options['images'], options['limit']):
+            batch = model_loader.preprocess_image(image, target_size=ref_shape[:2])
+            ref_pred = np.asarray(reference.predict(batch))
+            cand_pred = np.asarray(candidate.predict(batch))
+            ref_result = model_loader.classify_severity(ref_pred)
+            cand_result = model_loader.classify_severity(cand_pred)
+
+            row = {
+                'name': path.name,
+                'same_severity': ref_result['severity'] == cand_result['severity'],
+                'max_abs_diff': float(np.max(np.abs(ref_pred - cand_pred))),
+                'affected_delta': abs(
+                    float(ref_result['affected_percentage']) - float(cand_result['affected_percentage'])
+                ),
+                'iou': _mask_iou(ref_result, cand_result) if 'segmentation_mask' in ref_result else None,
+            }
+            rows.append(row)
+            iou = f"{row['iou']:.3f}" if row['iou'] is not None else '  n/a'
+            self.stdout.write(
+                f"  {row['name']:<32} {ref_result['severity']:>8} -> {cand_result['severity']:<8} "
+                f"IoU {iou}  max|diff| {row['max_abs_diff']:.4f}  "
+                f"affected delta {row['affected_delta']:.2f}%"
+            )
+
+        if not rows:
+            raise CommandError(f"No readable images in {options['images']}")
+
+        agreement = 100.0 * sum(r['same_severity'] for r in rows) / len(rows)
+        ious = [r['iou'] for r in rows if r['iou'] is not None]
+        self.stdout.write(
+            f"{options['backend']} vs {options['reference']} on {len(rows)} images: "
+            f"severity agreement {agreement:.1f}%, "
+            f"mean IoU {np.mean(ious) if ious else float('nan'):.3f}, "
+            f"worst max|diff| {max(r['max_abs_diff'] for r in rows):.4f}"
+        )
+
+        if options['min_agreement'] is not None and agreement < options['min_agreement']:
+            raise CommandError(
+                f"Severity agreement {agreement:.1f}% is below {options['min_agreement']:.1f}%"
+            )
+        self.stdout.write(self.style.SUCCESS("Parity check passed"))
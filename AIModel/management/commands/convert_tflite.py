@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.backends import default_tflite_path
+from AIModel.model_loader import model_loader
+
+from .check_backend_parity import iter_sample_images
+
+
+class Command(BaseCommand):
+    help = "Convert the keras caries model to TFLite (dynamic-range, float16 or INT8)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantization', choices=['none', 'dynamic', 'float16', 'int8'],
+                            default='dynamic')
+        parser.add_argument('--output', default=None,
+                            help='Defaults to AI_TFLITE_MODEL_PATH or best_model.tflite')
+        parser.add_argument('--calibration-dir', default=None,
+                            help='Representative X-rays for INT8 calibration')
+        parser.add_argument('--calibration-samples', type=int, default=100)
+        parser.add_argument('--parity-dir', default=None,
+                            help='Run check_backend_parity on these images after converting')
+
+    def handle(self, *args, **options):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            raise CommandError("TensorFlow is required to convert the model.")
+
+        model = model_loader.load_model()
+        output = Path(options['output']) if options['output'] else default_tflite_path(model_loader)
+        quantization = options['quantization']
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if quantization != 'none':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            if not options['calibration_dir']:
+                raise CommandError("--calibration-dir is required for INT8 quantization.")
+            target_size = tuple(model.input_shape[1:3])
+            samples = [
+                model_loader.preprocess_image(image, target_size=target_size)
+                for _, image in iter_sample_images(
+                    options['calibration_dir'], options['calibration_samples'])
+            ]
+            if not samples:
+                raise CommandError(f"No readable images in {options['calibration_dir']}")
+
+            def representative_dataset():
+                for sample in samples:
+                    yield [sample.astype(np.float32)]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        self.stdout.write(f"Converting {model_loader.model_path} ({quantization})...")
+        tflite_model = converter.convert()
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        tmp_output = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+        tmp_output.write_bytes(tflite_model)
+        os.replace(tmp_output, output)
+
+        source_mb = model_loader.model_path.stat().st_size / 1e6
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output} ({len(tflite_model) / 1e6:.1f} MB, keras model {source_mb:.1f} MB)"
+        ))
+
+        if options['parity_dir']:
+            call_command('check_backend_parity', options['parity_dir'], backend='tflite',
+                         stdout=self.stdout, stderr=self.stderr)
@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.backends import default_onnx_path
+from AIModel.model_loader import model_loader
+
+
+class Command(BaseCommand):
+    help = "Export the keras caries model to ONNX for the onnxruntime backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Defaults to AI_ONNX_MODEL_PATH or best_model.onnx')
+        parser.add_argument('--opset', type=int, default=17)
+        parser.add_argument('--parity-dir', default=None,
+                            help='Run check_backend_parity on these images after exporting')
+
+    def handle(self, *args, **options):
+        try:
+            import tensorflow as tf
+            import tf2onnx
+        except ImportError:
+            raise CommandError("TensorFlow and tf2onnx are required to export the model "
+                               "(pip install -r requirements-inference.txt).")
+
+        model = model_loader.load_model()
+        output = Path(options['output']) if options['output'] else default_onnx_path(model_loader)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        tmp_output = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+
+        spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name='input'),)
+        self.stdout.write(f"Exporting {model_loader.model_path} (opset {options['opset']})...")
+        # tf2onnx's from_keras only understands tf.keras (Keras 2) models; tracing the
+        # forward pass as a tf.function also works for the Keras 3 model TF 2.16 loads.
+        forward = tf.function(lambda x: model(x, training=False), input_signature=spec)
+        tf2onnx.convert.from_function(
+            forward, input_signature=spec, opset=options['opset'], output_path=str(tmp_output)
+        )
+        os.replace(tmp_output, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output} ({output.stat().st_size / 1e6:.1f} MB)"
+        ))
+
+        if options['parity_dir']:
+            call_command('check_backend_parity', options['parity_dir'], backend='onnx',
+                         stdout=self.stdout, stderr=self.stderr)
@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.artifacts import artifact_store
+from AIModel.model_loader import model_loader
+from AIModel.models import DiagnosisResult
+from AIModel.pipeline import PipelineError, decode_image, load_scan_bytes
+from AIModel.xai_visualizer import XAIVisualizer
+
+
+class Command(BaseCommand):
+    help = "Compute Grad-CAM heatmaps for completed diagnoses in batches and store them as artifacts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='*', help='Only these diagnosis ids')
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute heatmaps that already exist for this model version')
+
+    def handle(self, *args, **options):
+        if not artifact_store.enabled:
+            raise CommandError("AI_ARTIFACTS_ENABLED is off; there is nowhere to store heatmaps")
+
+        loaded = model_loader.current
+        version = loaded.version
+        xai = XAIVisualizer.for_loaded_model(loaded)
+
+        diagnoses = DiagnosisResult.objects.filter(status='completed').order_by('-uploaded_at')
+        if options['ids']:
+            diagnoses = diagnoses.filter(id__in=options['ids'])
+
+        pending = []
+        for diagnosis in diagnoses.iterator():
+            if options['force'] or artifact_store.load_gradcam(diagnosis.id, version) is None:
+                pending.append(diagnosis)
+                if options['limit'] and len(pending) >= options['limit']:
+                    break
+
+        self.stdout.write(f"{len(pending)} diagnoses need Grad-CAM for {version}")
+        start = time.time()
+        done = failed = 0
+        batch_size = max(options['batch_size'], 1)
+        for offset in range(0, len(pending), batch_size):
+            ids, inputs = [], []
+            for diagnosis in pending[offset:offset + batch_size]:
+                try:
+                    image = decode_image(load_scan_bytes(diagnosis))
+                except PipelineError as e:
+                    failed += 1
+                    self.stderr.write(f"  diagnosis {diagnosis.id}: {e}")
+                    continue
+                ids.append(diagnosis.id)
+                inputs.append(model_loader.preprocess_image(image, model=loaded))
+            if not inputs:
+                continue
+
+            heatmaps = xai.generate_gradcam_batch(np.concatenate(inputs, axis=0))
+            for diagnosis_id, heatmap in zip(ids, heatmaps):
+                artifact_store.save_gradcam(diagnosis_id, heatmap, version)
+            done += len(ids)
+            self.stdout.write(f"  {done}/{len(pending)} done")
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Computed {done} heatmaps in {elapsed:.1f}s"
+            f"{f' ({elapsed / done * 1000:.0f} ms each)' if done else ''}; {failed} failed"
+        ))
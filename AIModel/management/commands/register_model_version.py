@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from AIModel.backends import import_tensorflow
+from AIModel.downloader import sha256_of
+from AIModel.models import ModelVersion
+from AIModel.registry import LoadedModel
+
+
+class Command(BaseCommand):
+    help = "Register model weights in the model registry and optionally activate them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .keras file (and its converted siblings)')
+        parser.add_argument('--version', dest='model_version', required=True,
+                            help='Unique version name, e.g. 2024-06-unet-v3')
+        parser.add_argument('--notes', default='')
+        parser.add_argument('--activate', action='store_true',
+                            help='Make this the active version; running workers hot-swap to it')
+
+    def handle(self, *args, **options):
+        path = Path(options['path']).resolve()
+        if not path.exists():
+            raise CommandError(f"Model file not found at {path}")
+        if ModelVersion.objects.filter(version=options['model_version']).exists():
+            raise CommandError(f"Version {options['model_version']} is already registered")
+
+        self.stdout.write(f"Hashing {path}...")
+        sha256 = sha256_of(path)
+
+        input_shape = None
+        if import_tensorflow() is not None:
+            model = LoadedModel(options['model_version'], path, backend_name='keras')
+            input_shape = [d for d in model.input_shape[1:]]
+        else:
+            self.stdout.write("TensorFlow not installed; input shape will be recorded on first load")
+
+        version = ModelVersion.objects.create(
+            version=options['model_version'],
+            path=str(path),
+            sha256=sha256,
+            input_shape=input_shape,
+            notes=options['notes'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Registered {version.version} (sha256 {sha256[:12]}..., input {input_shape})"
+        ))
+
+        if options['activate']:
+            version.activate()
+            self.stdout.write(self.style.SUCCESS(f"{version.version} is now active"))
@@ -0,0 +1,35 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from AIModel.jobs import JobWorkerPool
+from AIModel.model_loader import model_loader
+
+
+class Command(BaseCommand):
+    help = "Run background workers that process queued diagnosis jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        pool = JobWorkerPool(workers=options['workers'], poll_interval=options['poll_interval'])
+        stopped = threading.Event()
+
+        def _shutdown(signum, frame):
+            stopped.set()
+
+        signal.signal(signal.SIGINT, _shutdown)
+        signal.signal(signal.SIGTERM, _shutdown)
+
+        pool.start()
+        if getattr(settings, 'AI_MODEL_REGISTRY_ENABLED', False):
+            model_loader.start_registry_watcher()
+        self.stdout.write(f"Processing diagnosis jobs with {options['workers']} workers (Ctrl+C to stop)")
+        stopped.wait()
+
+        self.stdout.write("Stopping workers after their current job...")
+        pool.stop()
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-17 00:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIModel', '0006_teeth_position_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('payload_path', models.CharField(blank=True, max_length=500)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('diagnosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='AIModel.diagnosisresult')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['state', 'created_at'], name='AIModel_dia_state_bc14b7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIModel', '0007_diagnosisjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=100, unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('input_shape', models.JSONField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='diagnosisresult',
+            name='model_version',
+            field=models.CharField(blank=True, db_index=True, max_length=150),
+        ),
+        migrations.AddConstraint(
+            model_name='modelversion',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_model_version'),
+        ),
+    ]
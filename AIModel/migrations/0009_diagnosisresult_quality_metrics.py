@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIModel', '0008_model_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnosisresult',
+            name='quality_metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
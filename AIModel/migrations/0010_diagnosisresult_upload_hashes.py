@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-17 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIModel', '0009_diagnosisresult_quality_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnosisresult',
+            name='content_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='diagnosisresult',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='AIModel.diagnosisresult'),
+        ),
+        migrations.AddField(
+            model_name='diagnosisresult',
+            name='phash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+    ]
@@ -1,22 +1,149 @@
-try:
-    import tensorflow as tf
-except ImportError:
-    tf = None
 import numpy as np
 from pathlib import Path
+from collections import OrderedDict
+import hashlib
+import json
 import os
-import urllib.request
+import threading
+import time
 from django.conf import settings  
 
+from .analysis import MaskAnalysis
+from .augmentation import predict_tta
+from .batching import MicroBatcher
+from .cascade import cascade_metrics, is_confidently_healthy, run_shadow, should_shadow
+from .downloader import download_model, is_installed
+from .lesions import extract_lesions, extract_lesions_batch
+from .registry import LoadedModel, RegistryWatcher, active_model_version, loaded_model_for
+from .tiling import predict_tiled
+
 try:
     import cv2
 except ImportError:
     cv2 = None
 
 
+class InferenceCache:
+    """
+    Two-tier cache of raw model output keyed by image content and model version.
+
+    The memory tier is a bounded LRU; the disk tier keeps one compressed
+    ``.npz`` per key so results survive worker restarts and are shared
+    between gunicorn workers on the same host.
+    """
+
+    def __init__(self, max_entries=64, cache_dir=None):
+        self.max_entries = max(int(max_entries), 0)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash, model_version):
+        return hashlib.sha256(f"{model_version}:{content_hash}".encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            entry = self._read_disk(key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
+
+        predictions, severity_result, analysis, uncertainty = entry
+        return predictions, self._with_mask(severity_result, analysis, uncertainty)
+
+    def put(self, key, predictions, severity_result):
+        predictions = np.array(predictions, copy=True)
+        predictions.flags.writeable = False
+        analysis = severity_result.get('analysis')
+        uncertainty = severity_result.get('uncertainty_map')
+        severity_result = {
+            k: v for k, v in severity_result.items()
+            if k not in ('segmentation_mask', 'analysis', 'uncertainty_map')
+        }
+        entry = (predictions, severity_result, analysis, uncertainty)
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, entry):
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                predictions = data['predictions']
+                severity_result = json.loads(str(data['severity']))
+                uncertainty = data['uncertainty'] if 'uncertainty' in data else None
+        except Exception as e:
+            print(f"Inference cache: discarding unreadable entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        predictions.flags.writeable = False
+        return predictions, severity_result, MaskAnalysis.from_predictions(predictions), uncertainty
+
+    def _write_disk(self, key, entry):
+        if self.cache_dir is None:
+            return
+        predictions, severity_result, _, uncertainty = entry
+        path = self._disk_path(key)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        arrays = {'uncertainty': uncertainty} if uncertainty is not None else {}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(
+                tmp_path,
+                predictions=predictions,
+                severity=np.array(json.dumps(severity_result)),
+                **arrays,
+            )
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Inference cache: could not write {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _with_mask(severity_result, analysis, uncertainty):
+        result = dict(severity_result)
+        if analysis is not None:
+            result['segmentation_mask'] = analysis.mask
+            result['analysis'] = analysis
+        if uncertainty is not None:
+            result['uncertainty_map'] = uncertainty
+        return result
+
+
 class ModelLoader:
     _instance = None
-    _model = None
+    _current = None
+    _current_lock = threading.Lock()
+    _inference_cache = None
+    _batcher = None
+    _warmup_state = 'idle'
+    _watcher = None
+    _cascade_model = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -33,111 +160,458 @@ class ModelLoader:
         return url
 
     def download_model_if_needed(self, model_path):
-        """Download model from AWS S3 if it doesn't exist locally"""
-        if model_path.exists():
+        """Download model from AWS S3 if it doesn't exist locally (or fails its checksum)"""
+        expected_sha256 = getattr(settings, 'AWS_MODEL_SHA256', '') or None
+        if is_installed(model_path, expected_sha256):
             print(f"Model already exists at {model_path}")
             return
 
         print(f"Downloading model from AWS S3...")
+        download_model(self.aws_model_url, model_path, sha256=expected_sha256)
+        print(f"Model downloaded successfully to {model_path}")
 
-        try:
-            model_path.parent.mkdir(parents=True, exist_ok=True)
-            urllib.request.urlretrieve(self.aws_model_url, str(model_path))
-            print(f"Model downloaded successfully to {model_path}")
+    @property
+    def default_model_path(self):
+        return Path(__file__).parent / 'ml_models' / 'best_model.keras'
 
-        except Exception as e:
-            print(f"Error downloading model: {e}")
-            if model_path.exists():
-                model_path.unlink()
-            raise
+    @property
+    def current(self):
+        """
+        The LoadedModel serving requests.
+
+        Callers that need several operations on the same weights (preprocess,
+        predict, cache key) should read this once and pass it along, so a
+        hot swap in between cannot mix two versions.
+        """
+        if self._current is None:
+            with ModelLoader._current_lock:
+                if self._current is None:
+                    ModelLoader._current = self._initial_model()
+        return self._current
+
+    def _initial_model(self):
+        if getattr(settings, 'AI_MODEL_REGISTRY_ENABLED', False):
+            row = active_model_version()
+            if row is not None:
+                return loaded_model_for(row, self.backend_name)
+        return LoadedModel(
+            getattr(settings, 'AI_MODEL_VERSION', '') or None,
+            self.default_model_path,
+            backend_name=self.backend_name,
+            fetch=self.download_model_if_needed,
+        )
+
+    def swap_to(self, model):
+        """Load and warm ``model`` off the request path, then make it current."""
+        self.warm_up(model=model)
+        previous = self._current
+        ModelLoader._current = model
+        print(f"Model swapped: {previous.version if previous else None} -> {model.version}")
+
+    def start_registry_watcher(self):
+        """Poll the registry for a newly activated version (once per process)."""
+        if self._watcher is None:
+            ModelLoader._watcher = RegistryWatcher(
+                self, poll_interval=getattr(settings, 'AI_MODEL_REGISTRY_POLL_SECONDS', 30)
+            )
+            self._watcher.start()
+        return self._watcher
 
-    def load_model(self):
-        if self._model is None:
-            if tf is None:
-                raise ImportError(
-                    "TensorFlow is not installed. Install tensorflow to use the AIModel features."
-                )
+    @property
+    def model_path(self):
+        return self.current.model_path
 
-            model_path = Path(__file__).parent / 'ml_models' / 'best_model.keras'
+    @property
+    def model_version(self):
+        """Identifier of the weights in use; part of every inference cache key."""
+        return self.current.version
 
-            self.download_model_if_needed(model_path)
+    @property
+    def inference_cache(self):
+        if self._inference_cache is None:
+            cache_dir = None
+            if getattr(settings, 'AI_INFERENCE_CACHE_DISK', True):
+                cache_dir = getattr(settings, 'AI_INFERENCE_CACHE_DIR', None) or (
+                    Path(settings.MEDIA_ROOT) / 'inference_cache'
+                )
+            ModelLoader._inference_cache = InferenceCache(
+                max_entries=getattr(settings, 'AI_INFERENCE_CACHE_SIZE', 64),
+                cache_dir=cache_dir,
+            )
+        return self._inference_cache
 
-            if not model_path.exists():
-                raise FileNotFoundError(f"Model file not found at {model_path}")
+    def load_model(self):
+        return self.current.load_model()
 
-            print(f"Loading model from {model_path}")
-            self._model = tf.keras.models.load_model(str(model_path), compile=False)
-            print("Model loaded successfully")
+    @property
+    def backend_name(self):
+        return getattr(settings, 'AI_INFERENCE_BACKEND', 'keras')
 
-        return self._model
+    @property
+    def backend(self):
+        return self.current.backend
 
-    def preprocess_image(self, image_array, target_size=None):
-        model = self.load_model()
+    @property
+    def input_shape(self):
+        return self.current.input_shape
+
+    def preprocess_image(self, image_array, target_size=None, model=None):
         if target_size is None:
-            input_shape = model.input_shape[1:3]
+            input_shape = (model or self.current).input_shape[1:3]
             target_size = tuple(input_shape)
 
         if cv2 is None:
             raise ImportError("OpenCV (cv2) is required.")
 
         img_resized = cv2.resize(image_array, target_size)
+        if img_resized.ndim == 2:
+            # Grayscale decode: expand to RGB only after shrinking to the input size.
+            img_resized = cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
 
         img_batch = np.expand_dims(img_resized.astype(np.float32), axis=0)
         return img_batch
-    def predict(self, preprocessed_image):
-        model = self.load_model()
-        return model.predict(preprocessed_image, verbose=0)
-
-    def classify_severity(self, predictions):
-        predictions = np.array(predictions)
-
-        if len(predictions.shape) == 4:
-            segmentation_mask = predictions[0, :, :, 0]
-            max_prob = float(segmentation_mask.max())
-            mean_prob = float(segmentation_mask.mean())
-            adaptive_threshold = max(0.5 * max_prob, 0.05)
-            affected_pixels = np.sum(segmentation_mask > adaptive_threshold)
-            total_pixels = segmentation_mask.size
-            affected_percentage = (affected_pixels / total_pixels) * 100
-
-            if affected_percentage < 1:
-                severity, confidence = 'Healthy', (1 - mean_prob) * 100
-            elif affected_percentage < 5:
-                severity, confidence = 'Moderate', mean_prob * 100
-            else:
-                severity, confidence = 'Deep', mean_prob * 100
-
-            return {
-                'severity': severity,
-                'confidence': min(confidence, 100.0),
-                'has_caries': severity.lower() != 'healthy',
-                'affected_percentage': affected_percentage,
-                'mean_probability': mean_prob,
-                'max_probability': max_prob,
-                'segmentation_mask': segmentation_mask
-            }
-
-        elif len(predictions.shape) == 2:
-            pred = predictions[0]
-            severity_labels = ['Healthy', 'Moderate', 'Deep']   
-            num_classes = pred.shape[0]
-            severity_labels = severity_labels[:num_classes]
-
-            severity_index = int(np.argmax(pred))
-            confidence = float(pred[severity_index]) * 100
-            severity = severity_labels[severity_index]
-            has_caries = severity.lower() != 'healthy'
-
-            return {
-                'severity': severity,
-                'confidence': confidence,
-                'has_caries': has_caries,
-                'all_probabilities': [float(p) * 100 for p in pred],
-                'affected_percentage': 0.0 if not has_caries else confidence,
-                'mean_probability': float(np.mean(pred)),
-                'max_probability': float(np.max(pred)),
-            }
 
+    @property
+    def batcher(self):
+        """Process-local micro-batching scheduler, or None when batching is disabled."""
+        if not getattr(settings, 'AI_BATCHING_ENABLED', False):
+            return None
+        if self._batcher is None or self._batcher.pid != os.getpid():
+            ModelLoader._batcher = MicroBatcher(
+                self._forward,
+                max_batch_size=getattr(settings, 'AI_BATCH_MAX_SIZE', 8),
+                max_wait_ms=getattr(settings, 'AI_BATCH_MAX_WAIT_MS', 5),
+                max_queue_size=getattr(settings, 'AI_BATCH_QUEUE_SIZE', 64),
+            )
+        return self._batcher
+
+    @property
+    def warmup_state(self):
+        """'idle' (lazy loading), 'warming', 'ready' or 'failed'."""
+        return self._warmup_state
+
+    @property
+    def is_ready(self):
+        return self._warmup_state not in ('warming', 'failed')
+
+    def warm_up(self, passes=None, gradcam=None, model=None):
+        """
+        Load the model and run synthetic forward passes at its input shape.
+
+        This pays for graph tracing, kernel selection and allocator growth
+        before the first real request. Bypasses the micro-batcher and the
+        inference cache so every pass reaches the backend. Warming a
+        ``model`` other than the current one (before a hot swap) leaves the
+        readiness state alone, since the current model keeps serving.
+        """
+        if passes is None:
+            passes = getattr(settings, 'AI_WARMUP_PASSES', 3)
+        if gradcam is None:
+            gradcam = getattr(settings, 'AI_WARMUP_GRADCAM', False)
+
+        swapping = model is not None
+        model = model or self.current
+        if not swapping:
+            ModelLoader._warmup_state = 'warming'
+        start = time.time()
+        try:
+            model.backend.load()
+            shape = (1, *[d or 1 for d in model.input_shape[1:]])
+            dummy = np.random.default_rng(0).uniform(0, 255, shape).astype(np.float32)
+            for _ in range(max(int(passes), 0)):
+                self._forward(dummy, model)
+
+            stage1 = None if swapping else self.cascade_model
+            if stage1 is not None:
+                stage1.backend.load()
+                shape = (1, *[d or 1 for d in stage1.input_shape[1:]])
+                self._forward(np.zeros(shape, dtype=np.float32), stage1)
+
+            if gradcam:
+                from .xai_visualizer import XAIVisualizer
+                XAIVisualizer.for_loaded_model(model).generate_gradcam(dummy)
+        except Exception:
+            if not swapping:
+                ModelLoader._warmup_state = 'failed'
+            raise
+
+        if not swapping:
+            ModelLoader._warmup_state = 'ready'
+        print(f"Model warm-up: {passes} forward pass(es){' + Grad-CAM' if gradcam else ''} "
+              f"in {time.time() - start:.2f}s")
+
+    @property
+    def tiling(self):
+        """True when AI_TILED_INFERENCE runs segmentation on full-resolution tiles."""
+        return getattr(settings, 'AI_TILED_INFERENCE', False)
+
+    @property
+    def tta(self):
+        """True when AI_TTA_ENABLED averages whole-image predictions over augmented variants."""
+        return getattr(settings, 'AI_TTA_ENABLED', False) and not self.tiling
+
+    @property
+    def cascade_model(self):
+        """The LoadedModel for the cascade's first stage, or None when the cascade is off."""
+        path = getattr(settings, 'AI_CASCADE_MODEL_PATH', '')
+        if not getattr(settings, 'AI_CASCADE_ENABLED', False) or not path:
+            return None
+        stage1 = self._cascade_model
+        if stage1 is None or stage1.model_path != Path(path) or stage1.backend_name != self.backend_name:
+            stage1 = LoadedModel(None, path, backend_name=self.backend_name)
+            ModelLoader._cascade_model = stage1
+        return stage1
+
+    def result_version(self, model=None):
+        """
+        Version recorded for full-model predictions and their caches and
+        artifacts: the model version, suffixed ``+tiled`` or ``+tta`` in
+        those modes, so their results are never mixed up with plain
+        whole-image ones.
+        """
+        version = (model or self.current).version
+        if self.tiling:
+            version = f"{version}+tiled"
+        elif self.tta:
+            version = f"{version}+tta"
+        return version
+
+    def cascade_version(self, stage1, model=None):
+        """Version recorded for a cascade early exit: the result version plus the first-stage model."""
+        return f"{self.result_version(model)}+cascade({stage1.version})"
+
+    def predict_tiled(self, image_array, model=None):
+        """
+        Full-resolution (1, H, W, 1) mask from overlapping input-size tiles
+        of a decoded image; see tiling.predict_tiled.
+
+        Returns None when tiling does not apply: the image fits in one tile,
+        the model has no fixed input size, or its output is not a mask.
+        """
+        model = model or self.current
+        input_shape = model.input_shape
+        tile_size = tuple(input_shape[1:3])
+        if None in tile_size:
+            return None
+        if image_array.shape[0] <= tile_size[0] and image_array.shape[1] <= tile_size[1]:
+            return None
+
+        return predict_tiled(
+            image_array,
+            lambda batch: self.predict(batch, model=model),
+            tile_size,
+            channels=input_shape[3] or 3,
+            overlap=getattr(settings, 'AI_TILE_OVERLAP', 0.25),
+            max_tiles_per_batch=getattr(settings, 'AI_TILE_BATCH_SIZE', 8),
+        )
+
+    def predict_tta(self, preprocessed_image, model=None):
+        """
+        ``(mean, variance)`` over flipped and shifted variants of a
+        preprocessed image, run as one batch; see augmentation.predict_tta.
+        ``(None, None)`` for classifier output.
+        """
+        model = model or self.current
+        return predict_tta(
+            preprocessed_image,
+            lambda batch: self.predict(batch, model=model),
+            shift=getattr(settings, 'AI_TTA_SHIFT', 8),
+        )
+
+    def predict(self, preprocessed_image, model=None):
+        model = model or self.current
+        batcher = self.batcher
+        if batcher is not None:
+            return batcher.submit(preprocessed_image, key=model)
+        return self._forward(preprocessed_image, model)
+
+    def _forward(self, batch, model=None):
+        return (model or self.current).backend.predict(batch)
+
+    @staticmethod
+    def image_content_hash(image_array):
+        image_array = np.ascontiguousarray(image_array)
+        digest = hashlib.sha256(f"{image_array.shape}:{image_array.dtype}".encode())
+        digest.update(image_array.data)
+        return digest.hexdigest()
+
+    def infer(self, image_array, content_hash=None):
+        """
+        Preprocess, predict and classify a decoded RGB image.
+
+        The raw prediction tensor and the ``classify_severity`` output are
+        cached per (image content, model version), so every pipeline stage
+        after the first one for a given scan skips the forward pass.
+        All of it runs on one model version even if a hot swap happens
+        meanwhile; ``severity_result['model_version']`` names it.
+        In tiled mode the predictions are the stitched full-resolution mask
+        (``image_array`` should then be decoded at full resolution);
+        ``preprocessed`` is still the whole image at the input size. In TTA
+        mode they are the mean over augmented variants, and
+        ``severity_result['uncertainty_map']`` holds the per-pixel variance.
+        In cascade mode a confidently healthy scan returns the first-stage
+        model's output with ``severity_result['cascade_stage'] == 1``.
+        Returns ``(preprocessed, predictions, severity_result)``.
+        """
+        model = self.current
+        version = self.result_version(model)
+        preprocessed = self.preprocess_image(image_array, model=model)
+
+        if content_hash is None:
+            content_hash = self.image_content_hash(image_array)
+        key = self.inference_cache.make_key(content_hash, version)
+
+        cached = self.inference_cache.get(key)
+        if cached is not None:
+            predictions, severity_result = cached
+            return preprocessed, predictions, severity_result
+
+        stage1 = self.cascade_model
+        if stage1 is not None:
+            # Early exits are cached under their own version; full-model results above win.
+            stage1_version = self.cascade_version(stage1, model)
+            stage1_key = self.inference_cache.make_key(content_hash, stage1_version)
+            cached = self.inference_cache.get(stage1_key)
+            if cached is not None:
+                predictions, severity_result = cached
+                return preprocessed, predictions, severity_result
+
+            early_exit = self._cascade_stage1(image_array, stage1, model, preprocessed)
+            if early_exit is not None:
+                predictions, severity_result = early_exit
+                severity_result['model_version'] = stage1_version
+                self.inference_cache.put(stage1_key, predictions, severity_result)
+                return preprocessed, predictions, severity_result
+
+        started = time.time()
+        predictions, uncertainty = self._predict_full(image_array, preprocessed, model)
+        severity_result = self.classify_severity(predictions)
+        severity_result['model_version'] = version
+        if stage1 is not None:
+            cascade_metrics.record_full(time.time() - started)
+            severity_result['cascade_stage'] = 2
+        if uncertainty is not None:
+            severity_result['uncertainty_map'] = uncertainty
+            severity_result['mean_uncertainty'] = float(uncertainty.mean())
+            severity_result['max_uncertainty'] = float(uncertainty.max())
+        self.inference_cache.put(key, predictions, severity_result)
+        return preprocessed, predictions, severity_result
+
+    def _predict_full(self, image_array, preprocessed, model):
+        """``(predictions, uncertainty)`` from the full model in the configured mode."""
+        predictions = uncertainty = None
+        if self.tiling:
+            predictions = self.predict_tiled(image_array, model)
+        elif self.tta:
+            predictions, uncertainty = self.predict_tta(preprocessed, model)
+        if predictions is None:
+            predictions = self.predict(preprocessed, model=model)
+        return predictions, uncertainty
+
+    def _cascade_stage1(self, image_array, stage1, model, preprocessed):
+        """
+        Run the first-stage model; ``(predictions, severity_result)`` when the
+        scan is confidently healthy, else None. Samples early exits for a
+        background comparison against the full model.
+        """
+        started = time.time()
+        predictions = self.predict(self.preprocess_image(image_array, model=stage1), model=stage1)
+        severity_result = self.classify_severity(predictions)
+        early_exit = is_confidently_healthy(
+            severity_result,
+            min_confidence=getattr(settings, 'AI_CASCADE_HEALTHY_CONFIDENCE', 95.0),
+            max_probability=getattr(settings, 'AI_CASCADE_MAX_PROBABILITY', 0.3),
+        )
+        cascade_metrics.record_stage1(time.time() - started, early_exit)
+        if not early_exit:
+            return None
+
+        if should_shadow(getattr(settings, 'AI_CASCADE_SHADOW_RATE', 0.05)):
+            def full_model_disagrees():
+                full, _ = self._predict_full(image_array, preprocessed, model)
+                return self.classify_severity(full)['severity'] != 'Healthy'
+            run_shadow(full_model_disagrees)
+
+        severity_result['cascade_stage'] = 1
+        return predictions, severity_result
+
+    def analyze(self, predictions):
+        """MaskAnalysis for segmentation output, None for classifier output."""
+        return MaskAnalysis.from_predictions(predictions)
+
+    def classify_severity(self, predictions, analysis=None):
+        predictions = np.asarray(predictions)
+        if predictions.ndim in (2, 4) and len(predictions):
+            analyses = [analysis] if analysis is not None else None
+            return self.classify_severity_batch(predictions[:1], analyses)[0]
+        return self._unknown_severity(predictions.shape)
+
+    def classify_severity_batch(self, predictions, analyses=None):
+        """
+        ``classify_severity`` for every item of an (N, H, W, 1) or (N, C) tensor.
+
+        Statistics and severity labels are computed for the whole batch with
+        vectorized reductions; entry ``i`` equals ``classify_severity`` on
+        ``predictions[i:i+1]``.
+        """
+        predictions = np.asarray(predictions)
+
+        if predictions.ndim == 4:
+            if analyses is None:
+                analyses = MaskAnalysis.from_batch(predictions)
+            affected = np.array([a.affected_percentage for a in analyses], dtype=np.float64)
+            means = np.array([a.mean_probability for a in analyses], dtype=np.float64)
+
+            levels = np.searchsorted([1, 5], affected, side='right')
+            severities = np.array(['Healthy', 'Moderate', 'Deep'])[levels]
+            confidences = np.minimum(np.where(levels == 0, (1 - means) * 100, means * 100), 100.0)
+
+            return [
+                {
+                    'severity': str(severity),
+                    'confidence': float(confidence),
+                    'has_caries': severity != 'Healthy',
+                    'affected_percentage': analysis.affected_percentage,
+                    'mean_probability': analysis.mean_probability,
+                    'max_probability': analysis.max_probability,
+                    'segmentation_mask': analysis.mask,
+                    'analysis': analysis,
+                }
+                for severity, confidence, analysis in zip(severities, confidences, analyses)
+            ]
+
+        elif predictions.ndim == 2:
+            severity_labels = ['Healthy', 'Moderate', 'Deep']
+            num_classes = predictions.shape[1]
+            severity_labels = np.array(severity_labels[:num_classes])
+
+            indices = np.argmax(predictions, axis=1)
+            probabilities = predictions.astype(np.float64) * 100
+            confidences = probabilities[np.arange(len(predictions)), indices]
+            severities = severity_labels[indices]
+            means = predictions.mean(axis=1)
+            maxes = predictions.max(axis=1)
+
+            results = []
+            for i, severity in enumerate(severities):
+                has_caries = severity != 'Healthy'
+                confidence = float(confidences[i])
+                results.append({
+                    'severity': str(severity),
+                    'confidence': confidence,
+                    'has_caries': bool(has_caries),
+                    'all_probabilities': probabilities[i].tolist(),
+                    'affected_percentage': 0.0 if not has_caries else confidence,
+                    'mean_probability': float(means[i]),
+                    'max_probability': float(maxes[i]),
+                })
+            return results
+
+        count = len(predictions) if predictions.ndim else 1
+        return [self._unknown_severity(predictions.shape) for _ in range(count)]
+
+    @staticmethod
+    def _unknown_severity(shape):
         return {
             'severity': 'Unknown',
             'confidence': 0.0,
@@ -145,33 +619,17 @@ class ModelLoader:
             'affected_percentage': 0.0,
             'mean_probability': 0.0,
             'max_probability': 0.0,
-            'error': f'Unexpected prediction shape: {predictions.shape}'
+            'error': f'Unexpected prediction shape: {shape}'
         }
 
-    def generate_bounding_boxes(self, segmentation_mask, threshold=0.5, min_area=100):
-        if cv2 is None:
-            raise ImportError("OpenCV (cv2) is required for bounding box generation. Install opencv-python.")
-
-        binary_mask = (segmentation_mask > threshold).astype(np.uint8) * 255
-        contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        bounding_boxes = []
-        for i, contour in enumerate(contours):
-            area = cv2.contourArea(contour)
-            if area > min_area:
-                x, y, w, h = cv2.boundingRect(contour)
-                roi = segmentation_mask[y:y+h, x:x+w]
-                confidence = float(roi.mean()) * 100
-                bounding_boxes.append({
-                    'id': i + 1,
-                    'x': int(x),
-                    'y': int(y),
-                    'width': int(w),
-                    'height': int(h),
-                    'confidence': round(confidence, 2),
-                    'area': int(area)
-                })
-        return bounding_boxes
+    def generate_bounding_boxes(self, segmentation_mask, threshold=0.5, min_area=100, polygons=False):
+        return extract_lesions(segmentation_mask, threshold=threshold, min_area=min_area,
+                               polygons=polygons)
+
+    def generate_bounding_boxes_batch(self, masks, threshold=0.5, min_area=100, polygons=False):
+        """Boxes for (N, H, W[, 1]) masks; ``threshold`` may be one value per mask."""
+        return extract_lesions_batch(masks, threshold=threshold, min_area=min_area,
+                                     polygons=polygons)
 
 
 model_loader = ModelLoader()
\ No newline at end of file
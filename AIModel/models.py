@@ -1,7 +1,42 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from dashboard.models import Patient
 
+class ModelVersion(models.Model):
+    """Registered model weights; exactly one row may be active at a time."""
+
+    version = models.CharField(max_length=100, unique=True)
+    path = models.CharField(max_length=500)
+    sha256 = models.CharField(max_length=64, blank=True)
+    input_shape = models.JSONField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='single_active_model_version',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.version}{' (active)' if self.is_active else ''}"
+
+    def activate(self):
+        """Make this the active version; workers pick it up on their next registry poll."""
+        with transaction.atomic():
+            ModelVersion.objects.filter(is_active=True).exclude(pk=self.pk).update(is_active=False)
+            self.is_active = True
+            self.activated_at = timezone.now()
+            self.save(update_fields=['is_active', 'activated_at'])
+
+
 class DiagnosisResult(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -64,6 +99,21 @@ class DiagnosisResult(models.Model):
     )
 
     error_message = models.TextField(blank=True, null=True)
+    # Pre-inference quality gate: {'passed', 'metrics', 'failures'}
+    quality_metrics = models.JSONField(null=True, blank=True)
+
+    model_version = models.CharField(max_length=150, blank=True, db_index=True)
+
+    # Upload hashes: exact SHA-256 of the bytes and a 64-bit perceptual hash (see dedup.py)
+    content_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    phash = models.CharField(max_length=16, blank=True, db_index=True)
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates'
+    )
 
     verified_by_dentist = models.BooleanField(default=False)
     dentist_notes = models.TextField(blank=True)
@@ -73,4 +123,38 @@ class DiagnosisResult(models.Model):
 
     def __str__(self):
         patient_name = self.patient.full_name if self.patient else "Unknown"
-        return f"Diagnosis {self.id} - {patient_name}"
\ No newline at end of file
+        return f"Diagnosis {self.id} - {patient_name}"
+
+class DiagnosisJob(models.Model):
+    """Database-backed work item for the asynchronous diagnosis pipeline."""
+
+    STATE_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    diagnosis = models.ForeignKey(
+        DiagnosisResult,
+        on_delete=models.CASCADE,
+        related_name='jobs'
+    )
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='queued')
+    payload_path = models.CharField(max_length=500, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['state', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} for diagnosis {self.diagnosis_id} - {self.state}"
@@ -0,0 +1,205 @@
+"""
+AIModel/pipeline.py
+Full diagnosis pipeline for one uploaded X-ray.
+
+Used directly by upload_image in synchronous mode and by the background
+job workers in asynchronous mode; both move the DiagnosisResult through
+the same STATUS_CHOICES states.
+"""
+
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .artifacts import artifact_store
+from .decoding import decode_for_inference
+from .image_cache import remote_image_cache
+from .model_loader import model_loader
+from .quality import assess_quality
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+class PipelineError(Exception):
+    """A scan that cannot be processed; the message is stored on the diagnosis."""
+
+
+class ImageQualityError(PipelineError):
+    """The scan failed the pre-inference quality gate; ``report`` holds the metrics and failed checks."""
+
+    def __init__(self, report):
+        super().__init__(report.message)
+        self.report = report
+
+
+def _input_size():
+    # Tiled inference needs the scan at full resolution.
+    if model_loader.tiling:
+        return None
+    size = tuple(model_loader.input_shape[1:3])
+    return None if None in size else size
+
+
+def decode_image(content):
+    """
+    Decode uploaded bytes for inference.
+
+    RGB (or grayscale with AI_DECODE_GRAYSCALE), at a reduced JPEG scale
+    when that still covers the model input; see decoding.decode_for_inference.
+    """
+    if cv2 is None:
+        raise PipelineError('OpenCV (cv2) not installed - cannot process image')
+
+    img = decode_for_inference(content, _input_size())
+    if img is None:
+        raise PipelineError('Failed to decode image')
+    return img
+
+
+def read_local_image(diagnosis):
+    """Read the diagnosis' local image file and decode it like ``decode_image``."""
+    if cv2 is None:
+        raise PipelineError('OpenCV (cv2) is not installed in this environment.')
+
+    image_path = diagnosis.image.path
+    try:
+        content = Path(image_path).read_bytes()
+    except OSError:
+        raise PipelineError(f'Could not read image at {image_path}')
+    image = decode_for_inference(content, _input_size())
+    if image is None:
+        raise PipelineError(f'Could not read image at {image_path}')
+    return image
+
+
+def load_scan_bytes(diagnosis):
+    """Encoded bytes of the diagnosis' scan: the local file, else ``image_url`` via the image cache."""
+    if diagnosis.image and getattr(diagnosis.image, 'name', None):
+        try:
+            return Path(diagnosis.image.path).read_bytes()
+        except Exception as e:
+            print("Pipeline: error reading local image, falling back to URL:", e)
+
+    if diagnosis.image_url:
+        try:
+            return remote_image_cache.fetch(diagnosis.image_url)
+        except Exception as e:
+            raise PipelineError(f"Error fetching image from URL: {e}")
+
+    raise PipelineError("Diagnosis has no associated image file or URL")
+
+
+def check_quality(diagnosis, image):
+    """
+    Run the quality gate on a decoded scan and store its metrics on the
+    diagnosis. Raises ImageQualityError when a check fails and
+    AI_QUALITY_GATE is "enforce"; see quality.py.
+    """
+    mode = getattr(settings, 'AI_QUALITY_GATE', 'report')
+    if mode == 'off':
+        return
+    report = assess_quality(image)
+    diagnosis.quality_metrics = report.as_dict()
+    diagnosis.save(update_fields=['quality_metrics'])
+    if not report.passed and mode == 'enforce':
+        raise ImageQualityError(report)
+
+
+def save_artifacts(diagnosis, preprocessed, predictions, version, uncertainty=None):
+    artifact_store.save_preprocessed(diagnosis.id, preprocessed, version)
+    artifact_store.save_predictions(diagnosis.id, predictions, version)
+    if uncertainty is not None:
+        artifact_store.save_uncertainty(diagnosis.id, uncertainty, version)
+
+
+def stage_predictions(diagnosis):
+    """
+    Raw model output for the staged endpoints.
+
+    Loads the persisted prediction mask when an earlier stage produced it,
+    otherwise runs the model on the persisted preprocessed tensor, and only
+    falls back to reading the X-ray when neither artifact exists. Sets
+    ``diagnosis.model_version`` (unsaved) to the version that produced them.
+    """
+    model = model_loader.current
+    version = model_loader.result_version(model)
+    diagnosis.model_version = version
+    predictions = artifact_store.load_predictions(diagnosis.id, version)
+    if predictions is not None:
+        return predictions
+
+    # Tiled predictions come from the full-resolution scan, not the preprocessed tensor.
+    preprocessed = None if model_loader.tiling else artifact_store.load_preprocessed(diagnosis.id, version)
+    if preprocessed is not None:
+        # Same mode as infer(), so the result matches the "+tta" version it is saved under.
+        uncertainty = None
+        if model_loader.tta:
+            predictions, uncertainty = model_loader.predict_tta(preprocessed, model)
+        if predictions is None:
+            predictions = model_loader.predict(preprocessed, model=model)
+        predictions = np.asarray(predictions)
+        artifact_store.save_predictions(diagnosis.id, predictions, version)
+        if uncertainty is not None:
+            artifact_store.save_uncertainty(diagnosis.id, uncertainty, version)
+        return predictions
+
+    preprocessed, predictions, result = model_loader.infer(read_local_image(diagnosis))
+    diagnosis.model_version = result['model_version']
+    save_artifacts(diagnosis, preprocessed, predictions, result['model_version'], result.get('uncertainty_map'))
+    return predictions
+
+
+def _set_status(diagnosis, status):
+    diagnosis.status = status
+    diagnosis.save(update_fields=['status'])
+
+
+def process_diagnosis(diagnosis, content):
+    """
+    Run preprocessing, detection and classification for ``diagnosis``.
+
+    Status goes preprocessing -> detecting -> classifying -> completed.
+    Exceptions propagate; the caller decides how to record the failure.
+    Scans that fail the quality gate raise ImageQualityError before the
+    model runs.
+    """
+    _set_status(diagnosis, 'preprocessing')
+    img = decode_image(content)
+    check_quality(diagnosis, img)
+
+    _set_status(diagnosis, 'detecting')
+    preprocessed, predictions, result = model_loader.infer(img)
+    save_artifacts(diagnosis, preprocessed, predictions, result['model_version'], result.get('uncertainty_map'))
+
+    lesion_boxes = None
+    if result.get('analysis') is not None:
+        lesion_boxes = result['analysis'].boxes(threshold=0.5, min_area=100)
+
+    _set_status(diagnosis, 'classifying')
+    severity = result.get('severity')
+    confidence = result.get('confidence') or result.get('confidence_score') or 0.0
+
+    if 'affected_percentage' in result:
+        has_caries = result['affected_percentage'] >= 1
+    else:
+        has_caries = severity is not None and severity.lower() not in ['normal', 'class_0']
+
+    diagnosis.has_caries = bool(has_caries)
+    diagnosis.severity = severity or ''
+    diagnosis.confidence_score = float(confidence) if confidence is not None else None
+    diagnosis.lesion_boxes = lesion_boxes
+    diagnosis.model_version = result['model_version']
+    diagnosis.error_message = None
+    diagnosis.status = 'completed'
+    diagnosis.save()
+    return diagnosis
+
+
+def mark_failed(diagnosis, message):
+    diagnosis.status = 'failed'
+    diagnosis.error_message = message
+    diagnosis.save(update_fields=['status', 'error_message'])
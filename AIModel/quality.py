@@ -0,0 +1,127 @@
+"""
+AIModel/quality.py
+Pre-inference image quality gate.
+
+``assess_quality`` measures a decoded scan on a copy downsampled to at
+most AI_QUALITY_MAX_SIDE pixels: sharpness (variance of the Laplacian),
+contrast (grey-level standard deviation), the fractions of clipped black
+and white pixels, and colourfulness (mean channel difference; radiographs
+are grey). Every metric is one vectorized OpenCV/numpy reduction, so the
+gate costs a few milliseconds.
+
+AI_QUALITY_GATE selects what happens to a scan that fails a check:
+"report" (the default) only records the metrics and failed checks on the
+diagnosis, "enforce" marks the scan failed without running the model,
+and "off" skips the gate. Every threshold is an AI_QUALITY_* setting;
+an empty value disables that check. Calibrate them on real scans in
+report mode before enforcing.
+"""
+
+import numpy as np
+
+from django.conf import settings
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+class QualityReport:
+    def __init__(self, metrics, failures):
+        self.metrics = metrics
+        self.failures = failures
+
+    @property
+    def passed(self):
+        return not self.failures
+
+    @property
+    def message(self):
+        reasons = '; '.join(f['message'] for f in self.failures)
+        return f"Image quality check failed: {reasons}"
+
+    def as_dict(self):
+        return {'passed': self.passed, 'metrics': self.metrics, 'failures': self.failures}
+
+
+# check name -> (metric, setting, default, fails when the metric is "below"/"above" the limit, message)
+CHECKS = [
+    ('blurry', 'sharpness', 'AI_QUALITY_MIN_SHARPNESS', 15.0, 'below',
+     'image is too blurry'),
+    ('low_contrast', 'contrast', 'AI_QUALITY_MIN_CONTRAST', 8.0, 'below',
+     'image has almost no contrast'),
+    ('underexposed', 'dark_fraction', 'AI_QUALITY_MAX_DARK_FRACTION', 0.85, 'above',
+     'too many pixels are clipped to black'),
+    ('overexposed', 'bright_fraction', 'AI_QUALITY_MAX_BRIGHT_FRACTION', 0.3, 'above',
+     'too many pixels are clipped to white'),
+    ('not_radiograph', 'colorfulness', 'AI_QUALITY_MAX_COLORFULNESS', 12.0, 'above',
+     'image is in colour, not a grayscale radiograph'),
+]
+
+
+def _downsample(image, max_side):
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(int(width * scale), 1), max(int(height * scale), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def quality_metrics(image, max_side=512, dark_level=2, bright_level=253):
+    """
+    Metrics for an RGB or grayscale uint8 image; ``colorfulness`` is None for grayscale input.
+
+    Pixels at or below ``dark_level`` / at or above ``bright_level`` count as clipped.
+    """
+    if cv2 is None:
+        raise ImportError("OpenCV (cv2) is required.")
+
+    small = _downsample(np.asarray(image), max_side)
+    if small.ndim == 3:
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        channels = small.astype(np.int16)
+        colorfulness = float(
+            (np.abs(channels[..., 0] - channels[..., 1]) + np.abs(channels[..., 1] - channels[..., 2])).mean() / 2
+        )
+    else:
+        gray = small
+        colorfulness = None
+
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    total = gray.size
+    return {
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_32F).var()),
+        'contrast': float(gray.std()),
+        'dark_fraction': float(histogram[:dark_level + 1].sum() / total),
+        'bright_fraction': float(histogram[bright_level:].sum() / total),
+        'colorfulness': colorfulness,
+        'width': int(image.shape[1]),
+        'height': int(image.shape[0]),
+    }
+
+
+def assess_quality(image):
+    """QualityReport for a decoded scan against the AI_QUALITY_* thresholds."""
+    metrics = quality_metrics(
+        image,
+        max_side=getattr(settings, 'AI_QUALITY_MAX_SIDE', 512),
+        dark_level=getattr(settings, 'AI_QUALITY_DARK_LEVEL', 2),
+        bright_level=getattr(settings, 'AI_QUALITY_BRIGHT_LEVEL', 253),
+    )
+    failures = []
+    for check, metric, setting, default, direction, message in CHECKS:
+        value = metrics[metric]
+        limit = getattr(settings, setting, default)
+        if value is None or limit is None:
+            continue
+        if (value < limit) if direction == 'below' else (value > limit):
+            failures.append({
+                'check': check,
+                'metric': metric,
+                'value': round(value, 4),
+                'threshold': limit,
+                'message': f"{message} ({metric} {value:.3g} {'<' if direction == 'below' else '>'} {limit:g})",
+            })
+    return QualityReport(metrics, failures)
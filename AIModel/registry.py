@@ -0,0 +1,164 @@
+"""
+AIModel/registry.py
+Runtime side of the model registry.
+
+A LoadedModel bundles one version's weights with its inference backend.
+ModelLoader holds a single reference to the current bundle; requests grab
+that reference once and use it for preprocessing and prediction, so a hot
+swap (replacing the reference) never changes the model under a request
+that is already running. RegistryWatcher polls the active ModelVersion row
+and swaps to a new version only after it has been loaded and warmed up.
+"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+
+from django.db import close_old_connections
+
+from .backends import create_backend, import_tensorflow
+from .downloader import is_installed
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    """
+    One model version and its backend.
+
+    ``version`` may be None for the file-based default model, in which case
+    it is derived from the file's size and mtime. ``fetch`` is called with
+    the model path before loading (used to download the default model).
+    """
+
+    def __init__(self, version, model_path, backend_name='keras', sha256=None, fetch=None):
+        self._version = version
+        self.model_path = Path(model_path)
+        self.backend_name = backend_name
+        self.sha256 = sha256 or None
+        self.fetch = fetch
+        self._model = None
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        version = self._version
+        if not version:
+            version = self.model_path.name
+            if self.model_path.exists():
+                stat = self.model_path.stat()
+                version = f"{self.model_path.name}-{stat.st_size}-{int(stat.st_mtime)}"
+        return f"{version}/{self.backend_name}"
+
+    def load_model(self):
+        """The keras model for this version (backends and Grad-CAM build on it)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    tf = import_tensorflow()
+                    if tf is None:
+                        raise ImportError(
+                            "TensorFlow is not installed. Install tensorflow to use the AIModel features."
+                        )
+
+                    if self.fetch is not None:
+                        self.fetch(self.model_path)
+                    elif self.sha256 and not is_installed(self.model_path, self.sha256):
+                        raise FileNotFoundError(
+                            f"Model file at {self.model_path} is missing or fails its checksum"
+                        )
+
+                    if not self.model_path.exists():
+                        raise FileNotFoundError(f"Model file not found at {self.model_path}")
+
+                    print(f"Loading model from {self.model_path}")
+                    self._model = tf.keras.models.load_model(str(self.model_path), compile=False)
+                    print("Model loaded successfully")
+        return self._model
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_backend(self.backend_name, self)
+        return self._backend
+
+    @property
+    def input_shape(self):
+        return self.backend.input_shape
+
+
+def active_model_version():
+    """The active ModelVersion row, or None when the registry is empty or unavailable."""
+    from .models import ModelVersion
+    try:
+        return ModelVersion.objects.filter(is_active=True).first()
+    except Exception as e:
+        logger.debug("Model registry unavailable: %s", e)
+        return None
+
+
+def loaded_model_for(row, backend_name):
+    return LoadedModel(row.version, row.path, backend_name=backend_name, sha256=row.sha256)
+
+
+def validate_input_shape(row, model):
+    """Check the loaded model against the row's input shape, recording it if unset."""
+    shape = [d for d in model.input_shape[1:]]
+    if not row.input_shape:
+        row.input_shape = shape
+        row.save(update_fields=['input_shape'])
+    elif list(row.input_shape) != shape:
+        raise ValueError(
+            f"Model {row.version} has input shape {shape}, registry says {row.input_shape}"
+        )
+
+
+class RegistryWatcher:
+    """Background thread that hot-swaps ModelLoader to the active registry version."""
+
+    def __init__(self, loader, poll_interval=30.0):
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._failed_versions = set()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='model-registry-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def check_once(self):
+        row = active_model_version()
+        if row is None or row.version in self._failed_versions:
+            return False
+        if self.loader.current.version == f"{row.version}/{self.loader.backend_name}":
+            return False
+
+        start = time.time()
+        try:
+            model = loaded_model_for(row, self.loader.backend_name)
+            validate_input_shape(row, model)
+            self.loader.swap_to(model)
+        except Exception as e:
+            self._failed_versions.add(row.version)
+            logger.exception("Could not activate model version %s: %s", row.version, e)
+            return False
+        logger.info("Swapped to model version %s in %.1fs", row.version, time.time() - start)
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_interval):
+            close_old_connections()
+            try:
+                self.check_once()
+            except Exception as e:
+                logger.exception("Model registry poll failed: %s", e)
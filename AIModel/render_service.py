@@ -0,0 +1,252 @@
+"""
+AIModel/render_service.py
+Process pool that renders XAI reports away from the web workers.
+
+pyplot keeps global state that is not thread-safe, and figures that are
+not closed leak for the life of a gunicorn worker. ``render_service.run``
+sends a render job to one of AI_XAI_RENDER_WORKERS spawned processes and
+waits for the encoded image, so request threads never touch matplotlib.
+
+  * At most AI_XAI_RENDER_QUEUE_SIZE jobs wait for a free worker; beyond
+    that ``run`` raises RenderQueueFull instead of piling up requests.
+  * Each job gets AI_XAI_RENDER_TIMEOUT seconds to find a free worker
+    and as long again to render; a worker that overruns is killed and
+    replaced.
+  * A worker retires itself after AI_XAI_RENDER_MAX_RENDERS jobs or once
+    its RSS passes AI_XAI_RENDER_MAX_RSS_MB, and a fresh one takes its
+    place.
+
+With AI_XAI_RENDER_WORKERS=0 jobs run inline in the calling thread.
+Grad-CAM needs the model, so callers compute it first and pass the
+heatmap in; workers only decode, draw and encode.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderQueueFull(RenderError):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+def render_report(content, predictions, severity_result, gradcam, quality, image_format, level):
+    """
+    Render job: the explanation report for one scan as an EncodedImage.
+
+    ``content`` is the encoded scan; ``quality`` is "fast" (OpenCV) or
+    "high" (matplotlib).
+    """
+    from .decoding import decode_full
+    from .image_writer import encode_figure, encode_image
+    from .report_renderer import render_explanation
+    from .xai_visualizer import XAIVisualizer, _pyplot
+
+    original_image = decode_full(content)
+    if original_image is None:
+        raise ValueError("Could not decode image")
+
+    xai = XAIVisualizer(None)
+    report_args = dict(
+        original_image=original_image,
+        preprocessed_image=None,
+        segmentation_mask=predictions,
+        severity_result=severity_result,
+        analysis=severity_result.get('analysis'),
+        gradcam=gradcam,
+    )
+    if quality != 'high':
+        return encode_image(render_explanation(xai, **report_args).image, image_format, level)
+
+    plt = _pyplot()
+    fig = xai.create_explanation_report(**report_args)
+    try:
+        return encode_figure(fig, image_format, level)
+    finally:
+        plt.close(fig)
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where it cannot be measured."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # Peak rather than current RSS, in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _over_rss_limit(max_rss_bytes):
+    if not max_rss_bytes:
+        return False
+    rss = _rss_bytes()
+    return rss is not None and rss > max_rss_bytes
+
+
+def _worker_main(conn, max_renders, max_rss_bytes):
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        import django
+        django.setup()
+
+    renders = 0
+    while True:
+        try:
+            func, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, func(*args, **kwargs))
+        except Exception as e:
+            reply = (False, e)
+
+        renders += 1
+        retiring = renders >= max_renders or _over_rss_limit(max_rss_bytes)
+        try:
+            conn.send((*reply, retiring))
+        except Exception as e:
+            # The result or exception did not pickle.
+            conn.send((False, RenderError(f"{type(e).__name__}: {e}"), retiring))
+        if retiring:
+            return
+
+
+class _Worker:
+    def __init__(self, context, max_renders, max_rss_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, max_renders, max_rss_bytes),
+            name='xai-render', daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.alive = True
+
+    def run(self, func, args, kwargs, timeout):
+        try:
+            self.conn.send((func, args, kwargs))
+            if not self.conn.poll(timeout):
+                self.stop()
+                raise RenderTimeout(f"XAI render did not finish within {timeout:g}s")
+            ok, value, retiring = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.stop()
+            raise RenderError(f"XAI render worker exited unexpectedly: {e}")
+
+        if retiring:
+            self.alive = False
+            self.process.join(timeout=5)
+            self.conn.close()
+        if not ok:
+            raise value
+        return value
+
+    def stop(self):
+        self.alive = False
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class RenderService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._slots = None
+
+    @property
+    def workers(self):
+        return getattr(settings, 'AI_XAI_RENDER_WORKERS', 2)
+
+    @property
+    def queue_size(self):
+        return getattr(settings, 'AI_XAI_RENDER_QUEUE_SIZE', 8)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'AI_XAI_RENDER_TIMEOUT', 60)
+
+    def _spawn(self):
+        # Spawned, not forked: the parent may hold TensorFlow threads and locks.
+        return _Worker(
+            multiprocessing.get_context('spawn'),
+            max(getattr(settings, 'AI_XAI_RENDER_MAX_RENDERS', 50), 1),
+            int(getattr(settings, 'AI_XAI_RENDER_MAX_RSS_MB', 1024) * 1024 * 1024),
+        )
+
+    def _ensure_started(self):
+        # Per process: a forked gunicorn worker starts its own pool.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._idle = queue.Queue()
+            for _ in range(self.workers):
+                self._idle.put(self._spawn())
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+            self._pid = os.getpid()
+            logger.info("Started %d XAI render workers", self.workers)
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` in a render worker and return its
+        result. ``func`` must be a module-level function and its arguments
+        and result picklable; its exceptions are re-raised here.
+        """
+        if self.workers <= 0:
+            return func(*args, **kwargs)
+
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull("Too many XAI renders are queued; try again shortly")
+        try:
+            try:
+                worker = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RenderTimeout(f"No XAI render worker became free within {self.timeout:g}s")
+            try:
+                return worker.run(func, args, kwargs, self.timeout)
+            finally:
+                if not worker.alive:
+                    worker = self._spawn()
+                self._idle.put(worker)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+            self._pid = None
+
+
+render_service = RenderService()
@@ -0,0 +1,194 @@
+"""
+AIModel/report_renderer.py
+OpenCV renderer for the six-panel XAI explanation report.
+
+Draws the same panels as XAIVisualizer.create_explanation_report
+(original, probability heatmap, overlay, Grad-CAM, binary mask or
+confidence gauge, statistics) straight into one preallocated uint8 canvas
+with OpenCV primitives. Every panel is computed at panel resolution, so a
+report costs a few resizes and one encode instead of a matplotlib figure
+rendered at 150 dpi. The matplotlib report stays available as the
+high-quality mode.
+"""
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+BACKGROUND = (15, 23, 42)
+PANEL = (30, 41, 59)
+BORDER = (51, 65, 85)
+WHITE = (255, 255, 255)
+TEXT = (226, 232, 240)
+MUTED = (148, 163, 184)
+RED = (239, 68, 68)
+BAR_COLORS = [(34, 197, 94), (234, 179, 8), (249, 115, 22), (239, 68, 68)]
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX if cv2 is not None else None
+
+
+class ReportCanvas:
+    """A grid of titled panels on one RGB uint8 canvas."""
+
+    def __init__(self, rows=2, cols=3, panel_size=(480, 400), header=56, title=30, margin=12):
+        self.panel_w, self.panel_h = panel_size
+        self.header = header
+        self.title = title
+        self.margin = margin
+        width = cols * self.panel_w + (cols + 1) * margin
+        height = header + rows * (self.panel_h + title) + (rows + 1) * margin
+        self.image = np.empty((height, width, 3), dtype=np.uint8)
+        self.image[:] = BACKGROUND
+
+    def heading(self, text):
+        size = cv2.getTextSize(text, FONT, 0.9, 2)[0]
+        x = (self.image.shape[1] - size[0]) // 2
+        cv2.putText(self.image, text, (x, self.header - 16), FONT, 0.9, WHITE, 2, cv2.LINE_AA)
+
+    def panel(self, row, col, title):
+        """Draw an empty panel with ``title``; returns its body as ``(x, y, w, h)``."""
+        x = self.margin + col * (self.panel_w + self.margin)
+        y = self.header + self.margin + row * (self.panel_h + self.title + self.margin)
+        cv2.rectangle(self.image, (x, y), (x + self.panel_w, y + self.title + self.panel_h), PANEL, -1)
+        cv2.rectangle(self.image, (x, y), (x + self.panel_w, y + self.title + self.panel_h), BORDER, 2)
+        self._fit_text(title, x + 8, y + 20, self.panel_w - 16, 0.5, WHITE)
+        return x + 4, y + self.title, self.panel_w - 8, self.panel_h - 4
+
+    def _fit_text(self, text, x, y, max_width, scale, color, thickness=1):
+        while scale > 0.3 and cv2.getTextSize(text, FONT, scale, thickness)[0][0] > max_width:
+            scale -= 0.05
+        cv2.putText(self.image, text, (x, y), FONT, scale, color, thickness, cv2.LINE_AA)
+
+    def place(self, body, image, interpolation=None):
+        """Letterbox ``image`` (RGB or 2-D) into ``body``; returns the placed rect."""
+        x, y, w, h = body
+        image = fit_image(image, w, h, interpolation)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        ih, iw = image.shape[:2]
+        ox, oy = x + (w - iw) // 2, y + (h - ih) // 2
+        self.image[oy:oy + ih, ox:ox + iw] = image
+        return ox, oy, iw, ih
+
+    def text_lines(self, body, text, scale=0.45, color=TEXT, line_height=20):
+        x, y, w, h = body
+        for i, line in enumerate(text.split('\n')):
+            baseline = y + 18 + i * line_height
+            if baseline > y + h:
+                break
+            if line:
+                self._fit_text(line, x + 10, baseline, w - 20, scale, color)
+
+
+def fit_image(image, width, height, interpolation=None):
+    """Resize ``image`` to fit ``width`` x ``height`` keeping its aspect ratio."""
+    ih, iw = image.shape[:2]
+    scale = min(width / iw, height / ih)
+    size = (max(int(iw * scale), 1), max(int(ih * scale), 1))
+    if interpolation is None:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    if image.dtype != np.uint8:
+        image = (np.clip(image, 0, 1) * 255).astype(np.uint8) if image.max() <= 1 else image.astype(np.uint8)
+    return cv2.resize(image, size, interpolation=interpolation)
+
+
+def _heatmap_panel(canvas, body, analysis):
+    x, y, w, h = body
+    scale = analysis.max_probability or 1
+    normalized = np.clip(analysis.mask / scale, 0, 1)
+    colored = cv2.applyColorMap((normalized * 255).astype(np.uint8), cv2.COLORMAP_HOT)
+    colored = cv2.cvtColor(colored, cv2.COLOR_BGR2RGB)
+    canvas.place((x, y, w - 56, h), colored, cv2.INTER_LINEAR)
+
+    # Colour bar from 0 to the mask's peak, like the matplotlib colorbar.
+    bar_x, bar_top, bar_h = x + w - 44, y + 10, h - 20
+    ramp = np.linspace(255, 0, bar_h).astype(np.uint8)[:, None]
+    ramp = cv2.cvtColor(cv2.applyColorMap(np.repeat(ramp, 12, axis=1), cv2.COLORMAP_HOT), cv2.COLOR_BGR2RGB)
+    canvas.image[bar_top:bar_top + bar_h, bar_x:bar_x + 12] = ramp
+    cv2.putText(canvas.image, f'{scale:.2f}', (bar_x + 14, bar_top + 10), FONT, 0.35, MUTED, 1, cv2.LINE_AA)
+    cv2.putText(canvas.image, '0', (bar_x + 14, bar_top + bar_h), FONT, 0.35, MUTED, 1, cv2.LINE_AA)
+
+
+def _probability_panel(canvas, body, probs):
+    x, y, w, h = body
+    labels = ['Deep', 'Healthy', 'Moderate'][:len(probs)]
+    label_w, bar_w = 90, w - 160
+    row_h = min(60, h // max(len(probs), 1))
+    for i, (label, value) in enumerate(zip(labels, probs)):
+        top = y + 20 + i * row_h
+        cv2.putText(canvas.image, label, (x + 10, top + row_h // 2), FONT, 0.45, MUTED, 1, cv2.LINE_AA)
+        length = int(bar_w * min(max(value, 0), 100) / 100)
+        cv2.rectangle(canvas.image, (x + label_w, top + 8), (x + label_w + length, top + row_h - 8),
+                      BAR_COLORS[i % len(BAR_COLORS)], -1)
+        cv2.putText(canvas.image, f'{value:.1f}%', (x + label_w + length + 6, top + row_h // 2),
+                    FONT, 0.45, WHITE, 1, cv2.LINE_AA)
+
+
+def _gauge_panel(canvas, body, confidence):
+    x, y, w, h = body
+    radius = min(w // 2 - 30, h - 110)
+    center = (x + w // 2, y + radius + 30)
+    cv2.ellipse(canvas.image, center, (radius, radius), 0, 180, 360, BORDER, 10, cv2.LINE_AA)
+    angle = np.pi * (1 - confidence / 100)
+    tip = (int(center[0] + np.cos(angle) * radius * 0.8), int(center[1] - np.sin(angle) * radius * 0.8))
+    cv2.arrowedLine(canvas.image, center, tip, RED, 3, cv2.LINE_AA, tipLength=0.12)
+    label = f'{confidence:.1f}%'
+    size = cv2.getTextSize(label, FONT, 0.9, 2)[0]
+    cv2.putText(canvas.image, label, (center[0] - size[0] // 2, center[1] + 40), FONT, 0.9, WHITE, 2, cv2.LINE_AA)
+    size = cv2.getTextSize('Confidence', FONT, 0.5, 1)[0]
+    cv2.putText(canvas.image, 'Confidence', (center[0] - size[0] // 2, center[1] + 66), FONT, 0.5, MUTED, 1,
+                cv2.LINE_AA)
+
+
+def render_explanation(xai, original_image, preprocessed_image, segmentation_mask, severity_result,
+                       analysis=None, gradcam=None, panel_size=(480, 400)):
+    """
+    Draw the explanation report for ``xai``'s model onto a new ReportCanvas.
+
+    Takes the same arguments as XAIVisualizer.create_explanation_report;
+    ``canvas.image`` is the RGB report.
+    """
+    if cv2 is None:
+        raise ImportError('OpenCV (cv2) is required to render XAI reports')
+
+    is_segmentation = xai._is_segmentation_model(segmentation_mask)
+    if is_segmentation:
+        analysis = xai._analysis(segmentation_mask, analysis)
+    summary = xai.report_summary(severity_result, analysis if is_segmentation else None)
+
+    canvas = ReportCanvas(panel_size=panel_size)
+    canvas.heading('Explainable AI - Dental Caries Detection')
+    # Every image panel is drawn from this panel-sized copy, never the full-resolution scan.
+    thumb = fit_image(original_image, *panel_size)
+
+    canvas.place(canvas.panel(0, 0, 'Original Peri-apical X-ray'), thumb)
+
+    if is_segmentation:
+        _heatmap_panel(canvas, canvas.panel(0, 1, 'Probability Heatmap (raw model output)'), analysis)
+        overlay, _ = xai.visualize_segmentation_overlay(thumb, segmentation_mask, analysis=analysis)
+    else:
+        probs = severity_result.get('all_probabilities', [summary['confidence']])
+        _probability_panel(canvas, canvas.panel(0, 1, 'Class Probabilities'), probs)
+        overlay = xai.severity_tint(thumb, summary['severity'])
+    canvas.place(canvas.panel(0, 2, summary['overlay_title']), overlay)
+
+    try:
+        if gradcam is None:
+            gradcam = xai.generate_gradcam(preprocessed_image)
+        body = canvas.panel(1, 0, 'Grad-CAM - Model Focus Areas')
+        canvas.place(body, xai.overlay_heatmap(gradcam, thumb))
+    except Exception as e:
+        body = canvas.panel(1, 0, 'Grad-CAM')
+        canvas.text_lines(body, f'Grad-CAM unavailable:\n{e}', color=MUTED)
+
+    if is_segmentation:
+        body = canvas.panel(1, 1, f"Binary Mask  (adaptive threshold = {summary['threshold']:.3f})")
+        canvas.place(body, analysis.binary_mask.astype(np.uint8) * 255, cv2.INTER_NEAREST)
+    else:
+        _gauge_panel(canvas, canvas.panel(1, 1, 'Model Confidence'), summary['confidence'])
+
+    canvas.text_lines(canvas.panel(1, 2, 'Detection Statistics'), summary['stats_text'])
+    return canvas
@@ -0,0 +1,231 @@
+"""
+AIModel/storage.py
+Object storage for uploaded scans and generated XAI images.
+
+``get_storage()`` returns the backend selected by AI_STORAGE_BACKEND:
+
+- ``SupabaseStorage`` talks to the Supabase Storage REST API through one
+  ``requests.Session`` with a keep-alive connection pool and retries with
+  backoff, so uploads and downloads reuse TLS connections instead of
+  opening a new one per call.
+- ``FileSystemStorage`` keeps objects under a local directory and serves
+  them from MEDIA_URL; benchmarks and tests use it to run without network.
+
+Both offer put/get/get_public_url/delete, batch variants of each, and
+``fetch`` for absolute URLs (used to revalidate cached remote images).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+
+class StorageError(Exception):
+    """A storage request failed; ``status`` is the HTTP status when there was one."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class Storage:
+    """Base class; subclasses implement the single-object operations."""
+
+    max_workers = 4
+
+    def put(self, path, content, content_type='application/octet-stream', upsert=False):
+        raise NotImplementedError
+
+    def get(self, path):
+        raise NotImplementedError
+
+    def get_public_url(self, path):
+        raise NotImplementedError
+
+    def delete(self, path):
+        self.delete_many([path])
+
+    def delete_many(self, paths):
+        raise NotImplementedError
+
+    def fetch(self, url, headers=None, timeout=None):
+        """GET an absolute URL; returns ``(status, body, headers)`` for 2xx and 304."""
+        raise NotImplementedError
+
+    def put_many(self, items, upsert=False):
+        """Upload ``(path, content, content_type)`` items concurrently; returns their public URLs."""
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=max(min(self.max_workers, len(items)), 1)) as pool:
+            list(pool.map(lambda item: self.put(*item, upsert=upsert), items))
+        return [self.get_public_url(path) for path, _, _ in items]
+
+    def get_many(self, paths):
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=max(min(self.max_workers, len(paths)), 1)) as pool:
+            return list(pool.map(self.get, paths))
+
+
+class SupabaseStorage(Storage):
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, url, key, bucket, timeout=30.0, retries=3, pool_size=10):
+        if requests is None:
+            raise ImproperlyConfigured("requests is required for the Supabase storage backend")
+        if not url or not key:
+            raise ImproperlyConfigured("SUPABASE_URL and SUPABASE_KEY must be set for Supabase storage")
+
+        self.base_url = f"{url.rstrip('/')}/storage/v1"
+        self.bucket = bucket
+        self.timeout = timeout
+        self.max_workers = pool_size
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=self.RETRY_STATUSES,
+            # Not POST: uploads use x-upsert: false, so retrying one the server
+            # already stored would fail with 409.
+            allowed_methods=frozenset({'GET', 'HEAD', 'PUT', 'DELETE'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Authorization': f'Bearer {key}', 'apikey': key})
+
+    def _object_url(self, path):
+        return f"{self.base_url}/object/{self.bucket}/{quote(path)}"
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise StorageError(f"{method} {url} failed: {e}")
+        if response.status_code >= 400:
+            raise StorageError(
+                f"{method} {url} returned {response.status_code}: {response.text[:200]}",
+                status=response.status_code,
+            )
+        return response
+
+    def put(self, path, content, content_type='application/octet-stream', upsert=False):
+        self._request('POST', self._object_url(path), data=content, headers={
+            'Content-Type': content_type,
+            'x-upsert': 'true' if upsert else 'false',
+        })
+
+    def get(self, path):
+        return self._request('GET', self._object_url(path)).content
+
+    def get_public_url(self, path):
+        return f"{self.base_url}/object/public/{self.bucket}/{quote(path)}"
+
+    def delete_many(self, paths):
+        paths = list(paths)
+        if paths:
+            self._request('DELETE', f"{self.base_url}/object/{self.bucket}", json={'prefixes': paths})
+
+    def fetch(self, url, headers=None, timeout=None):
+        headers = dict(headers or {})
+        if not url.startswith(self.base_url):
+            # Never send the service key to another host.
+            headers.update({'Authorization': None, 'apikey': None})
+        response = self._request('GET', url, timeout=timeout, headers=headers)
+        return response.status_code, response.content, response.headers
+
+
+class FileSystemStorage(Storage):
+    def __init__(self, root, base_url):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, path):
+        full = (self.root / path).resolve()
+        if self.root.resolve() not in full.parents:
+            raise StorageError(f"Invalid storage path {path!r}")
+        return full
+
+    def put(self, path, content, content_type='application/octet-stream', upsert=False):
+        target = self._path(path)
+        if target.exists() and not upsert:
+            raise StorageError(f"{path} already exists", status=409)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, target)
+
+    def get(self, path):
+        try:
+            return self._path(path).read_bytes()
+        except FileNotFoundError:
+            raise StorageError(f"{path} not found", status=404)
+
+    def get_public_url(self, path):
+        return f"{self.base_url}/{quote(path)}"
+
+    def delete_many(self, paths):
+        for path in paths:
+            self._path(path).unlink(missing_ok=True)
+
+    def fetch(self, url, headers=None, timeout=None):
+        prefix = f"{self.base_url}/"
+        if url.startswith(prefix):
+            return 200, self.get(unquote(url[len(prefix):])), {}
+        if requests is None:
+            raise StorageError(f"{url} is not served by this storage")
+
+        try:
+            response = requests.get(url, headers=headers, timeout=timeout or 30)
+        except requests.RequestException as e:
+            raise StorageError(f"GET {url} failed: {e}")
+        if response.status_code >= 400:
+            raise StorageError(f"GET {url} returned {response.status_code}", status=response.status_code)
+        return response.status_code, response.content, response.headers
+
+
+_storage = None
+_storage_pid = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(name=None):
+    name = name or getattr(settings, 'AI_STORAGE_BACKEND', 'supabase')
+    if name == 'supabase':
+        return SupabaseStorage(
+            settings.SUPABASE_URL,
+            settings.SUPABASE_KEY,
+            bucket=getattr(settings, 'AI_STORAGE_BUCKET', 'images'),
+            timeout=getattr(settings, 'AI_STORAGE_TIMEOUT', 30.0),
+            retries=getattr(settings, 'AI_STORAGE_RETRIES', 3),
+            pool_size=getattr(settings, 'AI_STORAGE_POOL_SIZE', 10),
+        )
+    if name == 'filesystem':
+        root = getattr(settings, 'AI_STORAGE_ROOT', None) or Path(settings.MEDIA_ROOT) / 'storage'
+        return FileSystemStorage(root, f"{settings.MEDIA_URL.rstrip('/')}/storage")
+    raise ImproperlyConfigured(
+        f"Unknown AI_STORAGE_BACKEND '{name}'. Expected 'supabase' or 'filesystem'."
+    )
+
+
+def get_storage():
+    """The process-wide storage backend (one connection pool per process)."""
+    global _storage, _storage_pid
+    if _storage is None or _storage_pid != os.getpid():
+        with _storage_lock:
+            if _storage is None or _storage_pid != os.getpid():
+                _storage = create_storage()
+                _storage_pid = os.getpid()
+    return _storage
@@ -1,7 +0,0 @@
-from supabase import create_client
-from django.conf import settings
-
-supabase = create_client(
-    settings.SUPABASE_URL,
-    settings.SUPABASE_KEY
-)
@@ -1,3 +1,1079 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import operator
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from dashboard.models import Patient
+
+from .augmentation import VARIANTS, build_variants, predict_tta, realign
+from .backends import InferenceBackend
+from .image_cache import RemoteImageCache
+from .batching import MicroBatcher
+from .cascade import cascade_metrics, is_confidently_healthy
+from . import downloader, jobs, pipeline, registry
+from .artifacts import ArtifactStore
+from .decoding import decode_flag, decode_for_inference, reduction_factor
+from .dedup import content_sha256, find_exact_duplicate, find_near_duplicate, hamming_distances, perceptual_hash
+from .lesions import extract_lesions, extract_lesions_batch
+from .model_loader import InferenceCache, ModelLoader, model_loader
+from .models import DiagnosisJob, DiagnosisResult, ModelVersion
+from .registry import LoadedModel, RegistryWatcher
+from .storage import FileSystemStorage, StorageError
+from .quality import assess_quality, quality_metrics
+from . import render_service as render_module
+from .render_service import RenderService
+from .tiling import predict_tiled, tile_grid
+
+
+def _mask(seed=0, shape=(32, 32)):
+    rng = np.random.default_rng(seed)
+    return rng.random((1, *shape, 1)).astype(np.float32)
+
+
+class InferenceCacheTests(SimpleTestCase):
+    def _result(self, predictions):
+        result = model_loader.classify_severity(predictions)
+        result['model_version'] = 'v1'
+        return result
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = InferenceCache(max_entries=2)
+        for name in ('a', 'b'):
+            cache.put(name, _mask(), self._result(_mask()))
+        self.assertIsNotNone(cache.get('a'))
+
+        cache.put('c', _mask(), self._result(_mask()))
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_key_depends_on_model_version(self):
+        self.assertNotEqual(InferenceCache.make_key('abc', 'v1'), InferenceCache.make_key('abc', 'v2'))
+        self.assertEqual(InferenceCache.make_key('abc', 'v1'), InferenceCache.make_key('abc', 'v1'))
+
+    def test_disk_round_trip(self):
+        predictions = _mask(1)
+        result = self._result(predictions)
+        result['uncertainty_map'] = np.full((32, 32), 0.25, dtype=np.float32)
+        key = InferenceCache.make_key('scan', 'v1')
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            InferenceCache(cache_dir=cache_dir).put(key, predictions, result)
+            # A fresh instance (another worker) only has the disk tier.
+            cached = InferenceCache(cache_dir=cache_dir).get(key)
+            missing = InferenceCache(cache_dir=cache_dir).get(InferenceCache.make_key('scan', 'v2'))
+
+        self.assertIsNone(missing)
+        cached_predictions, cached_result = cached
+        np.testing.assert_array_equal(cached_predictions, predictions)
+        self.assertFalse(cached_predictions.flags.writeable)
+        for field in ('severity', 'confidence', 'affected_percentage', 'model_version'):
+            self.assertEqual(cached_result[field], result[field])
+        np.testing.assert_array_equal(cached_result['segmentation_mask'], predictions[0, :, :, 0])
+        np.testing.assert_array_equal(cached_result['uncertainty_map'], result['uncertainty_map'])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def _submit_concurrently(self, batcher, requests):
+        results = [None] * len(requests)
+        start = threading.Barrier(len(requests))
+
+        def submit(i, batch, key):
+            start.wait()
+            results[i] = batcher.submit(batch, key=key)
+
+        threads = [threading.Thread(target=submit, args=(i, *r)) for i, r in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        return results
+
+    def test_each_caller_gets_its_own_slice(self):
+        calls = []
+
+        def forward(batch, key):
+            calls.append(len(batch))
+            return batch * 2
+
+        batcher = MicroBatcher(forward, max_batch_size=8, max_wait_ms=200)
+        inputs = [np.full((1, 4, 4, 1), i, dtype=np.float32) for i in range(4)]
+        results = self._submit_concurrently(batcher, [(x, 'v1') for x in inputs])
+
+        for x, result in zip(inputs, results):
+            np.testing.assert_array_equal(result, x * 2)
+        self.assertEqual(sum(calls), 4)
+        self.assertLess(len(calls), 4)
+
+    def test_model_versions_are_never_batched_together(self):
+        calls = []
+
+        def forward(batch, key):
+            calls.append((key, batch[:, 0, 0, 0].tolist()))
+            return batch + (100 if key == 'v2' else 0)
+
+        batcher = MicroBatcher(forward, max_batch_size=8, max_wait_ms=200)
+        requests = [(np.full((1, 2, 2, 1), i, dtype=np.float32), 'v1' if i % 2 else 'v2') for i in range(6)]
+        results = self._submit_concurrently(batcher, requests)
+
+        for (x, key), result in zip(requests, results):
+            np.testing.assert_array_equal(result, x + (100 if key == 'v2' else 0))
+        for key, values in calls:
+            self.assertTrue(all((int(v) % 2 == 1) == (key == 'v1') for v in values))
+
+    def test_forward_error_reaches_every_caller(self):
+        def forward(batch, key):
+            raise ValueError('boom')
+
+        batcher = MicroBatcher(forward, max_wait_ms=0)
+        with self.assertRaises(ValueError):
+            batcher.submit(np.zeros((1, 2, 2, 1), dtype=np.float32))
+
+
+def _lesion_masks():
+    """Masks with no lesion, one lesion and several lesions of different strength."""
+    masks = np.zeros((3, 64, 64, 1), dtype=np.float32)
+    masks[0] += 0.01
+    masks[1, 10:30, 10:30] = 0.9
+    masks[2, 5:20, 5:25] = 0.7
+    masks[2, 40:60, 30:62] = 0.4
+    masks[2, 2:4, 50:52] = 0.95
+    noise = np.random.default_rng(3).random(masks.shape).astype(np.float32) * 0.05
+    return masks + noise
+
+
+def _reference_severity(mask):
+    """The single-image classify_severity arithmetic the batch path replaced."""
+    max_prob = float(mask.max())
+    mean_prob = float(mask.mean())
+    affected = np.sum(mask > max(0.5 * max_prob, 0.05)) / mask.size * 100
+    if affected < 1:
+        return 'Healthy', min((1 - mean_prob) * 100, 100.0), affected
+    return ('Moderate' if affected < 5 else 'Deep'), min(mean_prob * 100, 100.0), affected
+
+
+class BatchClassificationTests(SimpleTestCase):
+    def test_severity_batch_matches_single_image_path(self):
+        masks = _lesion_masks()
+        batch = model_loader.classify_severity_batch(masks)
+
+        for i, result in enumerate(batch):
+            severity, confidence, affected = _reference_severity(masks[i, :, :, 0])
+            self.assertEqual(result['severity'], severity)
+            self.assertAlmostEqual(result['confidence'], confidence, places=4)
+            self.assertAlmostEqual(result['affected_percentage'], affected, places=4)
+
+            single = model_loader.classify_severity(masks[i:i + 1])
+            for field in ('severity', 'confidence', 'affected_percentage', 'mean_probability', 'max_probability'):
+                self.assertEqual(result[field], single[field])
+
+    def test_severity_batch_for_classifier_output(self):
+        probabilities = np.array([[0.7, 0.2, 0.1], [0.1, 0.3, 0.6]], dtype=np.float32)
+        batch = model_loader.classify_severity_batch(probabilities)
+
+        self.assertEqual([r['severity'] for r in batch], ['Healthy', 'Deep'])
+        for row, result in zip(probabilities, batch):
+            self.assertAlmostEqual(result['confidence'], float(row.max()) * 100, places=4)
+            self.assertEqual(result, model_loader.classify_severity(row[None]))
+
+    def test_lesion_batch_matches_single_mask_extraction(self):
+        masks = _lesion_masks()
+        thresholds = [0.5, 0.3, 0.2]
+        batch = extract_lesions_batch(masks, threshold=thresholds, min_area=10, polygons=True)
+
+        self.assertEqual(batch[0], [])
+        self.assertEqual(len(batch[2]), 2)
+        for mask, threshold, lesions in zip(masks, thresholds, batch):
+            self.assertEqual(lesions, extract_lesions(mask[..., 0], threshold=threshold, min_area=10, polygons=True))
+
+
+class TilingTests(SimpleTestCase):
+    @staticmethod
+    def _first_channel(batch):
+        """A "model" that returns its first input channel as the mask."""
+        return batch[..., :1] / 255.0
+
+    def _assert_reconstructs(self, image, tile_size=(64, 64), **kwargs):
+        calls = []
+
+        def predict(batch):
+            calls.append(len(batch))
+            return self._first_channel(batch)
+
+        mask = predict_tiled(image, predict, tile_size, **kwargs)
+        expected = (image if image.ndim == 2 else image[..., 0]) / 255.0
+        self.assertEqual(mask.shape, (1, *image.shape[:2], 1))
+        np.testing.assert_allclose(mask[0, :, :, 0], expected, atol=1e-5)
+        return calls
+
+    def test_identity_model_is_reconstructed(self):
+        image = np.random.default_rng(0).integers(0, 256, (150, 230, 3), dtype=np.uint8)
+        calls = self._assert_reconstructs(image, overlap=0.25, max_tiles_per_batch=4)
+
+        self.assertEqual(sum(calls), len(tile_grid(150, 230, (64, 64), 0.25)))
+        self.assertLessEqual(max(calls), 4)
+
+    def test_small_and_grayscale_images_are_padded_and_cropped(self):
+        rng = np.random.default_rng(1)
+        self._assert_reconstructs(rng.integers(0, 256, (40, 50, 3), dtype=np.uint8))
+        self._assert_reconstructs(rng.integers(0, 256, (40, 130), dtype=np.uint8))
+
+    def test_tiles_cover_the_image_edges(self):
+        origins = tile_grid(150, 230, (64, 64), 0.25)
+        self.assertEqual(origins[:, 0].max() + 64, 150)
+        self.assertEqual(origins[:, 1].max() + 64, 230)
+
+    def test_classifier_output_returns_none(self):
+        image = np.zeros((100, 100, 3), dtype=np.uint8)
+        self.assertIsNone(predict_tiled(image, lambda batch: np.zeros((len(batch), 3)), (64, 64)))
+
+
+class TestTimeAugmentationTests(SimpleTestCase):
+    def setUp(self):
+        self.image = np.random.default_rng(2).random((1, 48, 40, 3)).astype(np.float32)
+
+    def test_variants_are_flipped_and_shifted_copies(self):
+        variants = build_variants(self.image, shift=4)
+        original = self.image[0]
+
+        self.assertEqual(variants.shape, (len(VARIANTS), 48, 40, 3))
+        np.testing.assert_array_equal(variants[0], original)
+        np.testing.assert_array_equal(variants[1], original[:, ::-1])
+        # (False, 1, 0): content moves down by the shift, edge rows repeat at the top.
+        np.testing.assert_array_equal(variants[2, 4:], original[:-4])
+        np.testing.assert_array_equal(variants[2, :4], np.repeat(original[:1], 4, axis=0))
+        np.testing.assert_array_equal(variants[5, :, :-4], original[:, 4:])
+
+    def test_realign_inverts_every_variant(self):
+        variants = build_variants(self.image, shift=4)
+        mean, variance = realign(variants[..., :1], shift=4)
+
+        np.testing.assert_allclose(mean, self.image[0, :, :, 0], atol=1e-6)
+        np.testing.assert_allclose(variance, 0, atol=1e-10)
+
+    def test_predict_tta_runs_one_batch_and_reports_disagreement(self):
+        calls = []
+
+        def predict(batch):
+            calls.append(len(batch))
+            masks = batch[..., :1].copy()
+            masks[1] += 0.5  # The flipped variant disagrees everywhere.
+            return masks
+
+        mean, variance = predict_tta(self.image, predict, shift=4)
+
+        self.assertEqual(calls, [len(VARIANTS)])
+        self.assertEqual(mean.shape, (1, 48, 40, 1))
+        self.assertEqual(variance.shape, (48, 40))
+        self.assertTrue(np.all(variance > 0))
+        self.assertTrue(np.all(mean[0, :, :, 0] > self.image[0, :, :, 0]))
+
+    def test_classifier_output_is_not_augmented(self):
+        self.assertEqual(predict_tta(self.image, lambda batch: np.zeros((len(batch), 3)), shift=4), (None, None))
+
+
+def _radiograph(seed=0, size=(480, 640)):
+    """Smooth grayscale test image with large-scale structure, as an RGB array."""
+    coarse = np.random.default_rng(seed).integers(0, 256, (12, 16), dtype=np.uint8)
+    image = cv2.GaussianBlur(cv2.resize(coarse, size[::-1], interpolation=cv2.INTER_CUBIC), (21, 21), 0)
+    return np.dstack([image] * 3)
+
+
+def _encode(image, ext='.jpg', params=()):
+    return cv2.imencode(ext, image, list(params))[1].tobytes()
+
+
+class PerceptualHashTests(SimpleTestCase):
+    def test_hash_survives_reencoding_and_resizing(self):
+        image = _radiograph()
+        reference = perceptual_hash(_encode(image, params=[cv2.IMWRITE_JPEG_QUALITY, 95]))
+        copies = [
+            _encode(image, params=[cv2.IMWRITE_JPEG_QUALITY, 60]),
+            _encode(image, '.png'),
+            _encode(cv2.resize(image, (320, 240), interpolation=cv2.INTER_AREA)),
+        ]
+
+        self.assertEqual(len(reference), 16)
+        distances = hamming_distances(reference, [perceptual_hash(c) for c in copies])
+        self.assertTrue(np.all(distances <= 8), distances)
+
+    def test_different_images_are_far_apart(self):
+        reference = perceptual_hash(_encode(_radiograph(0)))
+        others = [perceptual_hash(_encode(_radiograph(seed))) for seed in range(1, 6)]
+        others.append(perceptual_hash(_encode(_radiograph(0)[::-1])))
+
+        self.assertTrue(np.all(hamming_distances(reference, others) > 8))
+
+    def test_hamming_distances(self):
+        np.testing.assert_array_equal(
+            hamming_distances('0' * 16, ['0' * 16, '0' * 15 + '3', 'f' * 16, '8' + '0' * 15]),
+            [0, 2, 64, 1],
+        )
+
+    def test_undecodable_content_has_no_hash(self):
+        self.assertEqual(perceptual_hash(b'not an image'), '')
+
+
+def _create_patients(count=1):
+    user = get_user_model().objects.create_user(
+        email='dentist@example.com', password='x', first_name='A', last_name='B')
+    return [
+        Patient.objects.create(
+            created_by=user, first_name='P', last_name=str(i),
+            date_of_birth=datetime.date(1990, 1, 1), gender='F', phone=str(i))
+        for i in range(count)
+    ]
+
+
+class DuplicateLookupTests(TestCase):
+    def setUp(self):
+        self.patient, self.other_patient = _create_patients(2)
+
+    def _scan(self, content, patient=None, **fields):
+        return DiagnosisResult.objects.create(
+            patient=patient or self.patient, content_sha256=content_sha256(content),
+            phash=perceptual_hash(content), **fields)
+
+    def test_exact_duplicate_prefers_completed_result_of_current_version(self):
+        content = _encode(_radiograph())
+        self._scan(content, status='completed', model_version='old')
+        current = self._scan(content, status='completed', model_version='v1')
+        self._scan(content, status='failed', model_version='v1')
+
+        self.assertEqual(find_exact_duplicate(self.patient, content_sha256(content), 'v1'), current)
+        self.assertIsNone(find_exact_duplicate(self.other_patient, content_sha256(content), 'v1'))
+
+    def test_near_duplicate_within_threshold(self):
+        image = _radiograph()
+        original = self._scan(_encode(image, params=[cv2.IMWRITE_JPEG_QUALITY, 95]))
+        self._scan(_encode(_radiograph(4)))
+        reupload = perceptual_hash(_encode(image, params=[cv2.IMWRITE_JPEG_QUALITY, 60]))
+
+        match, distance = find_near_duplicate(self.patient, reupload)
+        self.assertEqual(match, original)
+        self.assertLessEqual(distance, 8)
+        self.assertEqual(find_near_duplicate(self.other_patient, reupload), (None, None))
+
+    def test_near_duplicate_threshold_is_inclusive(self):
+        original = DiagnosisResult.objects.create(patient=self.patient, phash='0' * 16)
+        five_bits = '0' * 14 + '1f'
+
+        with override_settings(AI_DEDUP_MAX_DISTANCE=5):
+            self.assertEqual(find_near_duplicate(self.patient, five_bits), (original, 5))
+        with override_settings(AI_DEDUP_MAX_DISTANCE=4):
+            self.assertEqual(find_near_duplicate(self.patient, five_bits), (None, None))
+
+
+class QualityMetricTests(SimpleTestCase):
+    def test_metric_values_on_synthetic_images(self):
+        flat = np.full((100, 100), 128, dtype=np.uint8)
+        metrics = quality_metrics(flat)
+        self.assertEqual(metrics['sharpness'], 0.0)
+        self.assertEqual(metrics['contrast'], 0.0)
+        self.assertEqual(metrics['dark_fraction'], 0.0)
+        self.assertIsNone(metrics['colorfulness'])
+
+        halves = np.zeros((100, 100), dtype=np.uint8)
+        halves[:, 50:] = 255
+        metrics = quality_metrics(np.dstack([halves] * 3))
+        self.assertAlmostEqual(metrics['dark_fraction'], 0.5)
+        self.assertAlmostEqual(metrics['bright_fraction'], 0.5)
+        self.assertAlmostEqual(metrics['contrast'], 127.5)
+        self.assertEqual(metrics['colorfulness'], 0.0)
+
+        red = np.zeros((100, 100, 3), dtype=np.uint8)
+        red[..., 0] = 200
+        self.assertEqual(quality_metrics(red)['colorfulness'], 100.0)
+
+    def test_metrics_use_a_downsampled_copy(self):
+        image = np.zeros((2000, 1000), dtype=np.uint8)
+        image[::2] = 255
+        metrics = quality_metrics(image, max_side=500)
+        self.assertEqual((metrics['width'], metrics['height']), (1000, 2000))
+        # Area interpolation averages the one-pixel stripes away.
+        self.assertLess(metrics['sharpness'], 1.0)
+
+    @override_settings(AI_QUALITY_MIN_SHARPNESS=15, AI_QUALITY_MIN_CONTRAST=8, AI_QUALITY_MAX_DARK_FRACTION=0.85,
+                       AI_QUALITY_MAX_BRIGHT_FRACTION=0.3, AI_QUALITY_MAX_COLORFULNESS=12)
+    def test_checks(self):
+        image = _radiograph()
+        grain = np.random.default_rng(0).normal(0, 20, image.shape[:2])[..., None]
+        noisy = np.clip(image + grain, 0, 255).astype(np.uint8)
+        self.assertTrue(assess_quality(noisy).passed)
+
+        def failed(image):
+            return [f['check'] for f in assess_quality(image).failures]
+
+        self.assertIn('blurry', failed(cv2.GaussianBlur(image, (0, 0), 15)))
+        self.assertIn('overexposed', failed(np.clip(noisy.astype(int) + 200, 0, 255).astype(np.uint8)))
+        self.assertIn('underexposed', failed(np.clip(noisy.astype(int) - 220, 0, 255).astype(np.uint8)))
+        self.assertEqual(failed(noisy * np.array([1, 0, 0], dtype=np.uint8)), ['not_radiograph'])
+
+        with override_settings(AI_QUALITY_MAX_COLORFULNESS=None):
+            self.assertTrue(assess_quality(noisy * np.array([1, 0, 0], dtype=np.uint8)).passed)
+
+
+class _MemoryStorage:
+    def __init__(self):
+        self.objects = {}
+
+    def put(self, path, content, content_type='application/octet-stream', upsert=False):
+        self.objects[path] = content
+
+    def get_public_url(self, path):
+        return f'https://storage.example.com/{path}'
+
+
+def _complete(diagnosis, content):
+    diagnosis.status = 'completed'
+    diagnosis.severity = 'Moderate'
+    diagnosis.model_version = 'v1'
+    diagnosis.save()
+    return diagnosis
+
+
+@override_settings(AI_DEDUP_ENABLED=True, AI_ASYNC_PIPELINE=False)
+class UploadViewTests(TestCase):
+    def setUp(self):
+        (self.patient,) = _create_patients()
+        self.storage = _MemoryStorage()
+        for target, value in (
+            ('AIModel.views.views_upload.get_storage', mock.Mock(return_value=self.storage)),
+            ('AIModel.views.views_upload.process_diagnosis', mock.Mock(side_effect=_complete)),
+            ('AIModel.model_loader.ModelLoader.result_version', mock.Mock(return_value='v1')),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _upload(self, content, name='scan.png'):
+        response = self.client.post(reverse('AIModel:upload'), {
+            'image': SimpleUploadedFile(name, content, content_type='image/png'),
+            'patient_id': self.patient.id,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_exact_duplicate_reuses_object_and_result(self):
+        content = _encode(_radiograph(), '.png')
+        first = self._upload(content)
+        second = self._upload(content)
+
+        self.assertEqual(len(self.storage.objects), 1)
+        self.assertEqual(second['image_url'], first['image_url'])
+        self.assertTrue(second['reused'])
+        self.assertTrue(second['duplicate_of']['exact'])
+        self.assertEqual(second['duplicate_of']['diagnosis_id'], first['diagnosis_id'])
+        self.assertEqual(second['severity'], 'Moderate')
+
+    def test_equal_perceptual_hash_is_only_linked(self):
+        image = _radiograph()
+        content = _encode(image, '.png', [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        reencoded = _encode(image, '.png', [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        self.assertNotEqual(content, reencoded)
+        self.assertEqual(perceptual_hash(content), perceptual_hash(reencoded))
+
+        first = self._upload(content)
+        second = self._upload(reencoded)
+
+        # Different bytes: stored and processed on their own, only linked to the earlier scan.
+        self.assertEqual(len(self.storage.objects), 2)
+        self.assertNotEqual(second['image_url'], first['image_url'])
+        self.assertNotIn('reused', second)
+        self.assertEqual(second['duplicate_of']['diagnosis_id'], first['diagnosis_id'])
+        self.assertFalse(second['duplicate_of']['exact'])
+        self.assertEqual(second['duplicate_of']['distance'], 0)
+        diagnosis = DiagnosisResult.objects.get(id=second['diagnosis_id'])
+        self.assertEqual(diagnosis.content_sha256, content_sha256(reencoded))
+        self.assertEqual(diagnosis.duplicate_of_id, first['diagnosis_id'])
+
+    def test_unexpected_error_is_stored_without_traceback(self):
+        with mock.patch('AIModel.views.views_upload.process_diagnosis', side_effect=RuntimeError('model exploded')), \
+                mock.patch('builtins.print'):
+            response = self.client.post(reverse('AIModel:upload'), {
+                'image': SimpleUploadedFile('scan.png', _encode(_radiograph(), '.png'), content_type='image/png'),
+                'patient_id': self.patient.id,
+            })
+
+        self.assertEqual(response.status_code, 500)
+        diagnosis = DiagnosisResult.objects.get(id=response.json()['diagnosis_id'])
+        self.assertEqual((diagnosis.status, diagnosis.error_message), ('failed', 'model exploded'))
+
+    def test_distinct_scan_is_not_linked(self):
+        self._upload(_encode(_radiograph(0), '.png'))
+        second = self._upload(_encode(_radiograph(5), '.png'))
+
+        self.assertEqual(len(self.storage.objects), 2)
+        self.assertIsNone(second['duplicate_of'])
+        self.assertIsNone(DiagnosisResult.objects.get(id=second['diagnosis_id']).duplicate_of_id)
+
+
+class RenderServiceTests(SimpleTestCase):
+    def _service(self):
+        service = RenderService()
+        self.addCleanup(service.shutdown)
+        return service
+
+    @override_settings(AI_XAI_RENDER_WORKERS=0)
+    def test_inline_runs_in_calling_process(self):
+        service = self._service()
+        self.assertEqual(service.run(os.getpid), os.getpid())
+        self.assertEqual(service.run(operator.truediv, 6, 3), 2)
+        with self.assertRaises(ZeroDivisionError):
+            service.run(operator.truediv, 1, 0)
+        self.assertIsNone(service._idle)
+
+    @override_settings(AI_XAI_RENDER_WORKERS=1, AI_XAI_RENDER_MAX_RENDERS=2, AI_XAI_RENDER_TIMEOUT=60)
+    def test_worker_runs_out_of_process_and_retires(self):
+        service = self._service()
+        first = service.run(os.getpid)
+        self.assertNotEqual(first, os.getpid())
+        # A job's exception comes back to the caller and still counts as a render.
+        with self.assertRaises(ZeroDivisionError):
+            service.run(operator.truediv, 1, 0)
+        # The worker retired after two renders and a fresh one took its place.
+        replacement = service.run(os.getpid)
+        self.assertNotIn(replacement, (first, os.getpid()))
+        self.assertEqual(service.run(operator.truediv, 6, 3), 2)
+
+    def test_rss_limit_is_skipped_without_any_measurement(self):
+        with mock.patch('builtins.open', side_effect=OSError), mock.patch.object(render_module, 'resource', None):
+            self.assertIsNone(render_module._rss_bytes())
+            self.assertFalse(render_module._over_rss_limit(1))
+        self.assertTrue(render_module._over_rss_limit(1))
+
+
+class _Response:
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+
+    def read(self, size=-1):
+        chunk, self.body = self.body[:size], self.body[size:]
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class ModelDownloadTests(SimpleTestCase):
+    payload = bytes(range(256)) * 64
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.dest = Path(self.dir.name) / 'model.keras'
+        self.part = self.dest.with_name('model.keras.part')
+        self.requests = []
+
+    def _serve(self, request, timeout):
+        self.requests.append(request)
+        range_header = request.get_header('Range')
+        if range_header:
+            offset = int(range_header[len('bytes='):-1])
+            return _Response(self.payload[offset:], status=206)
+        return _Response(self.payload)
+
+    def _download(self, sha256):
+        with mock.patch.object(downloader.urllib.request, 'urlopen', side_effect=self._serve), \
+                mock.patch.object(downloader.os, 'replace', wraps=os.replace) as replace:
+            try:
+                return downloader.download_model('https://models.example.com/model.keras', self.dest, sha256=sha256)
+            finally:
+                self.replace_calls = replace.call_args_list
+
+    def test_resumes_part_file_with_range_request(self):
+        self.part.write_bytes(self.payload[:1000])
+        sha256 = hashlib.sha256(self.payload).hexdigest()
+
+        self.assertEqual(self._download(sha256), self.dest)
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].get_header('Range'), 'bytes=1000-')
+        self.assertEqual(self.dest.read_bytes(), self.payload)
+        self.assertFalse(self.part.exists())
+        # Renamed into place in one step, then recorded as verified.
+        self.assertEqual([c.args for c in self.replace_calls], [(self.part, self.dest)])
+        self.assertEqual(downloader.sha256_of(self.dest), sha256)
+        self.assertTrue(downloader.is_installed(self.dest, sha256))
+
+    def test_checksum_mismatch_leaves_no_model(self):
+        with self.assertRaises(downloader.ModelDownloadError):
+            self._download('0' * 64)
+
+        self.assertIsNone(self.requests[0].get_header('Range'))
+        self.assertFalse(self.dest.exists())
+        self.assertFalse(self.part.exists())
+        self.assertEqual(self.replace_calls, [])
+
+    def test_installed_model_is_not_downloaded_again(self):
+        sha256 = hashlib.sha256(self.payload).hexdigest()
+        self._download(sha256)
+        self._download(sha256)
+        self.assertEqual(len(self.requests), 1)
+
+
+@override_settings(AI_JOB_TIMEOUT_SECONDS=600, AI_JOB_MAX_ATTEMPTS=2)
+class DiagnosisJobTests(TestCase):
+    def setUp(self):
+        (self.patient,) = _create_patients()
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+        patcher = override_settings(AI_JOB_SPOOL_DIR=self.spool.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def _enqueue(self, content=b'scan-bytes'):
+        diagnosis = DiagnosisResult.objects.create(patient=self.patient, status='processing')
+        return jobs.enqueue_diagnosis(diagnosis, content, 'png')
+
+    def test_claimed_job_runs_pipeline_and_cleans_spool(self):
+        job = self._enqueue()
+        payload = Path(job.payload_path)
+        self.assertEqual(payload.read_bytes(), b'scan-bytes')
+        self.assertEqual(job.diagnosis.status, 'pending')
+
+        claimed = jobs.claim_next_job('worker-1')
+        self.assertEqual((claimed.id, claimed.state, claimed.attempts), (job.id, 'running', 1))
+        self.assertIsNone(jobs.claim_next_job('worker-2'))
+
+        with mock.patch.object(jobs, 'process_diagnosis') as process:
+            jobs.run_job(claimed)
+        process.assert_called_once_with(claimed.diagnosis, b'scan-bytes')
+
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, 'done')
+        self.assertIsNotNone(claimed.finished_at)
+        self.assertFalse(payload.exists())
+
+    def test_failed_job_marks_diagnosis_without_traceback(self):
+        job = self._enqueue()
+        claimed = jobs.claim_next_job('worker-1')
+
+        with mock.patch.object(jobs, 'process_diagnosis', side_effect=RuntimeError('model exploded')), \
+                self.assertLogs('AIModel.jobs', 'ERROR'):
+            jobs.run_job(claimed)
+
+        claimed.refresh_from_db()
+        diagnosis = DiagnosisResult.objects.get(id=job.diagnosis_id)
+        self.assertEqual(claimed.state, 'failed')
+        self.assertIn('Traceback', claimed.last_error)
+        self.assertEqual((diagnosis.status, diagnosis.error_message), ('failed', 'model exploded'))
+        self.assertFalse(Path(job.payload_path).exists())
+
+    def test_stale_running_jobs_are_requeued_then_failed(self):
+        job = self._enqueue()
+        jobs.claim_next_job('worker-1')
+        stale_start = timezone.now() - datetime.timedelta(seconds=601)
+        DiagnosisJob.objects.filter(id=job.id).update(started_at=stale_start)
+
+        jobs.requeue_stale_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'queued')
+
+        # The second claim uses up AI_JOB_MAX_ATTEMPTS.
+        self.assertEqual(jobs.claim_next_job('worker-2').attempts, 2)
+        DiagnosisJob.objects.filter(id=job.id).update(started_at=stale_start)
+        jobs.requeue_stale_jobs()
+
+        job.refresh_from_db()
+        diagnosis = DiagnosisResult.objects.get(id=job.diagnosis_id)
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual((diagnosis.status, diagnosis.error_message), ('failed', 'Processing timed out'))
+        self.assertFalse(Path(job.payload_path).exists())
+
+
+class ArtifactStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        patcher = override_settings(AI_ARTIFACTS_DIR=self.dir.name, AI_ARTIFACTS_ENABLED=True)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.store = ArtifactStore()
+
+    def test_round_trip_is_scoped_to_model_version(self):
+        rng = np.random.default_rng(0)
+        preprocessed = rng.integers(0, 256, (1, 64, 64, 3)).astype(np.float32)
+        predictions = rng.random((1, 64, 64, 1), dtype=np.float32)
+        self.store.save_preprocessed(7, preprocessed, 'v1')
+        self.store.save_predictions(7, predictions, 'v1')
+        self.store.save_gradcam(7, predictions[0, ..., 0], 'v1')
+
+        np.testing.assert_array_equal(self.store.load_preprocessed(7, 'v1'), preprocessed)
+        np.testing.assert_array_equal(self.store.load_predictions(7, 'v1'), predictions)
+        np.testing.assert_allclose(self.store.load_gradcam(7, 'v1'), predictions[0, ..., 0], atol=1e-3)
+        self.assertIsNone(self.store.load_predictions(7, 'v2'))
+        self.assertIsNone(self.store.load_predictions(8, 'v1'))
+
+        self.store.delete(7)
+        self.assertFalse((Path(self.dir.name) / '7').exists())
+        self.assertIsNone(self.store.load_preprocessed(7, 'v1'))
+
+    def test_unreadable_artifact_is_discarded(self):
+        path = Path(self.dir.name) / '7' / 'predictions.npz'
+        path.parent.mkdir()
+        path.write_bytes(b'not an npz')
+        with mock.patch('builtins.print'):
+            self.assertIsNone(self.store.load_predictions(7, 'v1'))
+        self.assertFalse(path.exists())
+
+
+class StagePredictionsTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.store = ArtifactStore()
+        self.loader = mock.Mock(current=SimpleNamespace(version='v1'), tiling=False, tta=False)
+        self.loader.result_version.return_value = 'v1'
+        self.loader.infer.side_effect = AssertionError('the X-ray was decoded again')
+        self.enterContext(override_settings(AI_ARTIFACTS_DIR=self.dir.name, AI_ARTIFACTS_ENABLED=True))
+        self.enterContext(mock.patch.object(pipeline, 'artifact_store', self.store))
+        self.enterContext(mock.patch.object(pipeline, 'model_loader', self.loader))
+        self.enterContext(mock.patch.object(
+            pipeline, 'read_local_image', side_effect=AssertionError('the X-ray was read again')))
+        self.diagnosis = SimpleNamespace(id=7, model_version=None)
+
+    def test_uses_persisted_predictions(self):
+        predictions = np.full((1, 8, 8, 1), 0.25, dtype=np.float32)
+        self.store.save_predictions(7, predictions, 'v1')
+
+        np.testing.assert_array_equal(pipeline.stage_predictions(self.diagnosis), predictions)
+        self.loader.predict.assert_not_called()
+        self.assertEqual(self.diagnosis.model_version, 'v1')
+
+    def test_runs_model_on_persisted_tensor(self):
+        preprocessed = np.full((1, 8, 8, 3), 128, dtype=np.float32)
+        predictions = np.full((1, 8, 8, 1), 0.5, dtype=np.float32)
+        self.store.save_preprocessed(7, preprocessed, 'v1')
+        self.loader.predict.return_value = predictions
+
+        np.testing.assert_array_equal(pipeline.stage_predictions(self.diagnosis), predictions)
+        np.testing.assert_array_equal(self.loader.predict.call_args.args[0], preprocessed)
+        # The next stage loads the mask instead of running the model again.
+        np.testing.assert_array_equal(self.store.load_predictions(7, 'v1'), predictions)
+
+
+class _ConstantBackend(InferenceBackend):
+    """Backend whose masks are filled with ``value``, so tests can tell versions apart."""
+
+    name = 'keras'
+
+    def __init__(self, value, input_shape=(None, 32, 32, 3)):
+        self.value = value
+        self._input_shape = input_shape
+
+    def load(self):
+        pass
+
+    @property
+    def input_shape(self):
+        return self._input_shape
+
+    def predict(self, batch):
+        return np.full((len(batch), *self._input_shape[1:3], 1), self.value, dtype=np.float32)
+
+
+def _loaded_model(version, value, **backend_kwargs):
+    model = LoadedModel(version, f'/models/{version}.keras', backend_name='keras')
+    model._backend = _ConstantBackend(value, **backend_kwargs)
+    return model
+
+
+@override_settings(
+    AI_INFERENCE_BACKEND='keras', AI_BATCHING_ENABLED=False, AI_TILED_INFERENCE=False,
+    AI_TTA_ENABLED=False, AI_CASCADE_ENABLED=False, AI_WARMUP_PASSES=1, AI_WARMUP_GRADCAM=False,
+)
+class RegistryHotSwapTests(TestCase):
+    def setUp(self):
+        ModelVersion.objects.create(version='v1', path='/models/v1.keras').activate()
+        self.v2 = ModelVersion.objects.create(version='v2', path='/models/v2.keras')
+        self.enterContext(mock.patch.object(ModelLoader, '_current', _loaded_model('v1', 0.1)))
+        self.enterContext(mock.patch.object(ModelLoader, '_inference_cache', InferenceCache()))
+        self.enterContext(mock.patch('builtins.print'))
+        self.watcher = RegistryWatcher(model_loader)
+
+    def _activate_v2(self, **backend_kwargs):
+        self.v2.activate()
+        with mock.patch.object(
+            registry, 'loaded_model_for', side_effect=lambda row, backend: _loaded_model(row.version, 0.9, **backend_kwargs)
+        ), self.assertLogs('AIModel.registry', 'INFO') as logs:
+            return self.watcher.check_once(), logs.records[-1].levelname
+
+    def test_activation_swaps_current_version(self):
+        in_flight = model_loader.current
+        image = _radiograph()
+        _, predictions, result = model_loader.infer(image)
+        self.assertEqual(result['model_version'], 'v1/keras')
+
+        self.assertEqual(self._activate_v2(), (True, 'INFO'))
+
+        self.assertEqual(model_loader.current.version, 'v2/keras')
+        self.v2.refresh_from_db()
+        self.assertEqual(self.v2.input_shape, [32, 32, 3])
+        self.assertFalse(self.watcher.check_once())
+
+        # A request that grabbed the old model keeps running on it.
+        self.assertEqual(in_flight.version, 'v1/keras')
+        np.testing.assert_array_equal(model_loader.predict(np.zeros((1, 32, 32, 3)), model=in_flight), predictions)
+
+        # New requests miss the v1 cache entry and record the new version.
+        _, swapped_predictions, swapped_result = model_loader.infer(image)
+        self.assertEqual(swapped_result['model_version'], 'v2/keras')
+        self.assertEqual(float(swapped_predictions.max()), np.float32(0.9))
+        content_hash = model_loader.image_content_hash(image)
+        for version in ('v1/keras', 'v2/keras'):
+            self.assertIsNotNone(model_loader.inference_cache.get(InferenceCache.make_key(content_hash, version)))
+
+    def test_version_with_wrong_input_shape_is_not_activated(self):
+        self.v2.input_shape = [64, 64, 3]
+        self.v2.save()
+        self.assertEqual(self._activate_v2(), (False, 'ERROR'))
+        self.assertEqual(model_loader.current.version, 'v1/keras')
+        # The failed version is not retried on every poll.
+        self.assertFalse(self.watcher.check_once())
+
+
+class _RemoteStub:
+    """Storage stub serving queued ``(status, body, headers)`` responses and recording the request headers."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def fetch(self, url, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        return self.responses.pop(0)
+
+
+class RemoteImageCacheTests(SimpleTestCase):
+    url = 'https://storage.example.com/scans/a.png'
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.enterContext(override_settings(
+            AI_IMAGE_CACHE_DIR=self.dir.name, AI_IMAGE_CACHE_ENABLED=True,
+            AI_IMAGE_CACHE_MAX_MB=500, AI_IMAGE_CACHE_REVALIDATE_SECONDS=0,
+        ))
+        self.cache = RemoteImageCache()
+
+    def _fetch(self, url, *responses):
+        remote = _RemoteStub(*responses)
+        with mock.patch('AIModel.image_cache.get_storage', return_value=remote):
+            return self.cache.fetch(url), remote.requests
+
+    def test_not_modified_reuses_cached_body(self):
+        self._fetch(self.url, (200, b'scan-v1', {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}))
+
+        body, requests = self._fetch(self.url, (304, b'', {}))
+
+        self.assertEqual(body, b'scan-v1')
+        self.assertEqual(requests[0][1], {
+            'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT',
+        })
+
+    def test_changed_object_replaces_cached_body(self):
+        self._fetch(self.url, (200, b'scan-v1', {'ETag': '"v1"'}))
+        body, _ = self._fetch(self.url, (200, b'scan-v2', {'ETag': '"v2"'}))
+        self.assertEqual(body, b'scan-v2')
+
+        body, requests = self._fetch(self.url, (304, b'', {}))
+        self.assertEqual(body, b'scan-v2')
+        self.assertEqual(requests[0][1], {'If-None-Match': '"v2"'})
+
+    @override_settings(AI_IMAGE_CACHE_REVALIDATE_SECONDS=3600, AI_IMAGE_CACHE_MAX_MB=2500 / (1024 * 1024))
+    def test_evicts_least_recently_used_over_byte_budget(self):
+        urls = [f'https://storage.example.com/scans/{name}.png' for name in 'abc']
+        for url in urls[:2]:
+            self._fetch(url, (200, bytes(1000), {}))
+        # Age both entries, b more recently used than a...
+        for age, url in ((200, urls[0]), (100, urls[1])):
+            data_path = self.cache._paths(url)[0]
+            os.utime(data_path, (time.time() - age, time.time() - age))
+        # ...then read a again without a request, which makes b the oldest.
+        _, requests = self._fetch(urls[0])
+        self.assertEqual(requests, [])
+
+        self._fetch(urls[2], (200, bytes(1000), {}))
+
+        cached = [self.cache._paths(url)[0].exists() for url in urls]
+        self.assertEqual(cached, [True, False, True])
+        self.assertFalse(self.cache._paths(urls[1])[1].exists())
+
+
+class FileSystemStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.root = Path(self.dir.name) / 'storage'
+        self.storage = FileSystemStorage(self.root, '/media/storage/')
+
+    def test_put_get_and_public_url(self):
+        self.storage.put('dental_images/1/scan 1.png', b'scan', content_type='image/png')
+
+        self.assertEqual(self.storage.get('dental_images/1/scan 1.png'), b'scan')
+        url = self.storage.get_public_url('dental_images/1/scan 1.png')
+        self.assertEqual(url, '/media/storage/dental_images/1/scan%201.png')
+        self.assertEqual(self.storage.fetch(url), (200, b'scan', {}))
+        self.assertEqual(list(self.root.rglob('*.tmp')), [])
+
+    def test_put_requires_upsert_to_overwrite(self):
+        self.storage.put('a.png', b'old')
+        with self.assertRaises(StorageError) as raised:
+            self.storage.put('a.png', b'new')
+        self.assertEqual(raised.exception.status, 409)
+
+        self.storage.put('a.png', b'new', upsert=True)
+        self.assertEqual(self.storage.get('a.png'), b'new')
+
+        self.storage.delete('a.png')
+        with self.assertRaises(StorageError) as raised:
+            self.storage.get('a.png')
+        self.assertEqual(raised.exception.status, 404)
+
+    def test_rejects_keys_outside_root(self):
+        (Path(self.dir.name) / 'secret').write_bytes(b'secret')
+        for key in ('../secret', 'dental_images/../../secret', '/etc/passwd', '', '.'):
+            with self.subTest(key=key):
+                with self.assertRaises(StorageError):
+                    self.storage.get(key)
+                with self.assertRaises(StorageError):
+                    self.storage.put(key, b'x', upsert=True)
+                with self.assertRaises(StorageError):
+                    self.storage.delete(key)
+        self.assertEqual((Path(self.dir.name) / 'secret').read_bytes(), b'secret')
+
+
+class CascadeThresholdTests(SimpleTestCase):
+    def _healthy(self, result, **overrides):
+        return is_confidently_healthy(
+            result, **{'min_confidence': 95.0, 'max_probability': 0.3, **overrides})
+
+    def test_thresholds(self):
+        mask = {'severity': 'Healthy', 'confidence': 99.0, 'max_probability': 0.1, 'analysis': {}}
+        self.assertTrue(self._healthy(mask))
+        self.assertFalse(self._healthy({**mask, 'severity': 'Shallow'}))
+        self.assertFalse(self._healthy({**mask, 'confidence': 94.9}))
+        self.assertTrue(self._healthy({**mask, 'confidence': 94.9}, min_confidence=90.0))
+        self.assertFalse(self._healthy({**mask, 'max_probability': 0.3}))
+        # Classifier output has no analysis, so only the label and confidence count.
+        self.assertTrue(self._healthy({'severity': 'Healthy', 'confidence': 99.0, 'max_probability': 0.9, 'analysis': None}))
+
+
+@override_settings(
+    AI_INFERENCE_BACKEND='keras', AI_BATCHING_ENABLED=False, AI_TILED_INFERENCE=False, AI_TTA_ENABLED=False,
+    AI_CASCADE_ENABLED=True, AI_CASCADE_MODEL_PATH='/models/stage1.keras', AI_CASCADE_SHADOW_RATE=0,
+    AI_CASCADE_HEALTHY_CONFIDENCE=95.0, AI_CASCADE_MAX_PROBABILITY=0.3,
+)
+class CascadeInferenceTests(SimpleTestCase):
+    def setUp(self):
+        self.model = _loaded_model('v1', 0.9)
+        self.enterContext(mock.patch.object(ModelLoader, '_current', self.model))
+        self.enterContext(mock.patch.object(ModelLoader, '_inference_cache', InferenceCache()))
+        self.full_predict = self.enterContext(mock.patch.object(
+            self.model._backend, 'predict', wraps=self.model._backend.predict))
+        cascade_metrics.reset()
+        self.addCleanup(cascade_metrics.reset)
+
+    def _stage1(self, value):
+        stage1 = _loaded_model('stage1', value)
+        self.enterContext(mock.patch.object(ModelLoader, '_cascade_model', stage1))
+        return self.enterContext(mock.patch.object(stage1._backend, 'predict', wraps=stage1._backend.predict))
+
+    def test_confidently_healthy_scan_short_circuits(self):
+        stage1_predict = self._stage1(0.0)
+        image = _radiograph()
+
+        _, predictions, result = model_loader.infer(image)
+
+        self.assertEqual(result['cascade_stage'], 1)
+        self.assertEqual(result['severity'], 'Healthy')
+        self.assertEqual(result['model_version'], 'v1/keras+cascade(stage1/keras)')
+        self.assertEqual(float(predictions.max()), 0.0)
+        self.full_predict.assert_not_called()
+        # The plain result version is unchanged; only the early exit carries the suffix.
+        self.assertEqual(model_loader.result_version(), 'v1/keras')
+
+        # Served from the cache under the early-exit version.
+        _, _, cached = model_loader.infer(image)
+        self.assertEqual(cached['model_version'], result['model_version'])
+        self.assertEqual(stage1_predict.call_count, 1)
+        self.assertEqual(cascade_metrics.snapshot()['early_exits'], 1)
+
+    def test_uncertain_scan_escalates_to_full_model(self):
+        stage1_predict = self._stage1(0.05)
+        image = _radiograph()
+
+        _, predictions, result = model_loader.infer(image)
+
+        self.assertEqual(result['cascade_stage'], 2)
+        self.assertEqual(result['model_version'], 'v1/keras')
+        self.assertEqual(float(predictions.max()), np.float32(0.9))
+        self.assertEqual(self.full_predict.call_count, 1)
+
+        # The full-model result is cached under the plain version and wins without rerunning stage one.
+        _, _, cached = model_loader.infer(image)
+        self.assertEqual(cached['model_version'], 'v1/keras')
+        self.assertEqual((stage1_predict.call_count, self.full_predict.call_count), (1, 1))
+        self.assertEqual(cascade_metrics.snapshot()['full_runs'], 1)
+
+
+@override_settings(AI_FAST_DECODE=True)
+class DecodingTests(SimpleTestCase):
+    def setUp(self):
+        # 768x1024, JPEG: the largest reduction that still covers a 128px input is 1/4.
+        self.image = _radiograph(size=(768, 1024))
+        self.jpeg = _encode(self.image, '.jpg')
+        self.png = _encode(self.image, '.png')
+
+    def test_reduction_factor(self):
+        self.assertEqual(reduction_factor(4000, 3000, (256, 256)), 8)
+        self.assertEqual(reduction_factor(2048, 1600, (256, 256)), 4)
+        self.assertEqual(reduction_factor(1024, 600, (256, 256)), 2)
+        self.assertEqual(reduction_factor(300, 300, (256, 256)), 1)
+        # The larger side of a non-square input decides.
+        self.assertEqual(reduction_factor(2048, 1600, (512, 256)), 2)
+
+    def test_jpeg_uses_reduced_decode_that_covers_input(self):
+        self.assertEqual(decode_flag(self.jpeg, (128, 128)), cv2.IMREAD_REDUCED_COLOR_4)
+        self.assertEqual(decode_flag(self.jpeg, (128, 128), grayscale=True), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+        color = decode_for_inference(self.jpeg, (128, 128), grayscale=False)
+        gray = decode_for_inference(self.jpeg, (128, 128), grayscale=True)
+        self.assertEqual(color.shape, (192, 256, 3))
+        self.assertEqual(gray.shape, (192, 256))
+        self.assertGreaterEqual(min(gray.shape), 128)
+        # Still the same picture as a full decode resized down.
+        full = cv2.resize(decode_for_inference(self.jpeg, grayscale=True), (256, 192), interpolation=cv2.INTER_AREA)
+        self.assertLess(np.abs(gray.astype(np.int16) - full).mean(), 3)
+
+    def test_full_decode_when_reduction_does_not_apply(self):
+        # PNG, no target size, an input too large to reduce for, undecodable bytes.
+        cases = [(self.png, (128, 128)), (self.jpeg, None), (self.jpeg, (1024, 1024)), (b'not an image', (128, 128))]
+        for content, target_size in cases:
+            with self.subTest(content=content[:4], target_size=target_size):
+                self.assertEqual(decode_flag(content, target_size), cv2.IMREAD_COLOR)
+                self.assertEqual(decode_flag(content, target_size, grayscale=True), cv2.IMREAD_GRAYSCALE)
+        self.assertEqual(decode_flag(self.jpeg, (128, 128), fast=False), cv2.IMREAD_COLOR)
+
+        self.assertEqual(decode_for_inference(self.png, (128, 128), grayscale=True).shape, (768, 1024))
+        self.assertIsNone(decode_for_inference(b'not an image', (128, 128)))
@@ -0,0 +1,128 @@
+"""
+AIModel/tiling.py
+Sliding-window inference at the scan's native resolution.
+
+The standard path resizes the whole X-ray to the model input, which can
+shrink a small early lesion on a large sensor to a pixel or two. With
+AI_TILED_INFERENCE the decoded full-resolution image is cut into
+overlapping tiles of the model's input size, the tiles go through the
+model in batches of at most AI_TILE_BATCH_SIZE, and the tile masks are
+blended back into one full-resolution mask. Each tile is weighted by a
+window that fades towards its edges, so overlapping predictions join
+without visible seams.
+"""
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def tile_origins(length, tile, stride):
+    """Start offsets along one axis; the last tile ends flush with ``length``."""
+    if length <= tile:
+        return np.array([0])
+    starts = np.arange(0, length - tile, stride)
+    return np.append(starts, length - tile)
+
+
+def tile_grid(height, width, tile_size, overlap):
+    """``(N, 2)`` array of (y, x) tile origins covering a ``height`` x ``width`` image."""
+    tile_h, tile_w = tile_size
+    ys = tile_origins(height, tile_h, max(int(round(tile_h * (1 - overlap))), 1))
+    xs = tile_origins(width, tile_w, max(int(round(tile_w * (1 - overlap))), 1))
+    return np.stack(np.meshgrid(ys, xs, indexing='ij'), axis=-1).reshape(-1, 2)
+
+
+def blend_window(tile_h, tile_w, floor=1e-3):
+    """
+    Separable sin^2 window: 1 in the tile centre, ``floor`` at its edges.
+
+    The floor keeps image borders (covered by a single tile) from being
+    divided by zero weight.
+    """
+    def window(n):
+        return np.maximum(np.sin(np.pi * (np.arange(n) + 0.5) / n) ** 2, floor)
+    return np.outer(window(tile_h), window(tile_w)).astype(np.float32)
+
+
+def extract_tiles(image, origins, tile_size):
+    """Tiles at ``origins`` as an ``(N, tile_h, tile_w[, C])`` view-backed gather."""
+    tile_h, tile_w = tile_size
+    windows = np.lib.stride_tricks.sliding_window_view(image, (tile_h, tile_w), axis=(0, 1))
+    tiles = windows[origins[:, 0], origins[:, 1]]
+    # sliding_window_view puts the window axes last: (N, [C,] tile_h, tile_w).
+    return np.moveaxis(tiles, (-2, -1), (1, 2)) if image.ndim == 3 else tiles
+
+
+def stitch(accumulator, masks, origins, window):
+    """
+    Add ``masks * window`` for every tile into ``accumulator`` (H, W) in place.
+
+    Each tile is added through a slice of the preallocated accumulator, so
+    a chunk needs no image-sized temporaries.
+    """
+    tile_h, tile_w = masks.shape[1:3]
+    for mask, (y, x) in zip(masks, origins):
+        accumulator[y:y + tile_h, x:x + tile_w] += mask * window
+
+
+def window_weights(shape, origins, window):
+    """(H, W) sum of the blend windows of all tiles: the per-pixel normaliser."""
+    weights = np.zeros(shape, dtype=np.float32)
+    tile_h, tile_w = window.shape
+    for y, x in origins:
+        weights[y:y + tile_h, x:x + tile_w] += window
+    return weights
+
+
+def _tile_masks(output, tile_size):
+    """(N, tile_h, tile_w) masks from an (N, h, w, 1) model output, resized to the tile when needed."""
+    masks = np.asarray(output, dtype=np.float32)[..., 0]
+    if masks.shape[1:] == tuple(tile_size):
+        return masks
+    tile_h, tile_w = tile_size
+    return np.stack([cv2.resize(m, (tile_w, tile_h)) for m in masks])
+
+
+def predict_tiled(image, predict, tile_size, channels=3, overlap=0.25, max_tiles_per_batch=8):
+    """
+    Full-resolution ``(1, H, W, 1)`` mask for ``image`` (H, W[, C]).
+
+    ``predict`` maps an (N, tile_h, tile_w, channels) float32 batch to
+    model output. Returns None when the output is not a spatial mask
+    (classifier models), so callers can fall back to whole-image inference.
+    """
+    if cv2 is None:
+        raise ImportError("OpenCV (cv2) is required.")
+
+    tile_h, tile_w = tile_size
+    height, width = image.shape[:2]
+    # Axes shorter than a tile are zero-padded (X-ray background is dark) and cropped after stitching.
+    padded_h, padded_w = max(height, tile_h), max(width, tile_w)
+    if (padded_h, padded_w) != (height, width):
+        pad = [(0, padded_h - height), (0, padded_w - width)] + [(0, 0)] * (image.ndim - 2)
+        image = np.pad(image, pad)
+
+    origins = tile_grid(padded_h, padded_w, tile_size, overlap)
+    window = blend_window(tile_h, tile_w)
+    accumulator = np.zeros((padded_h, padded_w), dtype=np.float32)
+
+    step = max(int(max_tiles_per_batch), 1)
+    for start in range(0, len(origins), step):
+        chunk = origins[start:start + step]
+        tiles = extract_tiles(image, chunk, tile_size).astype(np.float32)
+        if tiles.ndim == 3:
+            # Grayscale decode: expand to the model's channels one batch at a time.
+            tiles = np.repeat(tiles[..., None], channels, axis=-1)
+
+        output = np.asarray(predict(tiles))
+        if output.ndim != 4:
+            return None
+        stitch(accumulator, _tile_masks(output, tile_size), chunk, window)
+
+    accumulator /= window_weights(accumulator.shape, origins, window)
+    mask = accumulator[:height, :width]
+    return mask[None, :, :, None]
@@ -22,4 +22,6 @@ urlpatterns = [
     path('diagnosis/all/', views.get_all_diagnoses, name='get_all_diagnoses'),
     path('diagnosis/<int:diagnosis_id>/', views.get_single_diagnosis, name='get_single_diagnosis'),
     path('diagnosis/<int:diagnosis_id>/delete/', views.delete_diagnosis, name='delete_diagnosis'),
+
+    path('metrics/', views.inference_metrics, name='metrics'),
 ]
@@ -9,6 +9,7 @@ except Exception:
 
 from ..models import DiagnosisResult
 from ..model_loader import model_loader
+from ..pipeline import PipelineError, stage_predictions
 
 
 def classify_severity(request, diagnosis_id):
@@ -19,24 +20,11 @@ def classify_severity(request, diagnosis_id):
         diagnosis.status = 'classifying'
         diagnosis.save()
 
-        image_path = diagnosis.image.path
-        image = cv2.imread(image_path)
-
-        if image is None:
-            return JsonResponse({
-                'success': False,
-                'error': f'Could not read image at {image_path}'
-            }, status=500)
-
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        preprocessed = model_loader.preprocess_image(image_rgb)
-
-        predictions = model_loader.predict(preprocessed)
-
+        predictions = stage_predictions(diagnosis)
         severity_result = model_loader.classify_severity(predictions)
 
-        if 'segmentation_mask' in severity_result:
-            del severity_result['segmentation_mask']
+        severity_result.pop('segmentation_mask', None)
+        severity_result.pop('analysis', None)
 
         severity_result = {
             key: _convert_to_native_type(value)
@@ -59,6 +47,12 @@ def classify_severity(request, diagnosis_id):
             'max_probability': float(severity_result.get('max_probability', 0))
         })
 
+    except PipelineError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
     except DiagnosisResult.DoesNotExist:
         return JsonResponse({
             'success': False, 
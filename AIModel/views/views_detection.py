@@ -8,6 +8,7 @@ except Exception:
 
 from ..models import DiagnosisResult
 from ..model_loader import model_loader
+from ..pipeline import PipelineError, stage_predictions
 
 
 def detect_caries(request, diagnosis_id):
@@ -18,26 +19,15 @@ def detect_caries(request, diagnosis_id):
         diagnosis.status = 'detecting'
         diagnosis.save()
 
-        image_path = diagnosis.image.path
-        image = cv2.imread(image_path)
-
-        if image is None:
-            return JsonResponse({
-                'success': False,
-                'error': f'Could not read image at {image_path}'
-            }, status=500)
-
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        preprocessed = model_loader.preprocess_image(image_rgb)
-        predictions = model_loader.predict(preprocessed)
+        predictions = stage_predictions(diagnosis)
         severity_result = model_loader.classify_severity(predictions)
 
         bounding_boxes = []
-        if 'segmentation_mask' in severity_result:
-            bounding_boxes = model_loader.generate_bounding_boxes(
-                severity_result['segmentation_mask'],
+        if severity_result.get('analysis') is not None:
+            bounding_boxes = severity_result['analysis'].boxes(
                 threshold=0.5,
-                min_area=50
+                min_area=50,
+                polygons=request.GET.get('polygons', '').lower() in ('1', 'true', 'yes'),
             )
 
         has_caries = severity_result['severity'].lower() not in ['healthy', 'class_0']
@@ -56,6 +46,12 @@ def detect_caries(request, diagnosis_id):
             'affected_percentage': severity_result.get('affected_percentage', 0),
             'next_stage': 'classification'
         })
+    except PipelineError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
     except DiagnosisResult.DoesNotExist:
         return JsonResponse({
             'success': False, 
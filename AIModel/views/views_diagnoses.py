@@ -25,6 +25,7 @@ except Exception:
 
 from ..models import DiagnosisResult
 from ..model_loader import model_loader
+from ..artifacts import artifact_store
 
 @api_view(['GET'])  
 @permission_classes([IsAuthenticated])
@@ -93,6 +94,7 @@ def delete_diagnosis(request, diagnosis_id):
     try:
         diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
         diagnosis.delete()
+        artifact_store.delete(diagnosis_id)
         return JsonResponse({'success': True, 'message': f'Diagnosis {diagnosis_id} deleted successfully'})
     except DiagnosisResult.DoesNotExist:
         return JsonResponse({'success': False, 'error': f'Diagnosis with id {diagnosis_id} not found'}, status=404)
@@ -0,0 +1,31 @@
+import os
+
+from django.conf import settings
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from ..cascade import cascade_metrics
+from ..model_loader import model_loader
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def inference_metrics(request):
+    """Inference counters for this worker process (each gunicorn worker keeps its own)."""
+    cascade = None
+    if model_loader.cascade_model is not None:
+        cascade = {
+            **cascade_metrics.snapshot(),
+            'stage1_model': model_loader.cascade_model.version,
+            'healthy_confidence': getattr(settings, 'AI_CASCADE_HEALTHY_CONFIDENCE', 95.0),
+            'max_probability': getattr(settings, 'AI_CASCADE_MAX_PROBABILITY', 0.3),
+            'shadow_rate': getattr(settings, 'AI_CASCADE_SHADOW_RATE', 0.05),
+        }
+
+    return Response({
+        'success': True,
+        'pid': os.getpid(),
+        'warmup_state': model_loader.warmup_state,
+        'cascade': cascade,
+    })
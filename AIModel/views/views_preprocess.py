@@ -6,8 +6,10 @@ try:
 except Exception:
     cv2 = None
 
+from ..artifacts import artifact_store
 from ..models import DiagnosisResult
 from ..model_loader import model_loader
+from ..pipeline import ImageQualityError, PipelineError, check_quality, mark_failed, read_local_image
 import time
 
 
@@ -19,18 +21,27 @@ def preprocess_image(request, diagnosis_id):
         diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
         diagnosis.status = 'preprocessing'
         diagnosis.save()
-        image_path = diagnosis.image.path
-        image = cv2.imread(image_path)
-        
-        if image is None:
+        t0 = time.time()
+        try:
+            image = read_local_image(diagnosis)
+            check_quality(diagnosis, image)
+        except ImageQualityError as e:
+            mark_failed(diagnosis, str(e))
+            return JsonResponse({
+                'success': False,
+                'error': str(e),
+                'reason': 'image_quality_issue',
+                'quality': e.report.as_dict(),
+            }, status=422)
+        except PipelineError as e:
             return JsonResponse({
                 'success': False, 
-                'error': f'Could not read image at {image_path}'
+                'error': str(e)
             }, status=500)
-        
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        t0 = time.time()
-        preprocessed = model_loader.preprocess_image(image_rgb)
+
+        model = model_loader.current
+        preprocessed = model_loader.preprocess_image(image, model=model)
+        artifact_store.save_preprocessed(diagnosis_id, preprocessed, model_loader.result_version(model))
         t1 = time.time()
         diagnosis.status = 'preprocessed'
         diagnosis.save()
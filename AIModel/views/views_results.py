@@ -17,6 +17,9 @@ def show_results(request, diagnosis_id):
         'lesion_boxes': diagnosis.lesion_boxes,
         'num_lesions': len(diagnosis.lesion_boxes) if diagnosis.lesion_boxes else 0,
         'status': diagnosis.status,
+        'error_message': diagnosis.error_message if diagnosis.status == 'failed' else None,
+        'quality': diagnosis.quality_metrics,
+        'duplicate_of': diagnosis.duplicate_of_id,
         'uploaded_at': diagnosis.uploaded_at.isoformat(),
     })
 
@@ -1,12 +1,18 @@
+from django.conf import settings
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.timezone import now
 from dashboard.models import Patient
 from ..models import DiagnosisResult
-from ..supabase import supabase
+from ..dedup import (
+    content_sha256, find_exact_duplicate, find_near_duplicate, perceptual_hash, reuse_result,
+)
 from ..model_loader import model_loader
+from ..storage import StorageError, get_storage
+from ..jobs import enqueue_diagnosis
+from ..pipeline import ImageQualityError, PipelineError, mark_failed, process_diagnosis
 import uuid
-import numpy as np
 import traceback
 
 try:
@@ -38,77 +44,96 @@ def upload_image(request):
     file_name = f"{patient.id}/{uuid.uuid4()}.{file_ext}"
     content = image.read()
 
-    try:
-        supabase.storage.from_("images").upload(
-            file_name,
-            content,
-            {"content-type": image.content_type}
-        )
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'message': f'Failed to upload image: {str(e)}'
-        }, status=500)
+    sha256, phash, original, distance, version = '', '', None, None, None
+    # Only a content hash match is the same file; an equal perceptual hash may still be a different scan.
+    exact = False
+    if getattr(settings, 'AI_DEDUP_ENABLED', True):
+        sha256 = content_sha256(content)
+        phash = perceptual_hash(content)
+        version = model_loader.result_version()
+        original = find_exact_duplicate(patient, sha256, version)
+        exact = original is not None
+        if not exact:
+            original, distance = find_near_duplicate(patient, phash)
+
+    if exact and original.image_url:
+        # Same bytes as an earlier scan of this patient: keep a single stored object.
+        image_url = original.image_url
+    else:
+        storage = get_storage()
+        try:
+            storage.put(file_name, content, content_type=image.content_type)
+        except StorageError as e:
+            return JsonResponse({
+                'success': False,
+                'message': f'Failed to upload image: {str(e)}'
+            }, status=500)
 
-    image_url = supabase.storage.from_("images").get_public_url(file_name)
+        image_url = storage.get_public_url(file_name)
 
     diagnosis = DiagnosisResult.objects.create(
         user=request.user if request.user.is_authenticated else None,
         patient=patient,
         image_url=image_url,
+        content_sha256=sha256,
+        phash=phash,
+        duplicate_of=original,
         status='processing'
     )
 
-    try:
-        if cv2 is None:
-            diagnosis.status = 'failed'
-            diagnosis.error_message = 'OpenCV (cv2) not installed - cannot process image'
-            diagnosis.save()
-
-            return JsonResponse({
-                'success': False,
-                'diagnosis_id': diagnosis.id,
-                'message': 'Image uploaded but processing unavailable (cv2 not installed)',
-                'status': diagnosis.status
-            }, status=503)
-
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    duplicate = None
+    if original is not None:
+        duplicate = {
+            'diagnosis_id': original.id,
+            'exact': exact,
+            'distance': 0 if exact else distance,
+            'status': original.status,
+            'severity': original.severity,
+            'results_url': reverse('AIModel:results', args=[original.id]),
+        }
 
-        if img is None:
-            diagnosis.status = 'failed'
-            diagnosis.error_message = 'Failed to decode image'
-            diagnosis.save()
+    if exact and original.status == 'completed' and original.model_version == version:
+        reuse_result(diagnosis, original)
 
-            return JsonResponse({
-                'success': False,
-                'diagnosis_id': diagnosis.id,
-                'message': 'Failed to decode image',
-                'status': diagnosis.status
-            }, status=500)
+        return JsonResponse({
+            'success': True,
+            'diagnosis_id': diagnosis.id,
+            'xray_type': 'peri-apical',
+            'image_url': image_url,
+            'status': diagnosis.status,
+            'has_caries': diagnosis.has_caries,
+            'severity': diagnosis.severity,
+            'confidence_score': diagnosis.confidence_score,
+            'lesion_boxes': diagnosis.lesion_boxes,
+            'duplicate_of': duplicate,
+            'reused': True,
+        })
 
-        pre = model_loader.preprocess_image(img)
-        preds = model_loader.predict(pre)
-        result = model_loader.classify_severity(preds)
+    if cv2 is None:
+        mark_failed(diagnosis, 'OpenCV (cv2) not installed - cannot process image')
 
-        severity = result.get('severity')
-        confidence = result.get('confidence') or result.get('confidence_score') or 0.0
+        return JsonResponse({
+            'success': False,
+            'diagnosis_id': diagnosis.id,
+            'message': 'Image uploaded but processing unavailable (cv2 not installed)',
+            'status': diagnosis.status
+        }, status=503)
 
-        if 'affected_percentage' in result:
-            has_caries = result['affected_percentage'] >= 1
-        else:
-            has_caries = severity is not None and severity.lower() not in ['normal', 'class_0']
+    if getattr(settings, 'AI_ASYNC_PIPELINE', False):
+        enqueue_diagnosis(diagnosis, content, file_ext)
 
-        lesion_boxes = None
-        if 'segmentation_mask' in result and result['segmentation_mask'] is not None:
-            lesion_boxes = model_loader.generate_bounding_boxes(result['segmentation_mask'])
+        return JsonResponse({
+            'success': True,
+            'diagnosis_id': diagnosis.id,
+            'xray_type': 'peri-apical',
+            'image_url': image_url,
+            'status': diagnosis.status,
+            'results_url': reverse('AIModel:results', args=[diagnosis.id]),
+            'duplicate_of': duplicate,
+        }, status=202)
 
-        diagnosis.has_caries = bool(has_caries)
-        diagnosis.severity = severity or ''
-        diagnosis.confidence_score = float(confidence) if confidence is not None else None
-        diagnosis.lesion_boxes = lesion_boxes
-        diagnosis.status = 'completed'
-        diagnosis.save()
+    try:
+        process_diagnosis(diagnosis, content)
 
         return JsonResponse({
             'success': True,
@@ -120,16 +145,38 @@ def upload_image(request):
             'severity': diagnosis.severity,
             'confidence_score': diagnosis.confidence_score,
             'lesion_boxes': diagnosis.lesion_boxes,
+            'duplicate_of': duplicate,
         })
 
+    except ImageQualityError as e:
+        mark_failed(diagnosis, str(e))
+
+        return JsonResponse({
+            'success': False,
+            'diagnosis_id': diagnosis.id,
+            'message': str(e),
+            'status': diagnosis.status,
+            'reason': 'image_quality_issue',
+            'quality': e.report.as_dict(),
+        }, status=422)
+
+    except PipelineError as e:
+        mark_failed(diagnosis, str(e))
+
+        return JsonResponse({
+            'success': False,
+            'diagnosis_id': diagnosis.id,
+            'message': str(e),
+            'status': diagnosis.status
+        }, status=500)
+
     except Exception as e:
         error_trace = traceback.format_exc()
         print('Model inference error:', e)
         print(error_trace)
 
-        diagnosis.status = 'failed'
-        diagnosis.error_message = f'{str(e)}\n\n{error_trace}'
-        diagnosis.save()
+        # show_results is public; the traceback stays in the server log.
+        mark_failed(diagnosis, str(e))
 
         return JsonResponse({
             'success': False,
@@ -137,4 +184,4 @@ def upload_image(request):
             'message': f'Processing failed: {str(e)}',
             'status': diagnosis.status,
             'image_url': image_url
-        }, status=500)
\ No newline at end of file
+        }, status=500)
@@ -1,118 +1,137 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
 import traceback
 from pathlib import Path
-import urllib.request
 import numpy as np
+import logging
 import os
-import io
-
-try:
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    HAVE_MATPLOTLIB = True
-except ImportError:
-    matplotlib = None
-    plt = None
-    HAVE_MATPLOTLIB = False
 
+from ..artifacts import artifact_store
 from ..models import DiagnosisResult
+from ..decoding import decode_full
+from ..image_writer import ImageArtifactWriter, configured_sinks, encode_image, resolve_format, resolve_level
 from ..model_loader import model_loader
-from ..xai_visualizer import XAIVisualizer
-from ..supabase import supabase
+from ..pipeline import PipelineError, decode_image, load_scan_bytes
+from ..render_service import RenderQueueFull, RenderTimeout, render_report, render_service
+from ..xai_visualizer import HAVE_MATPLOTLIB, XAIVisualizer
 
 try:
     import cv2
 except Exception:
     cv2 = None
 
+logger = logging.getLogger(__name__)
+
 
 def _load_image_and_output_dir(diagnosis: DiagnosisResult):
+    """
+    Returns ``(content, output_dir)`` with the scan's encoded bytes, or
+    ``(None, error)``. Views decode the bytes twice: a reduced-resolution
+    decode for inference (shared with the pipeline, so the inference cache
+    hits) and a full-resolution one for the overlay.
+    """
     media_root = getattr(settings, "MEDIA_ROOT", None)
 
     if cv2 is None:
         return None, 'OpenCV (cv2) is not installed in this environment.'
 
-    if diagnosis.image and getattr(diagnosis.image, "name", None):
-        try:
-            image_path     = diagnosis.image.path
-            original_image = cv2.imread(image_path)
-            if original_image is None:
-                return None, f"Could not read image at {image_path}"
-            original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-            return original_image, Path(image_path).parent
-        except Exception as e:
-            print("XAI: error reading local image, falling back to URL:", e)
+    try:
+        content = load_scan_bytes(diagnosis)
+    except PipelineError as e:
+        return None, str(e)
 
-    if diagnosis.image_url:
-        try:
-            with urllib.request.urlopen(diagnosis.image_url) as resp:
-                data = resp.read()
-            nparr          = np.frombuffer(data, np.uint8)
-            original_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if original_image is None:
-                return None, f"Could not decode image from URL {diagnosis.image_url}"
-            original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-            output_dir = Path(media_root) / "dental_images" if media_root else Path("media") / "dental_images"
-            os.makedirs(output_dir, exist_ok=True)
-            return original_image, output_dir
-        except Exception as e:
-            return None, f"Error fetching image from URL: {e}"
+    if diagnosis.image and getattr(diagnosis.image, "name", None) and Path(diagnosis.image.path).exists():
+        return content, Path(diagnosis.image.path).parent
 
-    return None, "Diagnosis has no associated image file or URL"
+    output_dir = Path(media_root) / "dental_images" if media_root else Path("media") / "dental_images"
+    os.makedirs(output_dir, exist_ok=True)
+    return content, output_dir
 
 
-def _upload_to_supabase(supa_path, png_bytes, fallback_url):
-    try:
-        supabase.storage.from_("images").upload(
-            supa_path, png_bytes,
-            {"content-type": "image/png", "upsert": "true"},
-        )
-        return supabase.storage.from_("images").get_public_url(supa_path)
-    except Exception as e:
-        print(f"XAI Supabase upload error ({supa_path}):", e)
-        try:
-            return supabase.storage.from_("images").get_public_url(supa_path)
-        except Exception:
-            return fallback_url
+def _gradcam(diagnosis_id, xai, preprocessed):
+    """Grad-CAM heatmap, reusing one precomputed for this model version when present."""
+    heatmap = artifact_store.load_gradcam(diagnosis_id, xai.model_version)
+    if heatmap is None:
+        heatmap = xai.generate_gradcam(preprocessed)
+        artifact_store.save_gradcam(diagnosis_id, heatmap, xai.model_version)
+    return heatmap
+
+
+def _decode_original(content):
+    original_image = decode_full(content)
+    if original_image is None:
+        raise ValueError("Could not decode image")
+    return original_image
+
+
+def _image_options(request):
+    """``(format, level)`` from ?format= and ?level=, defaulting to the AI_XAI_IMAGE_* settings."""
+    fmt = resolve_format(request.GET.get('format'))
+    return fmt, resolve_level(fmt, request.GET.get('level'))
+
+
+def _publish(request, diagnosis_id, basename, encoded, output_dir):
+    """
+    Write ``encoded`` to the configured sinks and return its URL. With
+    ?inline=1 the image bytes are also returned as the response body;
+    the second value is then the HttpResponse to send instead of JSON.
+    """
+    writer = ImageArtifactWriter(configured_sinks(output_dir))
+    url, _ = writer.publish(diagnosis_id, basename, encoded)
+    if request.GET.get('inline') in ('1', 'true'):
+        response = HttpResponse(encoded.data, content_type=encoded.content_type)
+        if url:
+            response['Content-Location'] = url
+        return url, response
+    return url, None
+
 
+def _adaptive_has_caries(severity_result):
+    analysis = severity_result.get('analysis')
 
-def _adaptive_has_caries(severity_result, predictions):
     # For classification models (shape 1,N), use severity directly
-    if len(predictions.shape) == 2:
+    if analysis is None:
         severity = severity_result.get('severity', 'Healthy')
         confidence = float(severity_result.get('confidence', 0))
         has_caries = severity.lower() != 'healthy'
         affected_pct = confidence if has_caries else 0.0
         return has_caries, affected_pct
 
-    mask = predictions[0, :, :, 0]
-    adaptive_threshold = max(0.5 * float(np.max(mask)), 0.05)
-    adaptive_affected = float(np.sum(mask > adaptive_threshold) / mask.size * 100)
-    return adaptive_affected > 1.0, adaptive_affected
+    return analysis.has_caries, float(analysis.affected_percentage)
 
 
 
+REPORT_QUALITIES = ('fast', 'high')
+
+
 def explain_diagnosis(request, diagnosis_id):
-    if not HAVE_MATPLOTLIB:
+    # "fast" draws the report with OpenCV; "high" renders the matplotlib figure.
+    quality = request.GET.get('quality') or getattr(settings, 'AI_XAI_REPORT_QUALITY', 'fast')
+    if quality not in REPORT_QUALITIES:
+        return JsonResponse({
+            'success': False,
+            'error': f"quality must be one of {', '.join(REPORT_QUALITIES)}"
+        }, status=400)
+    try:
+        image_format, level = _image_options(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    if quality == 'high' and not HAVE_MATPLOTLIB:
         return JsonResponse({
             'success': False,
-            'error': 'matplotlib is not installed. XAI explanation reports require matplotlib.'
+            'error': 'matplotlib is not installed. High-quality XAI reports require matplotlib.'
         }, status=503)
 
     try:
         diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
 
-        original_image, output_dir_or_error = _load_image_and_output_dir(diagnosis)
-        if original_image is None:
+        content, output_dir_or_error = _load_image_and_output_dir(diagnosis)
+        if content is None:
             return JsonResponse({"success": False, "error": output_dir_or_error}, status=500)
         output_dir = output_dir_or_error
 
         try:
-            preprocessed    = model_loader.preprocess_image(original_image)
-            predictions     = model_loader.predict(preprocessed)
-            severity_result = model_loader.classify_severity(predictions)
+            preprocessed, predictions, severity_result = model_loader.infer(decode_image(content))
         except ImportError as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=503)
         except Exception as e:
@@ -121,37 +140,38 @@ def explain_diagnosis(request, diagnosis_id):
         affected_pct = float(severity_result.get('affected_percentage', 0))
         max_prob     = float(severity_result.get('max_probability', 0))
         mean_prob    = float(severity_result.get('mean_probability', 0))
-        has_caries, adaptive_affected = _adaptive_has_caries(severity_result, predictions)
+        has_caries, adaptive_affected = _adaptive_has_caries(severity_result)
 
-        model = model_loader.load_model()
+        loaded = model_loader.current
+        model = loaded.load_model()
         if model is None:
             return JsonResponse({'success': False, 'error': 'Model could not be loaded'}, status=500)
 
+        # Grad-CAM runs here, next to the model; the render worker only draws it.
         try:
-            xai = XAIVisualizer(model)
-            fig = xai.create_explanation_report(
-                original_image=original_image,
-                preprocessed_image=preprocessed,
-                segmentation_mask=predictions,
-                severity_result=severity_result,
+            gradcam = _gradcam(diagnosis_id, XAIVisualizer(model, model_version=loaded.version), preprocessed)
+        except Exception as e:
+            logger.warning("Grad-CAM failed for diagnosis %s: %s", diagnosis_id, e)
+            gradcam = None
+
+        try:
+            encoded = render_service.run(
+                render_report, content, predictions, severity_result, gradcam,
+                quality, image_format, level,
             )
+        except RenderQueueFull as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=503)
+        except RenderTimeout as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=504)
         except ImportError as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=503)
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
-        output_filename = f'xai_explanation_{diagnosis_id}.png'
-        output_path     = output_dir / output_filename
-        xai.save_explanation(fig, output_path)
-
-        supa_path = f"xai/{diagnosis_id}/xai_explanation_{diagnosis_id}.png"
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-
-        fallback        = f"{settings.MEDIA_URL}dental_images/{output_filename}"
-        explanation_url = _upload_to_supabase(supa_path, buf.getvalue(), fallback)
+        explanation_url, response = _publish(
+            request, diagnosis_id, f'xai_explanation_{diagnosis_id}', encoded, output_dir)
+        if response is not None:
+            return response
 
         if has_caries:
             interpretation = {
@@ -180,6 +200,8 @@ def explain_diagnosis(request, diagnosis_id):
             'mean_probability':    mean_prob,
             'max_probability':     max_prob,
             'has_caries':          bool(has_caries),
+            'quality':             quality,
+            'format':              encoded.format,
             'techniques_used': [
                 'Segmentation Heatmap',
                 'Grad-CAM',
@@ -202,34 +224,33 @@ def explain_diagnosis(request, diagnosis_id):
 
 
 def quick_xai_overlay(request, diagnosis_id):
+    try:
+        image_format, level = _image_options(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
     try:
         diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
 
-        original_image, output_dir_or_error = _load_image_and_output_dir(diagnosis)
-        if original_image is None:
+        content, output_dir_or_error = _load_image_and_output_dir(diagnosis)
+        if content is None:
             return JsonResponse({"success": False, "error": output_dir_or_error}, status=500)
         output_dir = output_dir_or_error
+        original_image = _decode_original(content)
 
-        preprocessed    = model_loader.preprocess_image(original_image)
-        predictions     = model_loader.predict(preprocessed)
-        severity_result = model_loader.classify_severity(predictions)
-
-        has_caries, adaptive_affected = _adaptive_has_caries(severity_result, predictions)
-
-        xai     = XAIVisualizer(model_loader.load_model())
-        overlay, _ = xai.visualize_segmentation_overlay(original_image, predictions)
+        preprocessed, predictions, severity_result = model_loader.infer(decode_image(content))
 
-        output_filename = f'xai_quick_{diagnosis_id}.png'
-        output_path     = output_dir / output_filename
-        cv2.imwrite(str(output_path), cv2.cvtColor(overlay, cv2.COLOR_RGB2BGR))
+        has_caries, adaptive_affected = _adaptive_has_caries(severity_result)
 
-        supa_path = f"xai/{diagnosis_id}/xai_quick_{diagnosis_id}.png"
-        ok, png_arr = cv2.imencode('.png', cv2.cvtColor(overlay, cv2.COLOR_RGB2BGR))
-        if not ok:
-            raise RuntimeError('Failed to encode quick overlay PNG')
+        xai     = XAIVisualizer.for_loaded_model(model_loader.current)
+        overlay, _ = xai.visualize_segmentation_overlay(
+            original_image, predictions, analysis=severity_result.get('analysis'))
 
-        fallback    = f"{settings.MEDIA_URL}dental_images/{output_filename}"
-        overlay_url = _upload_to_supabase(supa_path, png_arr.tobytes(), fallback)
+        encoded = encode_image(overlay, image_format, level)
+        overlay_url, response = _publish(
+            request, diagnosis_id, f'xai_quick_{diagnosis_id}', encoded, output_dir)
+        if response is not None:
+            return response
 
         description = (
             f'Red areas indicate suspected caries ({adaptive_affected:.2f}% affected)'
@@ -256,35 +277,44 @@ def quick_xai_overlay(request, diagnosis_id):
 
 
 def get_gradcam(request, diagnosis_id):
+    try:
+        image_format, level = _image_options(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
     try:
         diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
 
-        original_image, output_dir_or_error = _load_image_and_output_dir(diagnosis)
-        if original_image is None:
+        content, output_dir_or_error = _load_image_and_output_dir(diagnosis)
+        if content is None:
             return JsonResponse({"success": False, "error": output_dir_or_error}, status=500)
         output_dir = output_dir_or_error
+        original_image = _decode_original(content)
 
-        preprocessed    = model_loader.preprocess_image(original_image)
-        predictions     = model_loader.predict(preprocessed)
-        severity_result = model_loader.classify_severity(predictions)
+        preprocessed, predictions, severity_result = model_loader.infer(decode_image(content))
 
-        has_caries, adaptive_affected = _adaptive_has_caries(severity_result, predictions)
+        has_caries, adaptive_affected = _adaptive_has_caries(severity_result)
 
-        xai             = XAIVisualizer(model_loader.load_model())
-        gradcam         = xai.generate_gradcam(preprocessed)
+        xai             = XAIVisualizer.for_loaded_model(model_loader.current)
+        gradcam         = _gradcam(diagnosis_id, xai, preprocessed)
         gradcam_overlay = xai.overlay_heatmap(gradcam, original_image)
 
-        output_filename = f'gradcam_{diagnosis_id}.png'
-        output_path     = output_dir / output_filename
-        cv2.imwrite(str(output_path), cv2.cvtColor(gradcam_overlay, cv2.COLOR_RGB2BGR))
-
-        supa_path = f"xai/{diagnosis_id}/gradcam_{diagnosis_id}.png"
-        ok, png_arr = cv2.imencode('.png', cv2.cvtColor(gradcam_overlay, cv2.COLOR_RGB2BGR))
-        if not ok:
-            raise RuntimeError('Failed to encode Grad-CAM PNG')
-
-        fallback    = f"{settings.MEDIA_URL}dental_images/{output_filename}"
-        gradcam_url = _upload_to_supabase(supa_path, png_arr.tobytes(), fallback)
+        # TTA mode: publish the uncertainty map to show beside the Grad-CAM.
+        uncertainty = severity_result.get('uncertainty_map')
+        if uncertainty is None:
+            uncertainty = artifact_store.load_uncertainty(diagnosis_id, severity_result['model_version'])
+        uncertainty_url = None
+        if uncertainty is not None:
+            writer = ImageArtifactWriter(configured_sinks(output_dir))
+            uncertainty_url, _ = writer.publish(
+                diagnosis_id, f'uncertainty_{diagnosis_id}',
+                encode_image(xai.uncertainty_overlay(uncertainty, original_image), image_format, level))
+
+        encoded = encode_image(gradcam_overlay, image_format, level)
+        gradcam_url, response = _publish(
+            request, diagnosis_id, f'gradcam_{diagnosis_id}', encoded, output_dir)
+        if response is not None:
+            return response
 
         description = (
             'Heatmap showing which regions influenced the caries detection (brighter = more influential)'
@@ -296,6 +326,8 @@ def get_gradcam(request, diagnosis_id):
             'success':             True,
             'diagnosis_id':        diagnosis_id,
             'gradcam_url':         gradcam_url,
+            'uncertainty_url':     uncertainty_url,
+            'mean_uncertainty':    float(uncertainty.mean()) if uncertainty is not None else None,
             'has_caries':          bool(has_caries),
             'affected_percentage': adaptive_affected,
             'description':         description,
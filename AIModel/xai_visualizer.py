@@ -1,12 +1,15 @@
+import importlib.util
 import numpy as np
 from pathlib import Path
 
-try:
-    import tensorflow as tf
-    HAVE_TENSORFLOW = True
-except ImportError:
-    tf = None
-    HAVE_TENSORFLOW = False
+from .analysis import MaskAnalysis, adaptive_threshold
+from .gradcam import find_last_conv_layer, get_gradcam_engine
+
+# TensorFlow and pyplot are only imported when a Grad-CAM or a matplotlib
+# report is requested, so web processes that hand reports to the render
+# service never load pyplot's global state.
+HAVE_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+HAVE_MATPLOTLIB = importlib.util.find_spec('matplotlib') is not None
 
 try:
     import cv2
@@ -15,24 +18,32 @@ except ImportError:
     cv2 = None
     HAVE_CV2 = False
 
-try:
+
+def _pyplot():
+    if not HAVE_MATPLOTLIB:
+        raise ImportError('matplotlib is required to create XAI explanation reports')
     import matplotlib
     matplotlib.use('Agg')
     import matplotlib.pyplot as plt
-    HAVE_MATPLOTLIB = True
-except ImportError:
-    matplotlib = None
-    plt = None
-    HAVE_MATPLOTLIB = False
+    return plt
 
 
 class XAIVisualizer:
-    def __init__(self, model):
-        if not HAVE_TENSORFLOW:
+    def __init__(self, model, model_version=None):
+        # model=None gives a render-only visualizer (render service workers):
+        # reports are drawn from precomputed Grad-CAM heatmaps.
+        if model is not None and not HAVE_TENSORFLOW:
             raise ImportError('TensorFlow is required for XAI visualization')
         if not HAVE_CV2:
             raise ImportError('OpenCV (cv2) is required for XAI visualization')
         self.model = model
+        # Grad-CAM engines are cached per model version; without one, per model object.
+        self.model_version = model_version if model_version is not None else f"model-{id(model)}"
+
+    @classmethod
+    def for_loaded_model(cls, loaded_model):
+        """Visualizer for a registry.LoadedModel, sharing that version's Grad-CAM engine."""
+        return cls(loaded_model.load_model(), model_version=loaded_model.version)
 
 
     def _is_segmentation_model(self, predictions):
@@ -40,16 +51,13 @@ class XAIVisualizer:
         return len(np.array(predictions).shape) == 4
 
     def _adaptive_threshold(self, mask):
-        """
-        Scale threshold to the model's actual output range.
+        """Adaptive threshold for ``mask``; see analysis.adaptive_threshold."""
+        return adaptive_threshold(np.max(mask))
 
-        Fixed threshold of 0.5 causes ~66.67% affected area when the model
-        outputs values in a narrow band (e.g. 0.4–0.8).  Using 50% of the
-        peak value anchors the threshold to the model's real distribution and
-        produces accurate affected-area readings.
-        """
-        max_prob = float(np.max(mask))
-        return max(0.5 * max_prob, 0.05)
+    def _analysis(self, segmentation_mask, analysis=None):
+        if analysis is not None:
+            return analysis
+        return MaskAnalysis.from_predictions(segmentation_mask)
 
     def _debug_mask(self, mask, label="mask"):
         """Print raw mask statistics – useful when affected area looks wrong."""
@@ -67,61 +75,19 @@ class XAIVisualizer:
 
 
     def generate_gradcam(self, image, layer_name=None):
+        """Grad-CAM heatmap for a (1, H, W, C) preprocessed image."""
+        return self.generate_gradcam_batch(image, layer_name)[0]
+
+    def generate_gradcam_batch(self, images, layer_name=None):
+        """Grad-CAM heatmaps for an (N, H, W, C) batch through the cached compiled engine."""
         if not HAVE_TENSORFLOW:
             raise ImportError('TensorFlow is required for Grad-CAM')
-
-        if layer_name is None:
-            layer_name = self._find_last_conv_layer()
-
-        grad_model = tf.keras.models.Model(
-            inputs=[self.model.inputs],
-            outputs=[self.model.get_layer(layer_name).output, self.model.output]
-        )
-
-        with tf.GradientTape() as tape:
-            conv_outputs, predictions = grad_model(image)
-
-            if len(predictions.shape) == 2:
-                loss = predictions[0, tf.argmax(predictions[0])]
-            else:
-                loss = tf.reduce_mean(predictions)
-
-        grads = tape.gradient(loss, conv_outputs)
-
-        if len(grads.shape) == 4:
-            pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-        elif len(grads.shape) == 3:
-            pooled_grads = tf.reduce_mean(grads, axis=(0, 1))
-        else:
-            pooled_grads = tf.reduce_mean(grads, axis=0)
-
-        conv_outputs = conv_outputs[0]
-
-        if len(conv_outputs.shape) == 3:
-            heatmap = conv_outputs @ pooled_grads[..., tf.newaxis]
-            heatmap = tf.squeeze(heatmap)
-        else:
-            heatmap = tf.reduce_mean(conv_outputs * pooled_grads, axis=-1)
-
-        heatmap = tf.maximum(heatmap, 0)
-        max_val = tf.math.reduce_max(heatmap)
-        if max_val > 0:
-            heatmap = heatmap / max_val
-
-        heatmap_np = heatmap.numpy()
-        if heatmap_np.ndim == 0:
-            heatmap_np = np.ones((8, 8), dtype=np.float32) * float(heatmap_np)
-        elif heatmap_np.ndim == 1:
-            size = max(int(np.sqrt(len(heatmap_np))), 1)
-            heatmap_np = heatmap_np[:size * size].reshape(size, size)
-
-        return heatmap_np
+        if self.model is None:
+            raise RuntimeError('Grad-CAM was not computed for this report')
+        return get_gradcam_engine(self.model, self.model_version, layer_name).compute(images)
 
     def _find_last_conv_layer(self):
-        for layer in reversed(self.model.layers):
-            if 'conv' in layer.name.lower():
-                return layer.name
-        return self.model.layers[-2].name
+        return find_last_conv_layer(self.model)
 
     def overlay_heatmap(self, heatmap, original_image, alpha=0.4, colormap=None):
         if not HAVE_CV2:
@@ -143,24 +109,34 @@ class XAIVisualizer:
         return cv2.addWeighted(original_image, 1 - alpha, heatmap_colored, alpha, 0)
 
 
-    def visualize_segmentation_overlay(self, original_image, segmentation_mask, threshold=None):
+    def uncertainty_overlay(self, variance, original_image, alpha=0.5):
+        """
+        TTA uncertainty map over the image. Colours follow the per-pixel
+        standard deviation on a fixed 0-0.5 scale (the largest possible
+        for probabilities), so maps of different scans are comparable.
+        """
+        spread = np.clip(np.sqrt(np.maximum(variance, 0)) * 2, 0, 1)
+        return self.overlay_heatmap(spread, original_image, alpha=alpha, colormap=cv2.COLORMAP_VIRIDIS)
+
+
+    def visualize_segmentation_overlay(self, original_image, segmentation_mask, threshold=None,
+                                       analysis=None):
         """
         Overlay the segmentation mask onto the original image.
 
         Uses adaptive threshold by default so that the coloured region
         accurately reflects the model's high-confidence pixels rather than
         hard-coding 0.5 (which was the root cause of the 66.67% bug).
+        Statistics come from ``analysis`` (computed once on the native
+        mask); only the colouring happens at full resolution.
         """
         if not HAVE_CV2:
             raise ImportError('OpenCV (cv2) is required for segmentation overlay')
 
-        if len(segmentation_mask.shape) == 4:
-            segmentation_mask = segmentation_mask[0, :, :, 0]
-
-        mask_resized = cv2.resize(
-            segmentation_mask.astype(np.float32),
-            (original_image.shape[1], original_image.shape[0])
-        )
+        if analysis is None:
+            if len(segmentation_mask.shape) == 4:
+                segmentation_mask = segmentation_mask[0, :, :, 0]
+            analysis = MaskAnalysis(segmentation_mask)
 
         if original_image.dtype != np.uint8:
             original_image_uint8 = (original_image * 255).astype(np.uint8)
@@ -168,43 +144,137 @@ class XAIVisualizer:
             original_image_uint8 = original_image.copy()
 
         if threshold is None:
-            threshold = self._adaptive_threshold(mask_resized)
-
-        max_prob  = float(np.max(mask_resized))
-        mean_prob = float(np.mean(mask_resized))
+            threshold = analysis.threshold
 
-        has_detection = max_prob > (threshold * 0.5) and mean_prob > 0.005
+        has_detection = analysis.max_probability > (threshold * 0.5) and analysis.mean_probability > 0.005
 
-        colored_mask = np.zeros((*mask_resized.shape, 3), dtype=np.uint8)
+        colored_mask = np.zeros((*original_image.shape[:2], 3), dtype=np.uint8)
 
         if has_detection:
+            mask_resized = cv2.resize(
+                analysis.mask,
+                (original_image.shape[1], original_image.shape[0])
+            )
             caries_regions = mask_resized > threshold
+            warning_regions = (mask_resized > threshold * 0.3) & ~caries_regions
             colored_mask[:, :, 0] = np.where(
                 caries_regions, (mask_resized * 255).astype(np.uint8), 0)
 
-            warning_regions = (mask_resized > threshold * 0.3) & (mask_resized <= threshold)
+            warning_values = (mask_resized * 200).astype(np.uint8)
             colored_mask[:, :, 0] = np.where(
-                warning_regions,
-                (mask_resized * 200).astype(np.uint8),
-                colored_mask[:, :, 0],
-            )
-            colored_mask[:, :, 1] = np.where(
-                warning_regions, (mask_resized * 200).astype(np.uint8), 0)
+                warning_regions, warning_values, colored_mask[:, :, 0])
+            colored_mask[:, :, 1] = np.where(warning_regions, warning_values, 0)
 
         overlayed = cv2.addWeighted(original_image_uint8, 0.4, colored_mask, 0.6, 0)
         return overlayed, colored_mask
 
 
-    def create_explanation_report(self, original_image, preprocessed_image,
-                                  segmentation_mask, severity_result):
-        if not HAVE_MATPLOTLIB or plt is None:
-            raise ImportError('matplotlib is required to create XAI explanation reports')
+    SEVERITY_COLORS = {
+        'Deep':     (0.94, 0.27, 0.27),
+        'Healthy':  (0.13, 0.77, 0.37),
+        'Moderate': (0.98, 0.59, 0.12),
+    }
 
-        is_segmentation = self._is_segmentation_model(segmentation_mask)
+    def severity_tint(self, original_image, severity):
+        """Original image tinted with the severity colour (classifier models)."""
+        color     = self.SEVERITY_COLORS.get(severity, (0.5, 0.5, 0.5))
+        tint      = np.full_like(original_image, [int(c * 255) for c in color], dtype=np.uint8)
+        img_uint8 = (original_image if original_image.dtype == np.uint8
+                     else (original_image * 255).astype(np.uint8))
+        return cv2.addWeighted(img_uint8, 0.8, tint, 0.2, 0)
 
+    def report_summary(self, severity_result, analysis=None):
+        """
+        Values shared by the matplotlib and OpenCV report renderers.
+
+        ``analysis`` is the MaskAnalysis for segmentation output and None
+        for classifier output.
+        """
         severity   = severity_result.get('severity', 'N/A')
         confidence = float(severity_result.get('confidence', 0))
 
+        if analysis is not None:
+            threshold       = analysis.threshold
+            affected_pixels = float(analysis.affected_percentage)
+            has_caries      = affected_pixels > 1.0 or analysis.max_probability > 0.15
+            overlay_title   = (
+                f'Caries Detected  ({affected_pixels:.1f}% affected)'
+                if has_caries
+                else 'No Caries Detected'
+            )
+        else:
+            threshold       = 0.5
+            affected_pixels = 0.0
+            has_caries      = severity.lower() not in ['healthy']
+            overlay_title   = f'Severity Classification: {severity}'
+
+        mean_prob    = float(severity_result.get('mean_probability', 0))
+        max_prob_val = float(severity_result.get('max_probability', 0))
+
+        if has_caries:
+            interpretation = (
+                "Interpretation:\n"
+                "  - Caries regions highlighted in red\n"
+                "  - Brighter pixels = higher model confidence\n"
+                "  - Orange/yellow = borderline regions\n"
+                "  - Review highlighted areas clinically"
+            )
+        else:
+            interpretation = (
+                "Interpretation:\n"
+                "  - No significant caries detected\n"
+                "  - All pixels below detection threshold\n"
+                "  - Image suggests healthy tissue\n"
+                "  - Routine monitoring recommended"
+            )
+
+        if analysis is not None:
+            stats_text = (
+                f"Severity      : {severity}\n"
+                f"Confidence    : {confidence:.2f}%\n\n"
+                f"Adaptive Thresh: {threshold:.4f}\n"
+                f"Affected Area : {affected_pixels:.2f}%\n"
+                f"Mean Prob     : {mean_prob:.4f}\n"
+                f"Max Prob      : {max_prob_val:.4f}\n\n"
+                f"{interpretation}"
+            )
+        else:
+            probs      = severity_result.get('all_probabilities', [])
+            labels = ['Deep', 'Healthy', 'Moderate']
+            prob_lines = '\n'.join(
+                f"  {labels[i]:<9}: {p:.1f}%" for i, p in enumerate(probs)
+            ) if probs else '  N/A'
+            stats_text = (
+                f"Severity      : {severity}\n"
+                f"Confidence    : {confidence:.2f}%\n\n"
+                f"Class Probabilities:\n{prob_lines}\n\n"
+                f"{interpretation}"
+            )
+
+        return {
+            'severity':        severity,
+            'confidence':      confidence,
+            'threshold':       threshold,
+            'affected_pixels': affected_pixels,
+            'has_caries':      has_caries,
+            'overlay_title':   overlay_title,
+            'stats_text':      stats_text,
+        }
+
+    def create_explanation_report(self, original_image, preprocessed_image,
+                                  segmentation_mask, severity_result, analysis=None,
+                                  gradcam=None):
+        plt = _pyplot()
+
+        is_segmentation = self._is_segmentation_model(segmentation_mask)
+        if is_segmentation:
+            analysis = self._analysis(segmentation_mask, analysis)
+
+        summary    = self.report_summary(severity_result, analysis if is_segmentation else None)
+        severity   = summary['severity']
+        confidence = summary['confidence']
+        threshold  = summary['threshold']
+
         fig, axes = plt.subplots(2, 3, figsize=(15, 10))
         fig.patch.set_facecolor('#0f172a')
         for ax in axes.flat:
@@ -223,8 +293,8 @@ class XAIVisualizer:
             spine.set(**border_kw)
 
         if is_segmentation:
-            mask_2d = segmentation_mask[0, :, :, 0]
-            im = axes[0, 1].imshow(mask_2d, cmap='hot', vmin=0, vmax=mask_2d.max() or 1)
+            im = axes[0, 1].imshow(analysis.mask, cmap='hot', vmin=0,
+                                   vmax=analysis.max_probability or 1)
             plt.colorbar(im, ax=axes[0, 1], fraction=0.046, pad=0.04)
             axes[0, 1].set_title('Probability Heatmap (raw model output)', **title_kw)
             axes[0, 1].axis('off')
@@ -244,41 +314,19 @@ class XAIVisualizer:
             spine.set(**border_kw)
 
         if is_segmentation:
-            mask_2d            = segmentation_mask[0, :, :, 0]
-            adaptive_threshold = self._adaptive_threshold(mask_2d)
-            affected_pixels    = float(np.sum(mask_2d > adaptive_threshold) / mask_2d.size * 100)
-            has_caries         = affected_pixels > 1.0 or float(np.max(mask_2d)) > 0.15
-            overlay, _         = self.visualize_segmentation_overlay(
-                original_image, segmentation_mask, threshold=adaptive_threshold)
+            overlay, _      = self.visualize_segmentation_overlay(
+                original_image, segmentation_mask, analysis=analysis)
             axes[0, 2].imshow(overlay)
-            title_text = (
-                f'Caries Detected  ({affected_pixels:.1f}% affected)'
-                if has_caries
-                else 'No Caries Detected'
-            )
-            axes[0, 2].set_title(title_text, **title_kw)
         else:
-            severity_colors = {
-                'Deep':     (0.94, 0.27, 0.27),
-                'Healthy':  (0.13, 0.77, 0.37),
-                'Moderate': (0.98, 0.59, 0.12),
-            }
-            color      = severity_colors.get(severity, (0.5, 0.5, 0.5))
-            tint       = np.full_like(original_image, [int(c * 255) for c in color], dtype=np.uint8)
-            img_uint8  = (original_image if original_image.dtype == np.uint8
-                          else (original_image * 255).astype(np.uint8))
-            tinted     = cv2.addWeighted(img_uint8, 0.8, tint, 0.2, 0)
-            has_caries = severity.lower() not in ['healthy']
-            axes[0, 2].imshow(tinted)
-            axes[0, 2].set_title(f'Severity Classification: {severity}', **title_kw)
-            affected_pixels    = 0.0
-            adaptive_threshold = 0.5
+            axes[0, 2].imshow(self.severity_tint(original_image, severity))
+        axes[0, 2].set_title(summary['overlay_title'], **title_kw)
         axes[0, 2].axis('off')
         for spine in axes[0, 2].spines.values():
             spine.set(**border_kw)
 
         try:
-            gradcam         = self.generate_gradcam(preprocessed_image)
+            if gradcam is None:
+                gradcam = self.generate_gradcam(preprocessed_image)
             gradcam_overlay = self.overlay_heatmap(gradcam, original_image)
             axes[1, 0].imshow(gradcam_overlay)
             axes[1, 0].set_title('Grad-CAM — Model Focus Areas', **title_kw)
@@ -291,11 +339,9 @@ class XAIVisualizer:
             spine.set(**border_kw)
 
         if is_segmentation:
-            mask_2d     = segmentation_mask[0, :, :, 0]
-            binary_mask = (mask_2d > adaptive_threshold).astype(np.uint8) * 255
-            axes[1, 1].imshow(binary_mask, cmap='gray')
+            axes[1, 1].imshow(analysis.binary_mask, cmap='gray')
             axes[1, 1].set_title(
-                f'Binary Mask  (adaptive threshold = {adaptive_threshold:.3f})', **title_kw)
+                f'Binary Mask  (adaptive threshold = {threshold:.3f})', **title_kw)
         else:
             theta = np.linspace(0, np.pi, 200)
             axes[1, 1].plot(np.cos(theta), np.sin(theta), '#334155', lw=10)
@@ -313,49 +359,7 @@ class XAIVisualizer:
         for spine in axes[1, 1].spines.values():
             spine.set(**border_kw)
 
-        affected_pct = float(severity_result.get('affected_percentage', affected_pixels))
-        mean_prob    = float(severity_result.get('mean_probability', 0))
-        max_prob_val = float(severity_result.get('max_probability', 0))
-
-        if has_caries:
-            interpretation = (
-                "Interpretation:\n"
-                "  - Caries regions highlighted in red\n"
-                "  - Brighter pixels = higher model confidence\n"
-                "  - Orange/yellow = borderline regions\n"
-                "  - Review highlighted areas clinically"
-            )
-        else:
-            interpretation = (
-                "Interpretation:\n"
-                "  - No significant caries detected\n"
-                "  - All pixels below detection threshold\n"
-                "  - Image suggests healthy tissue\n"
-                "  - Routine monitoring recommended"
-            )
-
-        if is_segmentation:
-            stats_text = (
-                f"Severity      : {severity}\n"
-                f"Confidence    : {confidence:.2f}%\n\n"
-                f"Adaptive Thresh: {adaptive_threshold:.4f}\n"
-                f"Affected Area : {affected_pixels:.2f}%\n"
-                f"Mean Prob     : {mean_prob:.4f}\n"
-                f"Max Prob      : {max_prob_val:.4f}\n\n"
-                f"{interpretation}"
-            )
-        else:
-            probs      = severity_result.get('all_probabilities', [])
-            labels = ['Deep', 'Healthy', 'Moderate']
-            prob_lines = '\n'.join(
-                f"  {labels[i]:<9}: {p:.1f}%" for i, p in enumerate(probs)
-            ) if probs else '  N/A'
-            stats_text = (
-                f"Severity      : {severity}\n"
-                f"Confidence    : {confidence:.2f}%\n\n"
-                f"Class Probabilities:\n{prob_lines}\n\n"
-                f"{interpretation}"
-            )
+        stats_text = summary['stats_text']
 
         axes[1, 2].text(0.05, 0.97, stats_text, fontsize=9,
                         verticalalignment='top', family='monospace',
@@ -371,8 +375,7 @@ class XAIVisualizer:
 
 
     def save_explanation(self, fig, output_path):
-        if not HAVE_MATPLOTLIB or plt is None:
-            raise ImportError('matplotlib is required to save XAI explanation reports')
+        _pyplot()
         fig.savefig(output_path, dpi=150, bbox_inches='tight', facecolor=fig.get_facecolor())
 
 
@@ -386,25 +389,26 @@ def generate_xai_explanation(diagnosis_id):
 
     from .models import DiagnosisResult
     from .model_loader import model_loader
+    from .pipeline import decode_image
+    from .render_service import render_report, render_service
+
+    diagnosis = DiagnosisResult.objects.get(id=diagnosis_id)
+    content   = Path(diagnosis.image.path).read_bytes()
 
-    diagnosis      = DiagnosisResult.objects.get(id=diagnosis_id)
-    image_path     = diagnosis.image.path
-    original_image = cv2.imread(image_path)
-    original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
+    preprocessed, predictions, severity_result = model_loader.infer(decode_image(content))
 
-    preprocessed    = model_loader.preprocess_image(original_image)
-    predictions     = model_loader.predict(preprocessed)
-    severity_result = model_loader.classify_severity(predictions)
+    xai = XAIVisualizer.for_loaded_model(model_loader.current)
+    try:
+        gradcam = xai.generate_gradcam(preprocessed)
+    except Exception as e:
+        print(f"Grad-CAM failed for diagnosis {diagnosis_id}: {e}")
+        gradcam = None
 
-    xai = XAIVisualizer(model_loader.load_model())
-    fig = xai.create_explanation_report(
-        original_image=original_image,
-        preprocessed_image=preprocessed,
-        segmentation_mask=predictions,
-        severity_result=severity_result,
-    )
+    # The matplotlib figure is drawn and closed inside a render worker.
+    encoded = render_service.run(
+        render_report, content, predictions, severity_result, gradcam, 'high', 'png', None)
 
     output_dir  = Path(diagnosis.image.path).parent
     output_path = output_dir / f'xai_explanation_{diagnosis_id}.png'
-    xai.save_explanation(fig, output_path)
+    output_path.write_bytes(encoded.data)
     return str(output_path)
\ No newline at end of file
@@ -143,3 +143,119 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SUPABASE_URL = config('SUPABASE_URL', default='')
 SUPABASE_KEY = config('SUPABASE_KEY', default='')
 AWS_MODEL_URL = config('AWS_MODEL_URL', default='')
+
+AI_MODEL_VERSION = config('AI_MODEL_VERSION', default='')
+AI_INFERENCE_CACHE_SIZE = config('AI_INFERENCE_CACHE_SIZE', default=64, cast=int)
+AI_INFERENCE_CACHE_DISK = config('AI_INFERENCE_CACHE_DISK', default=True, cast=bool)
+AI_INFERENCE_CACHE_DIR = config('AI_INFERENCE_CACHE_DIR', default=os.path.join(MEDIA_ROOT, 'inference_cache'))
+
+AI_BATCHING_ENABLED = config('AI_BATCHING_ENABLED', default=False, cast=bool)
+AI_BATCH_MAX_SIZE = config('AI_BATCH_MAX_SIZE', default=8, cast=int)
+AI_BATCH_MAX_WAIT_MS = config('AI_BATCH_MAX_WAIT_MS', default=5, cast=float)
+AI_BATCH_QUEUE_SIZE = config('AI_BATCH_QUEUE_SIZE', default=64, cast=int)
+
+# 'function' serves through a traced tf.function; 'predict' uses keras Model.predict
+AI_SERVING_MODE = config('AI_SERVING_MODE', default='function')
+
+# 'keras', 'tflite' (see `manage.py convert_tflite`) or 'onnx' (see `manage.py export_onnx`)
+AI_INFERENCE_BACKEND = config('AI_INFERENCE_BACKEND', default='keras')
+AI_TFLITE_MODEL_PATH = config('AI_TFLITE_MODEL_PATH', default='')
+AI_TFLITE_NUM_THREADS = config('AI_TFLITE_NUM_THREADS', default=None, cast=lambda v: int(v) if v else None)
+AI_ONNX_MODEL_PATH = config('AI_ONNX_MODEL_PATH', default='')
+# Per gunicorn worker; 0 lets ONNX Runtime decide
+AI_ONNX_INTRA_OP_THREADS = config('AI_ONNX_INTRA_OP_THREADS', default=0, cast=int)
+AI_ONNX_INTER_OP_THREADS = config('AI_ONNX_INTER_OP_THREADS', default=0, cast=int)
+
+# Asynchronous diagnosis pipeline: upload returns 202 and background workers process the scan
+AI_ASYNC_PIPELINE = config('AI_ASYNC_PIPELINE', default=False, cast=bool)
+AI_JOB_WORKERS = config('AI_JOB_WORKERS', default=2, cast=int)
+AI_JOB_TIMEOUT_SECONDS = config('AI_JOB_TIMEOUT_SECONDS', default=600, cast=int)
+AI_JOB_MAX_ATTEMPTS = config('AI_JOB_MAX_ATTEMPTS', default=3, cast=int)
+AI_JOB_SPOOL_DIR = config('AI_JOB_SPOOL_DIR', default=os.path.join(MEDIA_ROOT, 'diagnosis_jobs'))
+
+# Persisted per-diagnosis preprocessed tensor / prediction mask for the staged endpoints
+AI_ARTIFACTS_ENABLED = config('AI_ARTIFACTS_ENABLED', default=True, cast=bool)
+AI_ARTIFACTS_DIR = config('AI_ARTIFACTS_DIR', default=os.path.join(MEDIA_ROOT, 'artifacts'))
+
+# Warm-up run on startup when PRELOAD_AI_MODEL is set; /health/ready/ returns 503 until it finishes
+AI_WARMUP_PASSES = config('AI_WARMUP_PASSES', default=3, cast=int)
+AI_WARMUP_GRADCAM = config('AI_WARMUP_GRADCAM', default=False, cast=bool)
+AWS_MODEL_SHA256 = config('AWS_MODEL_SHA256', default='')
+
+# Model registry: workers poll the active ModelVersion and hot-swap to it after warming it up
+AI_MODEL_REGISTRY_ENABLED = config('AI_MODEL_REGISTRY_ENABLED', default=False, cast=bool)
+AI_MODEL_REGISTRY_POLL_SECONDS = config('AI_MODEL_REGISTRY_POLL_SECONDS', default=30, cast=float)
+
+# Decode JPEG uploads at 1/2, 1/4 or 1/8 scale when that still covers the model input
+AI_FAST_DECODE = config('AI_FAST_DECODE', default=True, cast=bool)
+AI_DECODE_GRAYSCALE = config('AI_DECODE_GRAYSCALE', default=False, cast=bool)
+
+# Disk cache for remote scan images fetched by the XAI views (LRU, revalidated with ETag/Last-Modified)
+AI_IMAGE_CACHE_ENABLED = config('AI_IMAGE_CACHE_ENABLED', default=True, cast=bool)
+AI_IMAGE_CACHE_DIR = config('AI_IMAGE_CACHE_DIR', default=os.path.join(MEDIA_ROOT, 'image_cache'))
+AI_IMAGE_CACHE_MAX_MB = config('AI_IMAGE_CACHE_MAX_MB', default=500, cast=float)
+AI_IMAGE_CACHE_REVALIDATE_SECONDS = config('AI_IMAGE_CACHE_REVALIDATE_SECONDS', default=3600, cast=float)
+
+# Object storage for uploads and XAI images: 'supabase' (pooled keep-alive session) or 'filesystem'
+AI_STORAGE_BACKEND = config('AI_STORAGE_BACKEND', default='supabase')
+AI_STORAGE_BUCKET = config('AI_STORAGE_BUCKET', default='images')
+AI_STORAGE_TIMEOUT = config('AI_STORAGE_TIMEOUT', default=30, cast=float)
+AI_STORAGE_RETRIES = config('AI_STORAGE_RETRIES', default=3, cast=int)
+AI_STORAGE_POOL_SIZE = config('AI_STORAGE_POOL_SIZE', default=10, cast=int)
+AI_STORAGE_ROOT = config('AI_STORAGE_ROOT', default=os.path.join(MEDIA_ROOT, 'storage'))
+
+# XAI explanation reports: "fast" (OpenCV) or "high" (matplotlib); ?quality= overrides per request
+AI_XAI_REPORT_QUALITY = config('AI_XAI_REPORT_QUALITY', default='fast')
+
+# XAI images are encoded once (png, webp or jpeg) and written to each sink in AI_XAI_IMAGE_SINKS
+AI_XAI_IMAGE_FORMAT = config('AI_XAI_IMAGE_FORMAT', default='png')
+# PNG compression 0-9 or WebP/JPEG quality 1-100; empty uses the format's default
+AI_XAI_IMAGE_LEVEL = config('AI_XAI_IMAGE_LEVEL', default=None, cast=lambda v: int(v) if v else None)
+AI_XAI_IMAGE_SINKS = config('AI_XAI_IMAGE_SINKS', default='local,storage')
+
+# Process pool that renders XAI reports (0 workers renders in the request thread)
+AI_XAI_RENDER_WORKERS = config('AI_XAI_RENDER_WORKERS', default=2, cast=int)
+AI_XAI_RENDER_QUEUE_SIZE = config('AI_XAI_RENDER_QUEUE_SIZE', default=8, cast=int)
+AI_XAI_RENDER_TIMEOUT = config('AI_XAI_RENDER_TIMEOUT', default=60, cast=float)
+# Render workers are replaced after this many renders or once their RSS passes the limit
+AI_XAI_RENDER_MAX_RENDERS = config('AI_XAI_RENDER_MAX_RENDERS', default=50, cast=int)
+AI_XAI_RENDER_MAX_RSS_MB = config('AI_XAI_RENDER_MAX_RSS_MB', default=1024, cast=int)
+
+# Tiled inference: segment full-resolution scans as overlapping input-size tiles (opt-in).
+# Masks are then full resolution, so consider a smaller AI_INFERENCE_CACHE_SIZE.
+AI_TILED_INFERENCE = config('AI_TILED_INFERENCE', default=False, cast=bool)
+AI_TILE_OVERLAP = config('AI_TILE_OVERLAP', default=0.25, cast=float)
+AI_TILE_BATCH_SIZE = config('AI_TILE_BATCH_SIZE', default=8, cast=int)
+
+# Test-time augmentation: average whole-image predictions over flipped/shifted variants (one batch)
+AI_TTA_ENABLED = config('AI_TTA_ENABLED', default=False, cast=bool)
+AI_TTA_SHIFT = config('AI_TTA_SHIFT', default=8, cast=int)
+
+# Inference cascade: a small first-stage model ends inference early for confidently healthy scans
+AI_CASCADE_ENABLED = config('AI_CASCADE_ENABLED', default=False, cast=bool)
+AI_CASCADE_MODEL_PATH = config('AI_CASCADE_MODEL_PATH', default='')
+AI_CASCADE_HEALTHY_CONFIDENCE = config('AI_CASCADE_HEALTHY_CONFIDENCE', default=95.0, cast=float)
+AI_CASCADE_MAX_PROBABILITY = config('AI_CASCADE_MAX_PROBABILITY', default=0.3, cast=float)
+# Fraction of early exits also run through the full model in the background to measure disagreement
+AI_CASCADE_SHADOW_RATE = config('AI_CASCADE_SHADOW_RATE', default=0.05, cast=float)
+
+# Pre-inference quality gate: off, report (record metrics only) or enforce (fail scans without running the model)
+AI_QUALITY_GATE = config('AI_QUALITY_GATE', default='report')
+# Metrics are computed on a copy downsampled to this longest side
+AI_QUALITY_MAX_SIDE = config('AI_QUALITY_MAX_SIDE', default=512, cast=int)
+# Grey levels at or below / at or above which a pixel counts as clipped
+AI_QUALITY_DARK_LEVEL = config('AI_QUALITY_DARK_LEVEL', default=2, cast=int)
+AI_QUALITY_BRIGHT_LEVEL = config('AI_QUALITY_BRIGHT_LEVEL', default=253, cast=int)
+# Check thresholds (uncalibrated; an empty value disables the check)
+AI_QUALITY_MIN_SHARPNESS = config('AI_QUALITY_MIN_SHARPNESS', default='15', cast=lambda v: float(v) if v else None)
+AI_QUALITY_MIN_CONTRAST = config('AI_QUALITY_MIN_CONTRAST', default='8', cast=lambda v: float(v) if v else None)
+AI_QUALITY_MAX_DARK_FRACTION = config('AI_QUALITY_MAX_DARK_FRACTION', default='0.85', cast=lambda v: float(v) if v else None)
+AI_QUALITY_MAX_BRIGHT_FRACTION = config('AI_QUALITY_MAX_BRIGHT_FRACTION', default='0.3', cast=lambda v: float(v) if v else None)
+AI_QUALITY_MAX_COLORFULNESS = config('AI_QUALITY_MAX_COLORFULNESS', default='12', cast=lambda v: float(v) if v else None)
+
+# Re-upload detection: exact duplicates reuse the stored object and prediction, near duplicates are linked
+AI_DEDUP_ENABLED = config('AI_DEDUP_ENABLED', default=True, cast=bool)
+# Largest perceptual-hash bit distance (of 64) treated as the same radiograph
+AI_DEDUP_MAX_DISTANCE = config('AI_DEDUP_MAX_DISTANCE', default=8, cast=int)
+# Most earlier scans of the patient compared against a new upload
+AI_DEDUP_CANDIDATES = config('AI_DEDUP_CANDIDATES', default=500, cast=int)
@@ -19,7 +19,7 @@ from django.conf import settings
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf.urls.static import static
-from .views import health_check, keepalive
+from .views import health_check, keepalive, readiness
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,6 +29,7 @@ urlpatterns = [
     path("api/accounts/", include("accounts.urls")),
     path('api/feedback/', include('dentist_feedback.urls')),
     path('health/', health_check),
+    path('health/ready/', readiness),
     path('keepalive/', keepalive),
 ]
 if settings.DEBUG:
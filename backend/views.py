@@ -8,7 +8,20 @@ from utils import supabase
 @require_http_methods(["GET", "HEAD", "OPTIONS"])
 def health_check(request):
     """Simple health check for uptime monitors (returns 200)."""
-    return JsonResponse({"status": "ok"}, status=200)
+    from AIModel.model_loader import model_loader
+    return JsonResponse({"status": "ok", "ready": model_loader.is_ready}, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD", "OPTIONS"])
+def readiness(request):
+    """Readiness probe for load balancers: 503 until the preloaded model is warm."""
+    from AIModel.model_loader import model_loader
+    ready = model_loader.is_ready
+    return JsonResponse(
+        {"status": "ready" if ready else "not_ready", "model": model_loader.warmup_state},
+        status=200 if ready else 503,
+    )
 
 
 @csrf_exempt